@@ -1,12 +1,15 @@
 import base64
 from datetime import datetime
+import cognisim.utils.constants as config
 from cognisim.device.device import Device
 from appium import webdriver
 from appium.options.android import UiAutomator2Options
 from cognisim.device.android.android_view_hierarchy import ViewHierarchy
-import cv2
+from cognisim.device.budget import usefulness
+from cognisim.device.capture import CaptureTiming, DeviceState
+from cognisim.device.encoders import get_encoder
+from cognisim.device.view_hierarchy import BaseUI
 from loguru import logger
-import numpy as np
 import os
 # Android Emulator Config
 SCREEN_WIDTH = 1080
@@ -25,18 +28,15 @@ XML_SCREEN_HEIGHT = 2960
 # Get state implementation
 
 
-def sortchildrenby_viewhierarchy(view, attr="bounds"):
-    if attr == 'bounds':
-        bounds = [(ele.uiobject.bounding_box.x1, ele.uiobject.bounding_box.y1,
-                   ele.uiobject.bounding_box.x2, ele.uiobject.bounding_box.y2)
-                  for ele in view]
-        sorted_bound_index = [
-            bounds.index(i) for i in sorted(
-                bounds, key=lambda x: (
-                    x[1], x[0]))]
-
-        sort_children = [view[i] for i in sorted_bound_index]
-        view[:] = sort_children
+def element_usefulness(uiobject):
+    # Ranking score of a UIObject for budgeted encodings.
+    box = uiobject.bounding_box
+    return usefulness(
+        clickable=uiobject.clickable,
+        editable=uiobject.obj_type.name in ('EDITTEXT', 'SEARCHVIEW'),
+        has_text=bool(uiobject.text or uiobject.content_desc),
+        area_fraction=(box.x2 - box.x1) * (box.y2 - box.y1) / (
+            XML_SCREEN_WIDTH * XML_SCREEN_HEIGHT))
 
 
 CLASS_MAPPING = {
@@ -58,39 +58,28 @@ CLASS_MAPPING = {
 }
 
 
-class UI():
-    def __init__(self, xml_file):
-        self.xml_file = xml_file
-        self.elements = {}
-
-    def encoding(self):
-        logger.info('reading hierarchy tree from {} ...'.format(
-            self.xml_file.split('/')[-1]))
-        with open(self.xml_file, 'r', encoding='utf-8') as f:
-            vh_data = f.read().encode()
-
-        vh = ViewHierarchy(
-            screen_width=XML_SCREEN_WIDTH,
-            screen_height=XML_SCREEN_HEIGHT)
-        vh.load_xml(vh_data)
-        view_hierarchy_leaf_nodes = vh.get_leaf_nodes()
-        sortchildrenby_viewhierarchy(view_hierarchy_leaf_nodes, 'bounds')
-
-        logger.debug('encoding the ui elements in hierarchy tree...')
-        codes = ''
-        # logger.info(view_hierarchy_leaf_nodes)
-        for _id, ele in enumerate(view_hierarchy_leaf_nodes):
-            obj_type = ele.uiobject.obj_type.name
-            text = ele.uiobject.text
-            text = text.replace('\n', ' ')
-            resource_id = ele.uiobject.resource_id if ele.uiobject.resource_id is not None else ''
-            content_desc = ele.uiobject.content_desc
-            html_code = self.element_encoding(
-                _id, obj_type, text, content_desc, resource_id)
-            codes += html_code
-            self.elements[_id] = ele.uiobject
-        codes = "<html>\n" + codes + "</html>"
-        return codes
+def element_class(resource_id):
+    # The class of an element is its resource id without the package.
+    return resource_id.split('id/')[-1].strip()
+
+
+class UI(BaseUI):
+    view_hierarchy_class = ViewHierarchy
+    screen_width = XML_SCREEN_WIDTH
+    screen_height = XML_SCREEN_HEIGHT
+    class_mapping = CLASS_MAPPING
+    element_class = staticmethod(element_class)
+
+    def element_fields(self, uiobject):
+        resource_id = uiobject.resource_id if uiobject.resource_id is not None else ''
+        return (uiobject.obj_type.name, uiobject.text.replace('\n', ' '),
+                uiobject.content_desc, resource_id)
+
+    def identity_fields(self, uiobject):
+        return uiobject.resource_id, uiobject.android_class
+
+    def element_usefulness(self, uiobject):
+        return element_usefulness(uiobject)
 
     def element_encoding(
             self,
@@ -100,10 +89,10 @@ class UI():
             _content_desc,
             _resource_id):
 
-        _class = _resource_id.split('id/')[-1].strip()
+        _class = element_class(_resource_id)
         _text = _text.strip()
-        assert _obj_type in CLASS_MAPPING.keys(), print(_obj_type)
-        tag = CLASS_MAPPING[_obj_type]
+        tag = CLASS_MAPPING.get(_obj_type)
+        assert tag is not None, _obj_type
 
         if _obj_type in ['CHECKBOX', 'CHECKEDTEXTVIEW', 'SWITCH']:
             code = f'  <input id={_id} type="checkbox" name="{_class}">\n'
@@ -129,9 +118,36 @@ class UI():
         return code
 
 
+def _save_recording(video_base64, save_path=None):
+    if save_path is None:
+        # Create a unique filename using timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"screen_recording_{timestamp}.mp4"
+
+        # Define the default save path
+        save_dir = os.path.join(os.getcwd(), "recordings")
+        os.makedirs(save_dir, exist_ok=True)
+        save_path = os.path.join(save_dir, filename)
+
+    # Decode and save the video
+    with open(save_path, "wb") as video_file:
+        video_file.write(base64.b64decode(video_base64))
+    return save_path
+
+
 class AndroidDevice(Device):
-    def __init__(self, app_package, download_directory='default', session_id=None):
-        super().__init__(app_package)
+    status_bar_fraction = SCREEN_TOP_HEAD / SCREEN_HEIGHT
+    # The window size leaves out the navigation bar, while taps, bounds and
+    # screenshots are all in display pixels
+    taps_in_screenshot_pixels = True
+
+    def __init__(self, app_package, download_directory='default', session_id=None,
+                 state_representation='html', **device_options):
+        super().__init__(app_package, **device_options)
+        self.ui = None
+        # Encoder of get_state, see cognisim.device.encoders.
+        get_encoder(state_representation)
+        self.state_representation = state_representation
         self.download_directory = download_directory
         self.session_id = session_id
         self.desired_caps = {
@@ -144,22 +160,65 @@ class AndroidDevice(Device):
         }
         self.options = UiAutomator2Options().load_capabilities(self.desired_caps)
 
-    async def get_state(self):
-        raw_appium_state = self.driver.page_source
-
-        file_path = os.path.join(os.path.dirname(__file__), 'android_view_hierarchy.xml')
-        xml_file = open(file_path, 'w')
-        xml_file.write(raw_appium_state)
-        xml_file.close()
-
-        ui = UI(file_path)
+    async def get_state(self, delta=False, image_size=None, image_scale=None, skip_unchanged=False):
+        '''
+        delta: Encode only the changes since the previous get_state, the
+        full state is returned on the first call
+        image_size: (width, height) to downscale the screenshot to, keeping its
+        aspect ratio
+        image_scale: Factor to downscale the screenshot by, e.g. 0.5
+        skip_unchanged: Compare the screenshot with the one of the previous
+        skip_unchanged get_state first, and reuse its hierarchy instead of
+        fetching page_source when the screen did not change
+        Returns a capture.DeviceState of the encoded UI, the screenshot, the
+        UI, the ScreenTransform of a downscaled screenshot and the
+        CaptureTiming of the hierarchy and the screenshot, which are fetched
+        concurrently. The screenshot is a jpeg frame of the MJPEG stream when
+        the session has one, a png otherwise
+        '''
+        screenshot_capture = self.capture_pool.run(self._grab_screenshot)
+        try:
+            unchanged = None
+            if skip_unchanged:
+                unchanged = await self._unchanged_screen_state(screenshot_capture)
+            previous = self.ui
+            if unchanged is not None:
+                encoded_ui, ui, hierarchy_started, hierarchy_finished = unchanged
+            else:
+                # Unless the screenshot was compared first, both fetches run
+                # concurrently and the hierarchy is encoded while the screenshot
+                # downloads
+                hierarchy = self.capture_pool.run_timed(lambda: self.driver.page_source)
+                raw_appium_state, hierarchy_started, hierarchy_finished = await self.with_timeout(hierarchy)
+
+                # Unchanged screens (no-op taps, polling) are served from the cache.
+                encoded_ui, ui = await self.capture_pool.run(
+                    self.state_cache.get_or_build, raw_appium_state, self._encode_state)
+                self._remember_screen_state(
+                    skip_unchanged, encoded_ui, ui, hierarchy_started, hierarchy_finished)
+            self.ui = ui
+            if delta and previous is not None:
+                encoded_ui = await self.capture_pool.run(ui.delta_encoding, previous)
+            logger.info(f"Encoded UI: {encoded_ui}")
+            screenshot, screenshot_started, screenshot_finished = await self.with_timeout(screenshot_capture)
+        finally:
+            # Not awaited when the hierarchy fetch failed or timed out
+            self._discard_capture(screenshot_capture)
+        self.last_capture = CaptureTiming(
+            hierarchy_started, hierarchy_finished, screenshot_started, screenshot_finished)
+
+        transform = None
+        if image_size is not None or image_scale is not None:
+            screenshot, transform = await self.capture_pool.run(
+                self.scale_screenshot, screenshot, image_size, image_scale)
+        return DeviceState(encoded_ui, screenshot, ui, transform, self.last_capture)
+
+    def _encode_state(self, raw_appium_state):
+        # Leaves unchanged since the previous state reuse its UI objects.
+        ui = UI(raw_appium_state, previous=self.ui,
+                state_representation=self.state_representation)
         encoded_ui: str = ui.encoding()
-        logger.info(f"Encoded UI: {encoded_ui}")
-        # Take screenshot and encode as base64
-        screenshot: bytes = self.driver.get_screenshot_as_png()
-
-        # Return encoded UI and screenshot
-        return encoded_ui, screenshot, ui
+        return encoded_ui, ui
 
     async def navigate(self, package_name):
         """
@@ -168,21 +227,30 @@ class AndroidDevice(Device):
         :param package_name: The package name of the app to open
         """
         try:
-            self.driver.activate_app(package_name)
+            await self.call_driver(self.driver.activate_app, package_name)
             logger.info(f"Successfully opened package: {package_name}")
         except Exception as e:
             logger.error(f"Failed to open package {package_name}. Error: {str(e)}")
             raise
 
-    async def tap(self, x, y):
-        self.driver.tap([(x, y)], 1)
+    async def tap(self, x, y, transform=None):
+        '''
+        transform: ScreenTransform of a downscaled screenshot, x and y are then
+        coordinates on that screenshot
+        '''
+        if transform is not None:
+            x, y = transform.to_device(x, y)
+        await self.call_driver(self.driver.tap, [(x, y)], 1)
 
-    async def input(self, x, y, text):
-        await self.tap(x, y)
-        self.driver.execute_script('mobile: type', {'text': text})
+    async def input(self, x, y, text, transform=None):
+        await self.tap(x, y, transform)
+        await self.call_driver(self.driver.execute_script, 'mobile: type', {'text': text})
 
-    async def drag(self, startX, startY, endX, endY):
-        self.driver.swipe(startX, startY, endX, endY, duration=1000)
+    async def drag(self, startX, startY, endX, endY, transform=None):
+        if transform is not None:
+            startX, startY = transform.to_device(startX, startY)
+            endX, endY = transform.to_device(endX, endY)
+        await self.call_driver(lambda: self.driver.swipe(startX, startY, endX, endY, duration=1000))
 
     async def scroll(self, direction):
         direction_map = {
@@ -191,14 +259,15 @@ class AndroidDevice(Device):
             'left': 'LEFT',
             'right': 'RIGHT'
         }
-        self.driver.execute_script('mobile: scroll', {'direction': direction_map[direction]})
+        await self.call_driver(self.driver.execute_script, 'mobile: scroll', {'direction': direction_map[direction]})
 
     async def swipe(self, direction):
-        left = self.window_size["width"] * 0.2
-        top = self.window_size["height"] * 0.2
-        width = self.window_size["width"] * 0.6
-        height = self.window_size["height"] * 0.6
-        self.driver.execute_script("mobile: swipeGesture", {
+        screen_width, screen_height = await self.call_driver(self.device_size)
+        left = screen_width * 0.2
+        top = screen_height * 0.2
+        width = screen_width * 0.6
+        height = screen_height * 0.6
+        await self.call_driver(self.driver.execute_script, "mobile: swipeGesture", {
             "left": left,
             "top": top,
             "width": width,
@@ -215,7 +284,7 @@ class AndroidDevice(Device):
             None
         """
         try:
-            self.driver.start_recording_screen()
+            await self.call_driver(self.driver.start_recording_screen)
             logger.info("Screen recording started successfully")
         except Exception as e:
             logger.error(f"Failed to start screen recording. Error: {str(e)}")
@@ -231,22 +300,8 @@ class AndroidDevice(Device):
         Returns:
             str: Path to the saved video file
         """
-        video_base64 = self.driver.stop_recording_screen()
-
-        if save_path is None:
-            # Create a unique filename using timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"screen_recording_{timestamp}.mp4"
-
-            # Define the default save path
-            save_dir = os.path.join(os.getcwd(), "recordings")
-            os.makedirs(save_dir, exist_ok=True)
-            save_path = os.path.join(save_dir, filename)
-
-        # Decode and save the video
-        with open(save_path, "wb") as video_file:
-            video_file.write(base64.b64decode(video_base64))
-
+        video_base64 = await self.call_driver(self.driver.stop_recording_screen)
+        save_path = await self.capture_pool.run(_save_recording, video_base64, save_path)
         logger.info(f"Screen recording saved to: {save_path}")
         return save_path
 
@@ -254,130 +309,17 @@ class AndroidDevice(Device):
         '''
         Stops a test
         '''
-        pass
-
-    async def capture_screenshot_with_bounding_box(self, bounds: dict, image_state: bytes = None) -> bytes:
-        """
-        Capture a screenshot with a bounding box drawn around a specified element.
-
-        Args:
-            bounds (dict): A dictionary containing the bounding box coordinates.
-                           Expected keys are x1, y1, x2, y2, all of which are integers.
-            image_state (bytes, optional): The current screenshot if available.
-
-        Returns:
-            bytes: The screenshot image with bounding box as bytes.
-        """
-        logger.info("Creating tagged image")
-        screenshot = image_state if image_state is not None else await self.device.screenshot()
-        if screenshot is None:
-            logger.info("Screenshot failed")
-            return None
-
-        # Convert the screenshot to a NumPy array
-        image_np = np.frombuffer(screenshot, dtype=np.uint8)
-        image = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
-
-        # Extract bounding box coordinates
-        x1 = int(bounds[0])
-        y1 = int(bounds[1])
-        x2 = int(bounds[2])
-        y2 = int(bounds[3])
-
-        # Calculate width and height
-        #  width = x2 - x1
-        # height = y2 - y1
-
-        bright_color = (128, 0, 128)  # Pink color
-        # Draw the bounding box on the image
-        cv2.rectangle(image, (x1, y1), (x2, y2), bright_color, 5)
-
-        # Convert the image back to bytes
-        _, encoded_image = cv2.imencode('.png', image)
-        screenshot_with_bounding_box = encoded_image.tobytes()
-
-        return screenshot_with_bounding_box
-
-    def generate_set_of_mark(self,
-                             ui,
-                             image: bytes,
-                             position='top-left') -> bytes:
-        '''
-        Code to generate a set of mark for a given image and UI state
-        ui: UI object
-        image: bytes of the image
-        step_id: step ids
-        position: position of the annotation, defaults to 'top-lefts', can also be 'center'
-        '''
-        # Convert image bytes to numpy array
-        nparr = np.frombuffer(image, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        height, width, _ = img.shape
-
-        # Define the minimum area
-        k = 3000
-
-        for element_id in ui.elements:
-            bounds = [
-                ui.elements[element_id].bounding_box.x1,
-                ui.elements[element_id].bounding_box.y1,
-                ui.elements[element_id].bounding_box.x2,
-                ui.elements[element_id].bounding_box.y2
-            ]
-
-            # Calculate the area of the bounding box
-            area = (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
-
-            # Only label elements with an area over k
-            if area > k:
-                # Draw a rectangle around the element
-                cv2.rectangle(
-                    img, (int(bounds[0]), int(bounds[1])),
-                    (int(bounds[2]), int(bounds[3])), (0, 0, 255), 5)
-
-                text = str(element_id)
-                text_size = 2  # Fixed text size
-                font = cv2.FONT_HERSHEY_SIMPLEX
-
-                # Calculate the width and height of the text
-                text_width, text_height = cv2.getTextSize(
-                    text, font, text_size, 2)[0]
-
-                # Calculate the position of the text
-                if position == 'top-left':
-                    text_x = int(bounds[0])
-                    text_y = int(bounds[1]) + text_height
-                else:  # Default to center
-                    text_x = (int(bounds[0]) + int(bounds[2])) // 2 - text_width // 2
-                    text_y = (int(bounds[1]) + int(bounds[3])) // 2 + text_height // 2
-
-                # Draw a black rectangle behind the text
-                cv2.rectangle(img, (text_x, text_y - text_height),
-                              (text_x + text_width, text_y), (0, 0, 0), thickness=cv2.FILLED)
-
-                # Draw the text in white
-                cv2.putText(img, text, (text_x, text_y), font,
-                            text_size, (255, 255, 255), 4)
-
-        # Convert the image to bytes
-        _, img_encoded = cv2.imencode('.png', img)
-        img_bytes = img_encoded.tobytes()
-
-        return img_bytes
+        await self.capture_pool.run(self.stop_frame_grabber)
 
     async def start_device(self):
         '''
         Start the Android device and connect to the appium server
         '''
-        try:
-            self.driver = webdriver.Remote('http://localhost:4723', options=self.options)
-        except BaseException:
-            self.desired_caps.pop('mjpegScreenshotUrl')
-            self.options = UiAutomator2Options().load_capabilities(self.desired_caps)
-            self.driver = webdriver.Remote('http://localhost:4723', options=self.options)
-
-        # self.driver.start_recording_screen()
-        self.driver.update_settings({'waitForIdleTimeout': 0, 'shouldWaitForQuiescence': False, 'maxTypingFrequency': 60})
+        self.driver = await self.call_driver(self._connect, timeout=config.SESSION_START_TIMEOUT)
+        self.window_size = await self.call_driver(self.driver.get_window_size)
+        # The connect fallback drops the stream when the session rejects it
+        if 'mjpegScreenshotUrl' in self.desired_caps:
+            self.start_frame_grabber(self.desired_caps['mjpegScreenshotUrl'])
         # self.driver.get_screenshot_as_base64()
 #         self.driver.execute_script('mobile: startScreenStreaming', {
 #             'width': 1080,
@@ -387,8 +329,20 @@ class AndroidDevice(Device):
 #             'bitRate': 500000,
 # })
 
+    def _connect(self):
+        try:
+            driver = webdriver.Remote('http://localhost:4723', options=self.options)
+        except BaseException:
+            self.desired_caps.pop('mjpegScreenshotUrl')
+            self.options = UiAutomator2Options().load_capabilities(self.desired_caps)
+            driver = webdriver.Remote('http://localhost:4723', options=self.options)
+
+        # driver.start_recording_screen()
+        driver.update_settings({'waitForIdleTimeout': 0, 'shouldWaitForQuiescence': False, 'maxTypingFrequency': 60})
+        return driver
+
 
 if __name__ == "__main__":
-    ui = UI(os.path.join(os.path.dirname(__file__), 'android_view_hierarchy.xml'))
+    ui = UI.from_file(os.path.join(os.path.dirname(__file__), 'android_view_hierarchy.xml'))
     encoded_ui = ui.encoding()
     logger.info(f"Encoded UI: {encoded_ui}")
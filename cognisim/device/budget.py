@@ -0,0 +1,55 @@
+"""Size-budgeted selection of the elements emitted by a UI encoder.
+
+Dense screens encode to more text than an LLM prompt should carry. Elements
+are ranked by how useful they are to an agent, and the most useful ones are
+kept until the budget runs out. Kept elements are still emitted in reading
+order under their original ids, so the ids match `UI.elements` and the
+set-of-mark annotation.
+"""
+
+
+def usefulness(clickable, editable, has_text, area_fraction):
+    """Returns the ranking score of an element, higher is more useful.
+
+    Editable beats clickable beats text, whatever the size; the element's
+    share of the screen area only orders elements of the same kind.
+
+    Args:
+      clickable: Whether the element can be tapped.
+      editable: Whether the element takes text input.
+      has_text: Whether the element carries visible text or a description.
+      area_fraction: Area of the element divided by the screen area.
+    """
+    return (4 * bool(editable) + 2 * bool(clickable) + bool(has_text) +
+            min(max(area_fraction, 0.0), 1.0) * 0.5)
+
+
+def select_within_budget(fragments, scores, budget, count=len, overhead=0):
+    """Picks the fragments to emit within a size budget.
+
+    Fragments are taken greedily in decreasing score, ties broken by lowest
+    position, and selection stops at the first one that does not fit, so a
+    long low-value fragment never crowds out a more useful one.
+
+    Args:
+      fragments: Encoded element strings, indexed by element id.
+      scores: Score of each fragment, see `usefulness`.
+      budget: Maximum total size, None keeps every fragment.
+      count: Callable measuring the size of a string, `len` for characters
+        or a tokenizer's token count. Sizes of fragments are summed, which
+        is exact for characters and a close estimate for tokens.
+      overhead: Size of the document wrapper around the fragments.
+
+    Returns:
+      A `(kept, dropped)` pair of ascending id lists.
+    """
+    if budget is None:
+        return list(range(len(fragments))), []
+    remaining = budget - overhead
+    order = sorted(range(len(fragments)), key=lambda i: (-scores[i], i))
+    for rank, index in enumerate(order):
+        size = count(fragments[index])
+        if size > remaining:
+            return sorted(order[:rank]), sorted(order[rank:])
+        remaining -= size
+    return list(range(len(fragments))), []
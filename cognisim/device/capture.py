@@ -0,0 +1,113 @@
+"""Concurrent capture of the view hierarchy and the screenshot.
+
+Both are blocking round trips to Appium. `CapturePool` runs them on worker
+threads, so get_state waits for the slower of the two instead of their sum
+and parses the hierarchy while the screenshot is still downloading.
+`CaptureTiming` records when each was fetched, since the screenshot may
+show a slightly different frame than the hierarchy describes.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import time
+
+import attr
+
+import cognisim.utils.constants as config
+
+
+@attr.s(slots=True, frozen=True)
+class CaptureTiming(object):
+    """Wall clock times (time.time()) of the two fetches of a get_state.
+
+    Attributes:
+      hierarchy_started: When the view hierarchy was requested.
+      hierarchy_finished: When it was received.
+      screenshot_started: When the screenshot was requested.
+      screenshot_finished: When it was received.
+    """
+    hierarchy_started = attr.ib()
+    hierarchy_finished = attr.ib()
+    screenshot_started = attr.ib()
+    screenshot_finished = attr.ib()
+
+    @property
+    def skew(self):
+        """Seconds from the middle of the hierarchy fetch to the middle of the
+        screenshot fetch, negative if the screenshot came first."""
+        return ((self.screenshot_started + self.screenshot_finished) -
+                (self.hierarchy_started + self.hierarchy_finished)) / 2
+
+    @property
+    def duration(self):
+        """Seconds from the first request to the last response."""
+        return (max(self.hierarchy_finished, self.screenshot_finished) -
+                min(self.hierarchy_started, self.screenshot_started))
+
+
+@attr.s(slots=True, frozen=True)
+class DeviceState(object):
+    """The result of a get_state.
+
+    Unpacks to its first three attributes, as in
+    `encoded_ui, screenshot, ui = await device.get_state()`.
+
+    Attributes:
+      encoded_ui: The text encoding of the UI.
+      screenshot: The screenshot bytes, downscaled when get_state was asked to.
+      ui: The UI the encoding was made from.
+      transform: The ScreenTransform of a downscaled screenshot, None when
+        the screenshot was not downscaled.
+      timing: The CaptureTiming of the hierarchy and the screenshot.
+    """
+    encoded_ui = attr.ib()
+    screenshot = attr.ib()
+    ui = attr.ib()
+    transform = attr.ib(default=None)
+    timing = attr.ib(default=None)
+
+    def __iter__(self):
+        return iter((self.encoded_ui, self.screenshot, self.ui))
+
+
+def timed(fn, *args):
+    """Returns (fn(*args), started, finished)."""
+    started = time.time()
+    result = fn(*args)
+    return result, started, time.time()
+
+
+class CapturePool(object):
+    """Runs blocking driver calls on a small pool of worker threads.
+
+    The threads are started on first use, and again after `shutdown`.
+    """
+
+    def __init__(self, max_workers=config.CAPTURE_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix='cognisim-capture')
+            return self._executor
+
+    def run(self, fn, *args):
+        """Starts fn(*args) on a worker and returns an awaitable of its result."""
+        return asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), functools.partial(fn, *args))
+
+    def run_timed(self, fn, *args):
+        """Like `run`, the awaitable returns (result, started, finished)."""
+        return self.run(timed, fn, *args)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,140 @@
+"""Differences between the encoded UI states of consecutive snapshots.
+
+Agents resend the screen to the model on every step, although most steps
+only change a few elements. `diff_elements` matches the elements of two
+snapshots and `encode_delta` emits only what was added, removed or changed,
+plus a count of the unchanged elements:
+
+  + <fragment of an added element>
+  ~ <fragment of a changed or renumbered element>
+  - <fragment of a removed element, with its previous id>
+  unchanged: 42 elements
+
+Ids are display ids in reading order, so an element inserted above others
+shifts their ids. Those elements are emitted under their new id as well,
+otherwise the model would keep acting on the old ids.
+"""
+
+import collections
+
+import attr
+
+
+@attr.s(slots=True)
+class StateDelta(object):
+    """Element ids of two snapshots, matched up.
+
+    Attributes:
+      added: Ids of current elements without a previous counterpart.
+      removed: Ids of previous elements without a current counterpart.
+      changed: {current id: previous id} of elements whose content changed.
+      unchanged: {current id: previous id} of identical elements.
+    """
+    added = attr.ib(factory=list)
+    removed = attr.ib(factory=list)
+    changed = attr.ib(factory=dict)
+    unchanged = attr.ib(factory=dict)
+
+    @property
+    def renumbered(self):
+        """{current id: previous id} of unchanged elements whose id changed."""
+        return {_id: previous_id for _id, previous_id in self.unchanged.items()
+                if _id != previous_id}
+
+
+def element_key(uiobject):
+    """Identity of an element: its type, resource id and depth in the DOM.
+
+    Text and position are left out, so an edited field or a moved button is
+    reported as changed rather than as removed and added. iOS elements have
+    no resource id.
+    """
+    depth = uiobject.dom_location[0] if uiobject.dom_location else None
+    return uiobject.obj_type, getattr(uiobject, 'resource_id', None), depth
+
+
+def element_content(uiobject):
+    """What is compared between matched elements, including their position."""
+    box = uiobject.bounding_box
+    return (uiobject.text, uiobject.content_desc, uiobject.enabled,
+            getattr(uiobject, 'selected', None),
+            getattr(uiobject, 'focused', None),
+            box.x1, box.y1, box.x2, box.y2)
+
+
+def diff_elements(previous, current, previous_keys=None, current_keys=None):
+    """Matches the elements of two snapshots.
+
+    Elements identical in key and content are matched first, then the rest
+    is matched by key alone and counted as changed. Several elements with
+    the same key are paired up in reading order.
+
+    Args:
+      previous: {id: UI object} of the previous snapshot.
+      current: {id: UI object} of the current snapshot.
+      previous_keys: Key of every previous element by id, e.g. its stable id.
+        Defaults to `element_key`.
+      current_keys: Key of every current element by id.
+
+    Returns:
+      A StateDelta.
+    """
+    def keys(elements, given):
+        if given is None:
+            return {_id: element_key(uiobject) for _id, uiobject in elements.items()}
+        return {_id: given[_id] for _id in elements}
+
+    previous_keys = keys(previous, previous_keys)
+    current_keys = keys(current, current_keys)
+    delta = StateDelta()
+    # Lists are reversed so pop() returns the first id in reading order.
+    by_content = collections.defaultdict(list)
+    for _id in reversed(list(previous)):
+        uiobject = previous[_id]
+        by_content[previous_keys[_id], element_content(uiobject)].append(_id)
+    unmatched = []
+    for _id, uiobject in current.items():
+        candidates = by_content.get((current_keys[_id], element_content(uiobject)))
+        if candidates:
+            delta.unchanged[_id] = candidates.pop()
+        else:
+            unmatched.append(_id)
+
+    by_key = collections.defaultdict(list)
+    for (key, _), ids in by_content.items():
+        by_key[key].extend(ids)
+    for ids in by_key.values():
+        ids.sort(reverse=True)
+    for _id in unmatched:
+        candidates = by_key.get(current_keys[_id])
+        if candidates:
+            delta.changed[_id] = candidates.pop()
+        else:
+            delta.added.append(_id)
+    delta.removed = sorted(_id for ids in by_key.values() for _id in ids)
+    return delta
+
+
+def _mark(prefix, fragment):
+    return ''.join(prefix + line for line in fragment.splitlines(True))
+
+
+def encode_delta(delta, previous_fragments, fragments):
+    """Encodes a StateDelta with the element fragments of both snapshots.
+
+    Args:
+      delta: The StateDelta of the two snapshots.
+      previous_fragments: Encoded elements of the previous snapshot, by id.
+      fragments: Encoded elements of the current snapshot, by id.
+
+    Returns:
+      The delta as text, see the module docstring.
+    """
+    renumbered = delta.renumbered
+    lines = [_mark('+ ', fragments[_id]) for _id in delta.added]
+    lines.extend(_mark('~ ', fragments[_id])
+                 for _id in sorted(set(delta.changed) | set(renumbered)))
+    lines.extend(_mark('- ', previous_fragments[_id]) for _id in delta.removed)
+    lines.append('unchanged: {} elements\n'.format(
+        len(delta.unchanged) - len(renumbered)))
+    return ''.join(lines)
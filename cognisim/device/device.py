@@ -1,9 +1,290 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
 
+from loguru import logger
+
+import cognisim.utils.constants as config
+from cognisim.device import screen_transform, set_of_mark
+from cognisim.device.capture import CapturePool, timed
+from cognisim.device.mjpeg import FrameGrabber
+from cognisim.device.screen_change import ScreenChangeDetector
+from cognisim.device.state_cache import StateCache, hash_page_source
+
 
 class Device(ABC):
-    def __init__(self, app_package):
+    # Height of the status bar as a fraction of the screen, left out of the
+    # screen change detection by default
+    status_bar_fraction = 0.0
+    # Whether taps are in screenshot pixels, as on Android, rather than in
+    # the units of the driver's window size, e.g. points on iOS
+    taps_in_screenshot_pixels = False
+
+    def __init__(self, app_package,
+                 state_cache_size=config.STATE_CACHE_MAX_ENTRIES,
+                 state_cache_bytes=config.STATE_CACHE_MAX_BYTES,
+                 driver_timeout=config.DRIVER_CALL_TIMEOUT,
+                 stream_screenshots=True,
+                 change_threshold=config.SCREEN_CHANGE_THRESHOLD,
+                 change_excluded_regions=None):
+        '''
+        Args:
+        app_package: The app under test
+        state_cache_size: Max number of encoded UI states cached by page source
+            hash, 0 disables the cache
+        state_cache_bytes: Max total length of the page sources and encoded
+            UIs cached, the UI objects are not counted
+        driver_timeout: Seconds before a driver call raises asyncio.TimeoutError,
+            None waits forever
+        stream_screenshots: Take screenshots from the MJPEG stream of the
+            session when it has one, see start_frame_grabber
+        change_threshold: Largest change of a screenshot block, in gray levels,
+            that get_state(skip_unchanged=True) treats as the same screen
+        change_excluded_regions: (x1, y1, x2, y2) regions, as fractions of the
+            screen, the change detection ignores. Defaults to the status bar
+        '''
         self.app_package = app_package
+        self.state_cache = StateCache(state_cache_size, state_cache_bytes)
+        # {'width', 'height'} of the screen in tap coordinates, set by start_device
+        self.window_size = None
+        # Runs the blocking driver calls and the image work off the event loop,
+        # get_state fetches the hierarchy and the screenshot concurrently on it
+        self.capture_pool = CapturePool()
+        self.driver_timeout = driver_timeout
+        # capture.CaptureTiming of the latest get_state
+        self.last_capture = None
+        self.stream_screenshots = stream_screenshots
+        self.frame_grabber = None
+        if change_excluded_regions is None:
+            change_excluded_regions = [(0.0, 0.0, 1.0, self.status_bar_fraction)]
+        self.change_detector = ScreenChangeDetector(change_threshold, change_excluded_regions)
+        # (signature, encoded_ui, ui, hierarchy_started, hierarchy_finished) of
+        # the latest hierarchy fetched by get_state(skip_unchanged=True), and
+        # the signature of the screenshot of a get_state fetching one
+        self._screen_state = None
+        self._screen_signature = None
+
+    def with_timeout(self, awaitable, timeout=None):
+        '''
+        Waits for awaitable at most timeout seconds, defaults to driver_timeout
+        '''
+        return asyncio.wait_for(awaitable, self.driver_timeout if timeout is None else timeout)
+
+    async def call_driver(self, fn, *args, timeout=None):
+        '''
+        Runs a blocking driver call, or any blocking function, on the device
+        threads so the event loop keeps serving other devices meanwhile
+        timeout: seconds before asyncio.TimeoutError, defaults to driver_timeout
+        A cancelled or timed out caller returns right away, the call itself
+        runs to completion on its thread
+        '''
+        return await self.with_timeout(self.capture_pool.run(fn, *args), timeout)
+
+    def start_frame_grabber(self, url):
+        '''
+        Reads the MJPEG screen stream at url in the background, screenshots
+        are then its latest frame and WebDriver screenshots are only taken
+        while the stream is unavailable
+        '''
+        if not self.stream_screenshots:
+            return
+        self.stop_frame_grabber()
+        self.frame_grabber = FrameGrabber(url)
+        self.frame_grabber.start()
+
+    def stop_frame_grabber(self):
+        if self.frame_grabber is not None:
+            self.frame_grabber.stop(timeout=1)
+            self.frame_grabber = None
+
+    def _grab_screenshot(self):
+        '''
+        Blocking screenshot of get_state, a stream frame newer than the call
+        when the stream is up, a WebDriver screenshot otherwise
+        Returns (screenshot bytes, requested, received)
+        '''
+        if self.frame_grabber is not None:
+            frame = self.frame_grabber.wait_for_frame(time.time(), config.MJPEG_FRAME_WAIT)
+            if frame is not None:
+                return frame.data, frame.timestamp, frame.timestamp
+        return timed(self.driver.get_screenshot_as_png)
+
+    @staticmethod
+    def _discard_capture(capture):
+        '''
+        Cancels a capture get_state no longer waits for, e.g. the screenshot
+        when the hierarchy fetch failed. A capture that already finished has
+        its exception retrieved, so asyncio does not log it as never retrieved
+        '''
+        if not capture.cancel() and not capture.cancelled():
+            capture.exception()
+
+    async def _unchanged_screen_state(self, screenshot_capture):
+        '''
+        Waits for the screenshot of get_state and compares it with the one the
+        latest hierarchy was fetched with
+        Returns that (encoded_ui, ui, hierarchy_started, hierarchy_finished)
+        when the screen did not change, None otherwise
+        '''
+        screenshot, _, _ = await self.with_timeout(screenshot_capture)
+        signature = await self.capture_pool.run(self.change_detector.signature, screenshot)
+        previous = self._screen_state
+        if previous is not None and not self.change_detector.changed(previous[0], signature):
+            return previous[1:]
+        self._screen_state = None
+        self._screen_signature = signature
+        return None
+
+    def _remember_screen_state(self, skip_unchanged, encoded_ui, ui, hierarchy_started, hierarchy_finished):
+        '''
+        Keeps the state get_state just fetched for the next skip_unchanged call,
+        or forgets it when the screenshot was not compared
+        '''
+        if skip_unchanged and self._screen_signature is not None:
+            self._screen_state = (self._screen_signature, encoded_ui, ui, hierarchy_started, hierarchy_finished)
+        else:
+            self._screen_state = None
+        self._screen_signature = None
+
+    async def get_screenshot(self, latest=True) -> bytes:
+        '''
+        latest: the latest frame of the MJPEG stream, returned right away,
+        when the stream is up. Otherwise, or with latest=False, a WebDriver
+        screenshot
+        Returns jpeg bytes for a stream frame, png bytes otherwise
+        '''
+        if latest and self.frame_grabber is not None:
+            frame = self.frame_grabber.latest()
+            if frame is not None:
+                return frame.data
+        return await self.call_driver(self.driver.get_screenshot_as_png)
+
+    async def wait_until_stable(self, timeout=config.STABLE_TIMEOUT,
+                                min_stable_ms=config.STABLE_MIN_MS, check_hierarchy=False):
+        '''
+        Waits for the screen to settle after an action, instead of a fixed sleep.
+        Appium does not wait for idle, see start_device
+        timeout: seconds to wait at most
+        min_stable_ms: how long the screen must look the same, compared like
+        get_state(skip_unchanged=True) does
+        check_hierarchy: also require the same page source over two stable
+        periods, for changes a screenshot does not show
+        Returns True once the screen is stable, False on timeout
+        '''
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        min_stable = min_stable_ms / 1000
+        interval = config.STABLE_POLL_MIN_INTERVAL
+        reference = stable_since = source_hash = None
+        while True:
+            screenshot = await self.get_screenshot()
+            signature = await self.capture_pool.run(self.change_detector.signature, screenshot)
+            now = loop.time()
+            if reference is None or self.change_detector.changed(reference, signature):
+                # Moving, poll quickly to catch the end of the animation
+                reference, stable_since = signature, now
+                interval = config.STABLE_POLL_MIN_INTERVAL
+            elif now - stable_since >= min_stable:
+                if not check_hierarchy:
+                    logger.debug(f"Screen stable after {now - started:.3f}s")
+                    return True
+                try:
+                    # Bounded by the deadline rather than driver_timeout
+                    page_source = await self.call_driver(
+                        lambda: self.driver.page_source, timeout=max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    logger.debug(f"Hierarchy not stable after {timeout}s")
+                    return False
+                previous_hash, source_hash = source_hash, hash_page_source(page_source)
+                if source_hash == previous_hash:
+                    logger.debug(f"Screen and hierarchy stable after {now - started:.3f}s")
+                    return True
+                stable_since = now = loop.time()
+            else:
+                interval = min(interval * 1.5, config.STABLE_POLL_MAX_INTERVAL)
+            if now >= deadline:
+                logger.debug(f"Screen not stable after {timeout}s")
+                return False
+            # Wake up when the stable period would end rather than later
+            wait = interval
+            if stable_since + min_stable > now:
+                wait = min(wait, stable_since + min_stable - now)
+            await asyncio.sleep(min(wait, deadline - now))
+
+    def device_size(self):
+        '''
+        Returns (width, height) of the driver's window in tap coordinates,
+        which leaves out the navigation bar on Android
+        '''
+        if self.window_size is None:
+            self.window_size = self.driver.get_window_size()
+        return self.window_size['width'], self.window_size['height']
+
+    def scale_screenshot(self, screenshot: bytes, image_size=None, image_scale=None,
+                         image_format=None, quality=None):
+        '''
+        Downscales a screenshot before it is sent to a model
+        screenshot: png or jpeg bytes of the screenshot
+        image_size: (width, height) the image must fit in, keeping its aspect ratio
+        image_scale: scale factor, e.g. 0.5 for half the size
+        image_format: 'png', 'jpeg' or 'webp', defaults to the format of the screenshot
+        quality: 1-100 for jpeg and webp
+        Returns the bytes of the downscaled image, or the screenshot itself when
+        it is not downscaled, and the screen_transform.ScreenTransform mapping
+        image coordinates to the coordinates of tap, input and swipe: the
+        screenshot pixels when taps_in_screenshot_pixels, the window size
+        otherwise
+        '''
+        device_size = None if self.taps_in_screenshot_pixels else self.device_size()
+        return screen_transform.downscale_screenshot(
+            screenshot, device_size, image_size, image_scale,
+            image_format, quality)
+
+    def generate_set_of_mark(self, ui, image: bytes, position='top-left') -> bytes:
+        '''
+        Draws the element ids of an encoded UI on its screenshot
+        ui: UI object
+        image: bytes of the screenshot
+        position: position of the annotation, defaults to 'top-left', can also be 'center'
+        Returns the png bytes, see render_set_of_mark for faster formats
+        '''
+        return set_of_mark.render(ui, image, position).data
+
+    async def capture_screenshot_with_bounding_box(self, bounds, image_state: bytes = None) -> bytes:
+        '''
+        Capture a screenshot with a bounding box drawn around an element
+        bounds: (x1, y1, x2, y2) of the element
+        image_state: the current screenshot if available, taken otherwise
+        Returns the png bytes of the screenshot with the bounding box
+        '''
+        logger.info("Creating tagged image")
+        screenshot = image_state
+        if screenshot is None:
+            screenshot = await self.get_screenshot()
+        if screenshot is None:
+            logger.info("Screenshot failed")
+            return None
+        return await self.capture_pool.run(set_of_mark.draw_bounding_box, screenshot, bounds)
+
+    def render_set_of_mark(self, ui, image, position='top-left',
+                           image_format=config.SET_OF_MARK_FORMAT,
+                           quality=config.SET_OF_MARK_QUALITY, scale=1.0,
+                           transform=None):
+        '''
+        Draws the element ids of an encoded UI on its screenshot and encodes it
+        ui: UI object
+        image: bytes of the screenshot, or the decoded BGR array
+        position: position of the annotation, 'top-left' or 'center'
+        image_format: 'jpeg', 'webp' or 'png'
+        quality: 1-100, for jpeg and webp
+        scale: downscales the image, e.g. 0.5 for half the size
+        transform: ScreenTransform returned by get_state with the image, when
+        the screenshot was downscaled
+        Returns a set_of_mark.EncodedImage with the bytes and the format used
+        '''
+        return set_of_mark.render(ui, image, position, image_format, quality, scale,
+                                  transform=transform)
 
     @abstractmethod
     def start_device(self):
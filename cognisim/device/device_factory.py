@@ -20,10 +20,14 @@ class DeviceFactory:
             return AndroidDevice(
                 app_package=app_url,
                 download_directory=download_directory,
-                session_id=session_id
+                session_id=session_id,
+                state_representation=state_representation
             )
         elif platform == 'ios':
-            return IOSDevice(app_url)
+            return IOSDevice(
+                app_url,
+                state_representation=state_representation
+            )
 
         elif platform == 'web':
             logger.info("Creating web device")
@@ -0,0 +1,160 @@
+"""Text representations of an encoded UI state, selected by name.
+
+`UI.encoding` turns every visible leaf into one fragment and joins them into
+a document. The fragments come from the `StateEncoder` registered under the
+device's `state_representation`:
+
+  html     Today's HTML, one tag per element (alias: aria).
+  compact  One line per element: `<id> <tag> "<label>" .<class>`.
+  jsonl    One JSON object per element and line, with the compact fields.
+
+The compact format drops the closing tags, attribute names and wrapper of
+the HTML, which roughly halves the prompt size of a screen. Element ids are
+the same in every representation.
+"""
+
+import json
+
+_ENCODERS = {}
+_ALIASES = {'aria': 'html'}
+
+
+def register_encoder(name):
+    """Class decorator registering a StateEncoder under `name`."""
+
+    def register(cls):
+        cls.name = name
+        _ENCODERS[name] = cls
+        return cls
+
+    return register
+
+
+def get_encoder(name):
+    """Returns the StateEncoder class registered under `name` or an alias.
+
+    Raises:
+      ValueError: If no encoder is registered under `name`.
+    """
+    try:
+        return _ENCODERS[_ALIASES.get(name, name)]
+    except KeyError:
+        raise ValueError('Invalid state representation {!r}. Expected one of: {}.'.format(
+            name, ', '.join(sorted(list(_ENCODERS) + list(_ALIASES)))))
+
+
+def available_encoders():
+    """Returns the names of the registered encoders, without aliases."""
+    return sorted(_ENCODERS)
+
+
+class StateEncoder(object):
+    """Encodes UI elements of one platform into text fragments.
+
+    Subclasses may precompile a template per element type in
+    `compile_template`, so encoding an element is a dict lookup and one
+    string format.
+    """
+
+    name = None
+    header = ''
+    footer = ''
+
+    def __init__(self, tags, class_name, element_encoding):
+        """Constructor.
+
+        Args:
+          tags: The platform's {element type name: html tag} mapping.
+          class_name: Callable deriving the class from a resource id.
+          element_encoding: The platform's html encoding of one element,
+            taking `(_id, obj_type, text, content_desc, resource_id)`.
+        """
+        self.tags = tags
+        self.class_name = class_name
+        self.element_encoding = element_encoding
+        self._templates = {obj_type: self.compile_template(obj_type, tag)
+                           for obj_type, tag in tags.items()}
+
+    def compile_template(self, obj_type, tag):
+        """Returns the template used for elements of type `obj_type`."""
+        return None
+
+    def template(self, obj_type):
+        template = self._templates.get(obj_type)
+        if template is None:
+            template = self._templates[obj_type] = self.compile_template(
+                obj_type, obj_type.lower())
+        return template
+
+    def element(self, _id, obj_type, text, content_desc, resource_id):
+        """Returns the fragment of one element."""
+        raise NotImplementedError
+
+    def document(self, fragments):
+        """Joins element fragments into the encoded state."""
+        return self.header + ''.join(fragments) + self.footer
+
+
+@register_encoder('html')
+class HtmlEncoder(StateEncoder):
+    """The platform's html encoding, unchanged.
+
+    The markup differs by platform and element type, so it is left to the
+    platform's `element_encoding` rather than compiled into templates here.
+    Its f-strings are already one string format per element.
+    """
+
+    header = '<html>\n'
+    footer = '</html>'
+
+    def element(self, _id, obj_type, text, content_desc, resource_id):
+        return self.element_encoding(
+            _id, obj_type, text, content_desc, resource_id) or ''
+
+
+# Escapes of the compact labels, which must not break their line.
+_QUOTE_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+
+
+def _quote(text):
+    return '"' + text.translate(_QUOTE_ESCAPES) + '"'
+
+
+@register_encoder('compact')
+class CompactEncoder(StateEncoder):
+    """One line per element, `<id> <tag> "<label>" .<class>`.
+
+    The label is the text, or the content description if there is no text.
+    Backslashes, quotes and line breaks in it are backslash escaped. Empty
+    labels and classes are left out.
+    """
+
+    def compile_template(self, obj_type, tag):
+        return '%d ' + tag + '%s%s\n'
+
+    def element(self, _id, obj_type, text, content_desc, resource_id):
+        label = text.strip() or content_desc or ''
+        _class = self.class_name(resource_id)
+        return self.template(obj_type) % (
+            _id,
+            ' ' + _quote(label) if label else '',
+            ' .' + _class if _class else '')
+
+
+@register_encoder('jsonl')
+class JsonLinesEncoder(StateEncoder):
+    """One JSON object per line with the keys id, tag, label and class.
+
+    Carries the same fields as the compact encoding for consumers that parse
+    the state. Empty labels and classes are left out.
+    """
+
+    def compile_template(self, obj_type, tag):
+        return '{"id":%d,"tag":' + json.dumps(tag) + '%s}\n'
+
+    def element(self, _id, obj_type, text, content_desc, resource_id):
+        label = text.strip() or content_desc or ''
+        _class = self.class_name(resource_id)
+        return self.template(obj_type) % (_id, ''.join(
+            ',"' + key + '":' + json.dumps(value, ensure_ascii=False)
+            for key, value in (('label', label), ('class', _class)) if value))
@@ -0,0 +1,168 @@
+"""Columnar bounding box storage for the elements of a view hierarchy.
+
+Every element's geometry is parsed exactly once into an (N, 4) int32 array of
+[x1, y1, x2, y2] rows. Screen bound filtering, grid locations, neighbor
+distances and sorting then work on that array instead of re-parsing the
+`bounds` attribute of each element.
+"""
+
+import re
+
+import numpy as np
+
+_BOUNDS_PATTERN = re.compile(r'\[(\d+),(\d+)\]\[(\d+),(\d+)\]')
+
+
+class GeometryTable(object):
+    """Bounding boxes of view hierarchy elements stored as one int32 array."""
+
+    def __init__(self, boxes=()):
+        """Constructor.
+
+        Args:
+          boxes: Sequence of (x1, y1, x2, y2) boxes, or an (N, 4) array.
+        """
+        self.boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+
+    @classmethod
+    def from_bounds(cls, bounds):
+        """Builds the table from Android `bounds` attributes.
+
+        Args:
+          bounds: Sequence of '[x1,y1][x2,y2]' strings.
+
+        Returns:
+          The GeometryTable object.
+        """
+        rows = []
+        for value in bounds:
+            match = _BOUNDS_PATTERN.match(value)
+            assert match, f"Invalid bounds format: {value}"
+            rows.append(match.groups())
+        return cls(np.array(rows, dtype=np.int64))
+
+    @classmethod
+    def from_frames(cls, xs, ys, widths, heights):
+        """Builds the table from iOS x/y/width/height attributes.
+
+        The origin is clamped to the screen, the size is kept as is.
+
+        Args:
+          xs, ys, widths, heights: Sequences of numbers or numeric strings.
+
+        Returns:
+          The GeometryTable object.
+        """
+        x1 = np.maximum(np.array(xs, dtype=np.int64), 0)
+        y1 = np.maximum(np.array(ys, dtype=np.int64), 0)
+        x2 = x1 + np.array(widths, dtype=np.int64)
+        y2 = y1 + np.array(heights, dtype=np.int64)
+        return cls(np.stack([x1, y1, x2, y2], axis=1))
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __getitem__(self, key):
+        """Returns the sub-table selected by an index array or boolean mask."""
+        return GeometryTable(self.boxes[key])
+
+    def columns(self):
+        """Returns the x1, y1, x2, y2 columns as int64 arrays."""
+        boxes = self.boxes.astype(np.int64)
+        return boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+
+    def rows(self):
+        """Returns the boxes as a list of (x1, y1, x2, y2) int tuples."""
+        return [tuple(row) for row in self.boxes.tolist()]
+
+    def within_screen(self, screen_width, screen_height, partial=False):
+        """Whether each box lies within the screen boundary.
+
+        Args:
+          screen_width, screen_height: Screen width and height.
+          partial: Accept boxes with only one edge per axis on screen.
+
+        Returns:
+          A boolean mask with one entry per box.
+        """
+        x1, y1, x2, y2 = self.columns()
+        x1_in = (0 <= x1) & (x1 <= screen_width)
+        x2_in = (0 <= x2) & (x2 <= screen_width)
+        y1_in = (0 <= y1) & (y1 <= screen_height)
+        y2_in = (0 <= y2) & (y2 <= screen_height)
+        if partial:
+            in_x, in_y = x1_in | x2_in, y1_in | y2_in
+        else:
+            in_x, in_y = x1_in & x2_in, y1_in & y2_in
+        return in_x & in_y & (x1 < x2) & (y1 < y2)
+
+    def grid_locations(self, screen_width, screen_height):
+        """Calculates the 3x3 grid number of every box center.
+
+        The screen can be divided into 3x3 grid:
+        (0, 0) (0, 1) (0, 2)        0   1   2
+        (1, 0) (1, 1) (1, 2)  --->  3   4   5
+        (2, 0) (2, 1) (2, 2)        6   7   8
+
+        Args:
+          screen_width, screen_height: Screen width and height.
+
+        Returns:
+          An int array with the grid location number of every box.
+        """
+        x1, y1, x2, y2 = self.columns()
+        grid_x = _grid_coordinates((x1 + x2) / 2, screen_width)
+        grid_y = _grid_coordinates((y1 + y2) / 2, screen_height)
+        return grid_y * 3 + grid_x
+
+    def reading_order(self, row_tolerance=0):
+        """Returns the box indices sorted top to bottom, then left to right.
+
+        The sort is stable: every index appears exactly once and boxes with
+        identical bounds keep their table order.
+
+        Args:
+          row_tolerance: Boxes whose top edge is at most this many pixels
+            below the top of the first box of a row are on that row and are
+            sorted left to right, so slightly misaligned elements of one
+            visual line stay together. 0 sorts by the exact top edge.
+
+        Returns:
+          An int array of box indices.
+        """
+        x1, y1, _, _ = self.columns()
+        if row_tolerance > 0:
+            y1 = _row_tops(y1, row_tolerance)
+        return np.lexsort((x1, y1))
+
+
+def _row_tops(y, row_tolerance):
+    """Returns the top of the row of every position.
+
+    A row starts at the topmost position not yet on a row and takes every
+    position at most `row_tolerance` below it.
+    """
+    order = np.argsort(y, kind='stable')
+    tops = np.empty_like(y)
+    top = None
+    for index, value in zip(order.tolist(), y[order].tolist()):
+        if top is None or value - top > row_tolerance:
+            top = value
+        tops[index] = top
+    return tops
+
+
+def _grid_coordinates(x, width):
+    """Calculates the 3x3 grid coordinates of an array of positions.
+
+    Args:
+      x: Array of coordinates on one axis.
+      width: The screen size on that axis.
+
+    Returns:
+      An int array of grid coordinates in [0, 2].
+    """
+    grid_x_0 = width / 3
+    grid_x_1 = 2 * grid_x_0
+    return np.where((0 <= x) & (x < grid_x_0), 0,
+                    np.where((grid_x_0 <= x) & (x < grid_x_1), 1, 2))
@@ -0,0 +1,105 @@
+"""Element ids that stay the same across the snapshots of a device.
+
+The ids in `UI.encoding` are positions in reading order, so any layout shift
+renumbers every element after it. `ElementIdentities` gives each element a
+stable id, e.g. `e3f09a1c2`, derived from its DOM path, resource id, class
+and approximate position:
+
+  1. The id is a blake2b digest of the path (without sibling positions),
+     resource id, class and position cell, so an element keeps its id
+     across snapshots, devices and processes as long as these match.
+     Elements sharing all of them are told apart by their order, e.g.
+     `e3f09a1c2.1` for the second one.
+  2. An element whose digest is new keeps the id of an element of the
+     previous snapshot with the same path, resource id and class that is
+     gone, so elements that moved, e.g. by scrolling, keep their ids.
+
+No two elements of a snapshot share an id.
+"""
+
+import collections
+import hashlib
+import threading
+
+
+# Positions are rounded to cells of 1/8th of the screen width.
+_CELLS_PER_ROW = 8
+
+
+def _digest(*parts):
+    """Returns the hex blake2b digest of str or bytes parts."""
+    digest = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        # Length prefixed, so the parts cannot run into each other.
+        digest.update(len(part).to_bytes(4, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def identity_keys(paths, resource_ids, classes, boxes, screen_width):
+    """Returns the `(loose, exact)` identity key of every element.
+
+    Args:
+      paths: DOM path digest of every element, see `traversal.path_hashes`.
+      resource_ids: Resource id of every element, or None.
+      classes: Class of every element.
+      boxes: (x1, y1, x2, y2) of every element.
+      screen_width: Width of the screen the boxes are on.
+
+    Returns:
+      A list of `(loose, exact)` pairs of hex digests. The loose key leaves
+      the position out, the exact key adds the cell of the box center.
+    """
+    cell_size = screen_width / _CELLS_PER_ROW
+    keys = []
+    for path, resource_id, _class, (x1, y1, x2, y2) in zip(
+            paths, resource_ids, classes, boxes):
+        loose = _digest(path, resource_id or '', _class or '')
+        cell = (int((x1 + x2) / 2 // cell_size), int((y1 + y2) / 2 // cell_size))
+        keys.append((loose, _digest(loose, '{},{}'.format(*cell))))
+    return keys
+
+
+class ElementIdentities(object):
+    """Assigns stable ids to the elements of successive snapshots of a device.
+
+    Ids are derived from the exact keys alone, only the ids and loose keys of
+    the previous snapshot are remembered to carry the ids of moved elements
+    over.
+    """
+
+    def __init__(self):
+        self._previous = {}
+        self._lock = threading.Lock()
+
+    def assign(self, keys):
+        """Returns the stable id of every element of a snapshot.
+
+        Args:
+          keys: `(loose, exact)` key of every element, see `identity_keys`.
+        """
+        with self._lock:
+            ids = []
+            # Elements sharing a key are told apart by their occurrence.
+            occurrences = collections.Counter()
+            for _, exact in keys:
+                stable_id = 'e' + exact[:8]
+                occurrence = occurrences[stable_id]
+                occurrences[stable_id] += 1
+                ids.append('{}.{}'.format(stable_id, occurrence) if occurrence else stable_id)
+            previous_ids = {stable_id for stable_ids in self._previous.values()
+                            for stable_id in stable_ids}
+            present = set(ids)
+            gone = {loose: [stable_id for stable_id in stable_ids if stable_id not in present]
+                    for loose, stable_ids in self._previous.items()}
+            current = collections.defaultdict(list)
+            for index, (loose, _) in enumerate(keys):
+                if ids[index] not in previous_ids:
+                    candidates = gone.get(loose)
+                    if candidates:
+                        ids[index] = candidates.pop(0)
+                current[loose].append(ids[index])
+            self._previous = dict(current)
+            return ids
@@ -1,26 +1,57 @@
 import base64
 from datetime import datetime
 from appium.webdriver.common.appiumby import AppiumBy
+from cognisim.device.capture import CaptureTiming, DeviceState
+import cognisim.utils.constants as config
 from cognisim.device.device import Device
+from cognisim.device.encoders import get_encoder
 from appium.options.ios import XCUITestOptions
 from appium import webdriver
 from cognisim.device.ios.ios_view_hierarchy import UI
-from cognisim.device.ios.ios_view_hierarchy_maestro import get_formatted_hierarchy as get_formatted_hierarchy_maestro
 from loguru import logger
 import os
-import cv2
-import numpy as np
 import asyncio
 import json
+import time
 SCREEN_WITH = 430
 SCREEN_HEIGHT = 932
+# Status bar of the dynamic island models, in points
+STATUS_BAR_HEIGHT = 59
 
 SCREEN_CHANNEL = 4
 
 
+def _format_maestro_hierarchy(maestro_output):
+    # Imported on first use, so the package imports without the maestro
+    # formatter, e.g. for the appium only path and the tests
+    from cognisim.device.ios.ios_view_hierarchy_maestro import get_formatted_hierarchy
+    return get_formatted_hierarchy(json.loads(maestro_output))
+
+
+def _save_recording(video_base64, save_path=None):
+    if save_path is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"screen_recording_{timestamp}.mp4"
+        save_dir = os.path.join(os.getcwd(), "recordings")
+        os.makedirs(save_dir, exist_ok=True)
+        save_path = os.path.join(save_dir, filename)
+
+    with open(save_path, "wb") as video_file:
+        video_file.write(base64.b64decode(video_base64))
+    return save_path
+
+
 class IOSDevice(Device):
-    def __init__(self, app_package=None, download_directory='default', session_id=None):
-        super().__init__(app_package)
+    status_bar_fraction = STATUS_BAR_HEIGHT / SCREEN_HEIGHT
+
+    def __init__(self, app_package=None, download_directory='default', session_id=None,
+                 state_representation='html', **device_options):
+        super().__init__(app_package, **device_options)
+        self.ui = None
+        # Encoder of get_state, see cognisim.device.encoders. The maestro
+        # hierarchy has its own formatter and is always html
+        get_encoder(state_representation)
+        self.state_representation = state_representation
         self.download_directory = download_directory
         self.app_package = app_package
         self.session_id = session_id
@@ -42,17 +73,26 @@ class IOSDevice(Device):
         '''
         Start the IOS device and connect to the appium server
         '''
+        self.driver = await self.call_driver(self._connect, timeout=config.SESSION_START_TIMEOUT)
+        self.window_size = await self.call_driver(self.driver.get_window_size)
+        # The connect fallback drops the stream when the session rejects it
+        if 'mjpegScreenshotUrl' in self.desired_caps:
+            self.start_frame_grabber(self.desired_caps['mjpegScreenshotUrl'])
+
+    def _connect(self):
         try:
-            self.driver = webdriver.Remote('http://localhost:4723', options=self.options)
+            driver = webdriver.Remote('http://localhost:4723', options=self.options)
         except BaseException:
             self.desired_caps.pop('mjpegScreenshotUrl')
             self.options = XCUITestOptions().load_capabilities(self.desired_caps)
-            self.driver = webdriver.Remote('http://localhost:4723', options=self.options)
+            driver = webdriver.Remote('http://localhost:4723', options=self.options)
 
-        self.driver.update_settings({'waitForIdleTimeout': 0, 'shouldWaitForQuiescence': False, 'maxTypingFrequency': 60})
+        driver.update_settings({'waitForIdleTimeout': 0, 'shouldWaitForQuiescence': False, 'maxTypingFrequency': 60})
+        return driver
 
     async def mobile_get_source(self, format='json'):
-        return self.driver.execute_script('mobile: source', {'format': format, 'excludedAttributes': 'visible'})
+        return await self.call_driver(
+            self.driver.execute_script, 'mobile: source', {'format': format, 'excludedAttributes': 'visible'})
 
     async def start_recording(self):
         '''
@@ -60,7 +100,7 @@ class IOSDevice(Device):
         returns: None
         '''
         try:
-            self.driver.start_recording_screen()
+            await self.call_driver(self.driver.start_recording_screen)
         except Exception as e:
             logger.error(f"Failed to start screen recording. Error: {str(e)}")
             raise
@@ -75,44 +115,89 @@ class IOSDevice(Device):
             str: Path to the saved video file
 
         '''
-        video_base64 = self.driver.stop_recording_screen()
-        if save_path is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"screen_recording_{timestamp}.mp4"
-            save_dir = os.path.join(os.getcwd(), "recordings")
-            os.makedirs(save_dir, exist_ok=True)
-            save_path = os.path.join(save_dir, filename)
-
-        with open(save_path, "wb") as video_file:
-            video_file.write(base64.b64decode(video_base64))
-
+        video_base64 = await self.call_driver(self.driver.stop_recording_screen)
+        save_path = await self.capture_pool.run(_save_recording, video_base64, save_path)
         logger.info(f"Screen recording saved to: {save_path}")
         return save_path
 
-    async def get_state(self, use_maestro=True):
+    async def get_state(self, use_maestro=True, delta=False, image_size=None, image_scale=None,
+                        skip_unchanged=False):
+        '''
+        use_maestro: Read the hierarchy with maestro instead of appium
+        delta: Encode only the changes since the previous appium get_state,
+        the full state is returned on the first call and with maestro
+        image_size: (width, height) to downscale the screenshot to, keeping its
+        aspect ratio
+        image_scale: Factor to downscale the screenshot by, e.g. 0.5
+        skip_unchanged: Compare the screenshot with the one of the previous
+        skip_unchanged get_state first, and reuse its hierarchy instead of
+        fetching it again when the screen did not change
+        Returns a capture.DeviceState of the encoded UI, the screenshot, the
+        UI, the ScreenTransform of a downscaled screenshot and the
+        CaptureTiming of the hierarchy and the screenshot, which are fetched
+        concurrently. The screenshot is in pixels and the transform maps it to
+        points. It is a jpeg frame of the MJPEG stream when the session has
+        one, a png otherwise
+        '''
+        # The screenshot downloads while the hierarchy is fetched and encoded,
+        # unless it is compared first
+        screenshot_capture = self.capture_pool.run(self._grab_screenshot)
         try:
-            if use_maestro:
+            unchanged = None
+            if skip_unchanged:
+                unchanged = await self._unchanged_screen_state(screenshot_capture)
+            hierarchy_started = time.time()
+            hierarchy_finished = None
+            if unchanged is not None:
+                encoded_ui, ui, hierarchy_started, hierarchy_finished = unchanged
+                if not use_maestro:
+                    previous = self.ui
+                    self.ui = ui
+                    if delta and previous is not None:
+                        encoded_ui = await self.capture_pool.run(ui.delta_encoding, previous)
+            elif use_maestro:
                 encoded_ui, ui = await self.get_state_maestro()
+                hierarchy_finished = time.time()
+                self._remember_screen_state(
+                    skip_unchanged, encoded_ui, ui, hierarchy_started, hierarchy_finished)
                 logger.info(f"Maestro hierarchy: {encoded_ui}")
             else:
-                raw_appium_state = self.driver.page_source
-
-                file_path = os.path.join(os.path.dirname(__file__), 'ios_view_hierarchy.xml')
-                xml_file = open(file_path, 'w')
-                xml_file.write(raw_appium_state)
-                xml_file.close()
-
-                ui = UI(file_path)
+                raw_appium_state, hierarchy_started, hierarchy_finished = await self.with_timeout(
+                    self.capture_pool.run_timed(lambda: self.driver.page_source))
+
+                # Unchanged screens (no-op taps, polling) are served from the cache.
+                previous = self.ui
+                encoded_ui, ui = await self.capture_pool.run(
+                    self.state_cache.get_or_build, raw_appium_state, self._encode_state)
+                self._remember_screen_state(
+                    skip_unchanged, encoded_ui, ui, hierarchy_started, hierarchy_finished)
                 self.ui = ui
-                encoded_ui: str = ui.encoding()
+                if delta and previous is not None:
+                    encoded_ui = await self.capture_pool.run(ui.delta_encoding, previous)
                 logger.info(f"Encoded UI: {encoded_ui}")
-            # logger.info(f"Raw Appium State: {raw_appium_state}")
+            screenshot, screenshot_started, screenshot_finished = await self.with_timeout(screenshot_capture)
         except Exception as e:
-            logger.info(f"Error getting page source: {e}")
-            raw_appium_state = ""
-
-        screenshot: bytes = self.driver.get_screenshot_as_png()
-        return encoded_ui, screenshot, ui
+            logger.error(f"Error getting state: {e}")
+            raise
+        finally:
+            # Not awaited when the hierarchy fetch failed or timed out
+            self._discard_capture(screenshot_capture)
+        self.last_capture = CaptureTiming(
+            hierarchy_started, hierarchy_finished or time.time(),
+            screenshot_started, screenshot_finished)
+
+        transform = None
+        if image_size is not None or image_scale is not None:
+            screenshot, transform = await self.capture_pool.run(
+                self.scale_screenshot, screenshot, image_size, image_scale)
+        return DeviceState(encoded_ui, screenshot, ui, transform, self.last_capture)
+
+    def _encode_state(self, raw_appium_state):
+        # Leaves unchanged since the previous state reuse its UI objects
+        ui = UI(raw_appium_state, previous=self.ui,
+                state_representation=self.state_representation)
+        encoded_ui: str = ui.encoding()
+        return encoded_ui, ui
 
     async def get_state_maestro(self):
         '''
@@ -125,7 +210,12 @@ class IOSDevice(Device):
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE
             )
-            stdout, stderr = await process.communicate()
+            try:
+                stdout, stderr = await self.with_timeout(process.communicate())
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise
 
             if process.returncode != 0:
                 logger.error(f"Error getting Maestro hierarchy: {stderr.decode()}")
@@ -134,85 +224,35 @@ class IOSDevice(Device):
             stdout = stdout.decode().strip()
             # Parse until first opening brace
             stdout = stdout[stdout.find('{'):]
-            hierarchy = json.loads(stdout)
             # logger.info(f"Hierarchy length: {len(hierarchy)}")
-            # Format hierarchy
-            formatted_html, ui_objects = get_formatted_hierarchy_maestro(hierarchy)
+            # Format hierarchy, unless the same hierarchy was already formatted
+            formatted_html, ui_objects = await self.capture_pool.run(
+                self.state_cache.get_or_build, stdout, _format_maestro_hierarchy)
             return formatted_html, ui_objects
 
         except Exception as e:
             logger.error(f"Error in get_state_maestro: {e}")
             return None
 
-    def generate_set_of_mark(self,
-                             ui,
-                             image: bytes,
-                             position='top-left') -> bytes:
+    async def tap(self, x, y, transform=None):
         '''
-        Code to generate a set of mark for a given image and UI state
-        ui: UI object
-        image: bytes of the image
-        step_i: step number
-        position: position of the annotation, defaults to 'top-lefts, can also be 'center
+        transform: ScreenTransform of a downscaled screenshot, x and y are then
+        coordinates on that screenshot
         '''
-        nparr = np.frombuffer(image, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        height, width, _ = img.shape
-        k = 3000
-
-        for element_id in ui.elements:
-            bounds = [
-                ui.elements[element_id].bounding_box.x1,
-                ui.elements[element_id].bounding_box.y1,
-                ui.elements[element_id].bounding_box.x2,
-                ui.elements[element_id].bounding_box.y2
-            ]
-            # Calculate the area of the bounding box
-            area = (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
-
-            # Only label elements with area over k
-            if area > k:
-                # Draw a rectangle around the element
-                cv2.rectangle(
-                    img, (int(bounds[0]), int(bounds[1])),
-                    (int(bounds[2]), int(bounds[3])), (0, 0, 255), 5)
-
-                text = str(element_id)
-                text_size = 2  # Fixed text size
-                font = cv2.FONT_HERSHEY_SIMPLEX
-
-                # Calculate the width and height of the text
-                text_width, text_height = cv2.getTextSize(text, font, text_size, 2)[0]
-
-                if position == 'top-left':
-                    text_x = int(bounds[0])
-                    text_y = int(bounds[1]) + text_height
-                else:
-                    text_x = (int(bounds[0]) + int(bounds[2])) // 2 - text_width // 2
-                    text_y = (int(bounds[1]) + int(bounds[3])) // 2 + text_height // 2
-
-                # Draw a black rectangle behind the text
-                cv2.rectangle(img, (text_x, text_y - text_height),
-                              (text_x + text_width, text_y), (0, 0, 0), thickness=cv2.FILLED)
-
-                # Draw the text in white
-                cv2.putText(img, text, (text_x, text_y), font,
-                            text_size, (255, 255, 255), 4)
-
-        _, img_encoded = cv2.imencode('.png', img)
-        img_bytes = img_encoded.tobytes()
-
-        return img_bytes
-
-    async def tap(self, x, y):
-        self.driver.execute_script('mobile: tap', {'x': x, 'y': y})
-
-    async def input(self, x, y, text):
-        self.driver.execute_script('mobile: tap', {'x': x, 'y': y})
-        self.driver.find_element(AppiumBy.IOS_PREDICATE, "type == 'XCUIElementTypeApplication'").send_keys(text)
+        if transform is not None:
+            x, y = transform.to_device(x, y)
+        await self.call_driver(self.driver.execute_script, 'mobile: tap', {'x': x, 'y': y})
+
+    async def input(self, x, y, text, transform=None):
+        if transform is not None:
+            x, y = transform.to_device(x, y)
+        await self.call_driver(self.driver.execute_script, 'mobile: tap', {'x': x, 'y': y})
+        application = await self.call_driver(
+            self.driver.find_element, AppiumBy.IOS_PREDICATE, "type == 'XCUIElementTypeApplication'")
+        await self.call_driver(application.send_keys, text)
         # self.driver.execute_script('mobile: type', {'text': text})
 
-    async def swipe(self, initial_x, initial_y, end_x, end_y, duration=1):
+    async def swipe(self, initial_x, initial_y, end_x, end_y, duration=1, transform=None):
         """
         Performs a swipe gesture on the iOS device
 
@@ -222,8 +262,13 @@ class IOSDevice(Device):
             end_x (int): Ending x coordinate of the swipe
             end_y (int): Ending y coordinate of the swipe
             duration (int, optional): Duration of the swipe in seconds. Defaults to 1.
+            transform (ScreenTransform, optional): Transform of a downscaled screenshot
+                the coordinates are on.
         """
-        self.driver.execute_script('mobile: dragFromToForDuration', {'fromX': initial_x, 'fromY': initial_y, 'toX': end_x, 'toY': end_y, 'duration': duration})
+        if transform is not None:
+            initial_x, initial_y = transform.to_device(initial_x, initial_y)
+            end_x, end_y = transform.to_device(end_x, end_y)
+        await self.call_driver(self.driver.execute_script, 'mobile: dragFromToForDuration', {'fromX': initial_x, 'fromY': initial_y, 'toX': end_x, 'toY': end_y, 'duration': duration})
 
     async def scroll(self, direction):
         direction_map = {
@@ -232,69 +277,20 @@ class IOSDevice(Device):
             'left': 'LEFT',
             'right': 'RIGHT'
         }
-        await self.driver.execute_script('mobile: scroll', {'direction': direction_map[direction]})
-
-    async def get_screenshot(self) -> bytes:
-        '''
-        Get Screenshot as bytes
-        '''
-        screenshot: bytes = self.driver.get_screenshot_as_png()
-        return screenshot
+        await self.call_driver(self.driver.execute_script, 'mobile: scroll', {'direction': direction_map[direction]})
 
     async def navigate(self, package_name: str):
-        self.driver.activate_app(package_name)
-
-    async def capture_screenshot_with_bounding_box(self, bounds: dict, image_state: bytes = None) -> bytes:
-        """
-        Capture a screenshot with a bounding box drawn around a specified element.
-
-        Args:
-            bounds (dict): A dictionary containing the bounding box coordinates.
-                           Expected keys are x1, y1, x2, y2, all of which are integers.
-            image_state (bytes, optional): The current screenshot if available.
-
-        Returns:
-            bytes: The screenshot image with bounding box as bytes.
-        """
-        logger.info("Creating tagged image")
-        screenshot = image_state if image_state is not None else await self.device.screenshot()
-        if screenshot is None:
-            logger.info("Screenshot failed")
-            return None
-
-        # Convert the screenshot to a NumPy array
-        image_np = np.frombuffer(screenshot, dtype=np.uint8)
-        image = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
-
-        # Extract bounding box coordinates
-        x1 = int(bounds[0])
-        y1 = int(bounds[1])
-        x2 = int(bounds[2])
-        y2 = int(bounds[3])
-
-        # Calculate width and height
-        #  width = x2 - x1
-        # height = y2 - y1
-
-        bright_color = (128, 0, 128)  # Pink color
-        # Draw the bounding box on the image
-        cv2.rectangle(image, (x1, y1), (x2, y2), bright_color, 5)
-
-        # Convert the image back to bytes
-        _, encoded_image = cv2.imencode('.png', image)
-        screenshot_with_bounding_box = encoded_image.tobytes()
-
-        return screenshot_with_bounding_box
+        await self.call_driver(self.driver.activate_app, package_name)
 
     async def stop_device(self):
         '''
         Stops the device
         '''
-        pass
+        await self.capture_pool.run(self.stop_frame_grabber)
 
 
 if __name__ == "__main__":
-    ui = UI(os.path.join(os.path.dirname(__file__), 'ios_view_hierarchy.xml'))
+    ui = UI.from_file(os.path.join(os.path.dirname(__file__), 'ios_view_hierarchy.xml'))
     encoded_ui = ui.encoding()
 
     logger.info(f"Encoded UI: {encoded_ui}")
@@ -0,0 +1,88 @@
+"""Deferred attribute values for UI objects.
+
+Expensive UI object fields (neighbors, word sequence, grid location,
+clickable) can be stored as `Lazy` values. The matching `lazy_attribute`
+property computes the value on first access and caches it in place, so
+callers that never read a field never pay for it.
+
+UIs may be read from several threads, e.g. the workers of a CapturePool, so
+the first computation of a value runs under the lock of its Lazy and every
+value is computed once. Computations of different values do not wait for
+each other, and values already computed are read without locking.
+"""
+
+import threading
+
+
+class Lazy(object):
+    """A value computed by `func(*args)` on first use and then cached."""
+
+    __slots__ = ('_func', '_args', '_value', '_lock')
+
+    def __init__(self, func, *args):
+        self._func = func
+        self._args = args
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the value, computing it on the first call."""
+        if self._func is not None:
+            with self._lock:
+                if self._func is not None:
+                    self._value = self._func(*self._args)
+                    # Drop the references held by the arguments once
+                    # computed, after the value is stored.
+                    self._func = self._args = None
+        return self._value
+
+    def item(self, index):
+        """Returns a Lazy selecting `index` from this lazy sequence.
+
+        Several objects can share one Lazy that computes a value for all of
+        them at once, e.g. the neighbors of every leaf in a hierarchy.
+        """
+        return _LazyItem(self, index)
+
+
+class _LazyItem(Lazy):
+    """Item `index` of a shared lazy sequence, without an argument tuple or
+    lock of its own."""
+
+    __slots__ = ('_sequence', '_index')
+
+    def __init__(self, sequence, index):
+        self._sequence = sequence
+        self._index = index
+
+    def get(self):
+        return self._sequence.get()[self._index]
+
+
+def defer(lazy, func, *args):
+    """Returns `func(*args)`, or a Lazy computing it later if `lazy` is set."""
+    return Lazy(func, *args) if lazy else func(*args)
+
+
+def lazy_attribute(name, doc=None):
+    """Returns a property resolving the Lazy stored in attribute `name`.
+
+    Args:
+      name: Name of the attribute holding either a plain value or a Lazy.
+      doc: Docstring of the property.
+
+    Returns:
+      The property object.
+    """
+
+    def getter(self):
+        value = getattr(self, name)
+        if isinstance(value, Lazy):
+            value = value.get()
+            setattr(self, name, value)
+        return value
+
+    def setter(self, value):
+        setattr(self, name, value)
+
+    return property(getter, setter, doc=doc)
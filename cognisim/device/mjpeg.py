@@ -0,0 +1,228 @@
+"""Background consumer of the MJPEG screen stream of a device.
+
+A WebDriver screenshot is a round trip that makes the device encode a PNG
+on every step. When the session streams its screen as MJPEG (the
+`mjpegScreenshotUrl` capability), `FrameGrabber` reads the stream on a
+daemon thread and keeps the most recent frames, so a screenshot is the
+latest frame, already on this side of the wire. Frames are kept as the
+JPEG bytes they arrive in and decoded on demand: decoding every frame of
+a 30 fps stream would cost more than the screenshots it replaces.
+
+The stream is a multipart/x-mixed-replace response:
+
+  --boundary
+  Content-Type: image/jpeg
+  Content-Length: 12345
+
+  <jpeg bytes>
+"""
+
+import collections
+import http.client
+import threading
+import time
+import urllib.request
+
+import attr
+import cv2
+import numpy as np
+from loguru import logger
+
+import cognisim.utils.constants as config
+
+_HEADERS_END = b'\r\n\r\n'
+_JPEG_START = b'\xff\xd8'
+_JPEG_END = b'\xff\xd9'
+_CHUNK_SIZE = 64 * 1024
+
+
+@attr.s(slots=True, frozen=True)
+class Frame(object):
+    """A frame of the stream.
+
+    Attributes:
+      data: The JPEG bytes.
+      timestamp: When the frame was received, as time.time().
+    """
+    data = attr.ib()
+    timestamp = attr.ib()
+
+    def decode(self):
+        """Returns the frame as a BGR array."""
+        return cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class _PartReader(object):
+    """Buffered reads of a stream up to a delimiter or a length."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = bytearray()
+
+    def _fill(self):
+        chunk = self._stream.read1(_CHUNK_SIZE)
+        if not chunk:
+            raise EOFError('MJPEG stream ended')
+        self._buffer += chunk
+
+    def _take(self, size):
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read(self, size):
+        while len(self._buffer) < size:
+            self._fill()
+        return self._take(size)
+
+    def read_until(self, delimiter):
+        """Returns the data up to and including `delimiter`."""
+        start = 0
+        while True:
+            index = self._buffer.find(delimiter, start)
+            if index >= 0:
+                return self._take(index + len(delimiter))
+            start = max(0, len(self._buffer) - len(delimiter) + 1)
+            self._fill()
+
+
+def iter_frames(stream):
+    """Yields the JPEG bytes of every part of a multipart MJPEG stream.
+
+    Parts are read by their Content-Length, or up to the end of image
+    marker when they have none.
+
+    Args:
+      stream: A binary file object with read1, e.g. an HTTP response.
+
+    Raises:
+      EOFError: When the stream ends.
+    """
+    reader = _PartReader(stream)
+    while True:
+        head = reader.read_until(_HEADERS_END)
+        length = None
+        for line in head.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+        if length is not None:
+            data = reader.read(length)
+        else:
+            data = reader.read_until(_JPEG_END)
+        start = data.find(_JPEG_START)
+        if start >= 0:
+            yield data[start:]
+
+
+class FrameGrabber(object):
+    """Keeps the latest frames of an MJPEG stream, read on a daemon thread.
+
+    The stream is reconnected with an increasing delay when it fails or
+    ends, and `connected` is False until it delivers a frame again.
+    """
+
+    def __init__(self, url, ring_size=config.MJPEG_RING_SIZE,
+                 read_timeout=config.MJPEG_READ_TIMEOUT,
+                 max_reconnect_delay=config.MJPEG_MAX_RECONNECT_DELAY):
+        """Constructor.
+
+        Args:
+          url: The MJPEG stream url.
+          ring_size: Number of recent frames kept.
+          read_timeout: Seconds without data before the stream is
+            reconnected.
+          max_reconnect_delay: Upper bound of the delay between reconnects.
+        """
+        self.url = url
+        self.read_timeout = read_timeout
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connected = False
+        self.frame_count = 0
+        self._frames = collections.deque(maxlen=ring_size)
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._response = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='cognisim-mjpeg', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        response = self._response
+        if response is not None:
+            # Unblocks the read of the grabber thread
+            try:
+                response.close()
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._set_connected(False)
+
+    def _set_connected(self, connected):
+        with self._condition:
+            self.connected = connected
+            self._condition.notify_all()
+
+    def _run(self):
+        delay = 0.1
+        while not self._stopped.is_set():
+            try:
+                with urllib.request.urlopen(self.url, timeout=self.read_timeout) as response:
+                    self._response = response
+                    for data in iter_frames(response):
+                        frame = Frame(data, time.time())
+                        with self._condition:
+                            self._frames.append(frame)
+                            self.frame_count += 1
+                            self.connected = True
+                            self._condition.notify_all()
+                        delay = 0.1
+                        if self._stopped.is_set():
+                            return
+            except (OSError, EOFError, ValueError, http.client.HTTPException) as e:
+                if not self._stopped.is_set():
+                    logger.debug(f"MJPEG stream {self.url} unavailable: {e}")
+            finally:
+                self._response = None
+            self._set_connected(False)
+            self._stopped.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def latest(self):
+        """Returns the latest Frame, None when the stream is not connected."""
+        with self._condition:
+            if not self.connected or not self._frames:
+                return None
+            return self._frames[-1]
+
+    def frames(self):
+        """Returns the recent frames, oldest first."""
+        with self._condition:
+            return list(self._frames)
+
+    def wait_for_frame(self, newer_than, timeout):
+        """Waits for a frame received after `newer_than`.
+
+        Screens that do not change may not be streamed again, so the latest
+        frame is returned when none arrives within `timeout` seconds.
+
+        Returns:
+          The Frame, None right away when the stream is not connected.
+        """
+        def ready():
+            return not self.connected or self._frames[-1].timestamp > newer_than
+
+        with self._condition:
+            if self.connected:
+                self._condition.wait_for(ready, timeout)
+            if not self.connected or not self._frames:
+                return None
+            return self._frames[-1]
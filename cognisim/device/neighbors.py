@@ -0,0 +1,308 @@
+"""Directional neighbor search over the leaf bounding boxes of a view hierarchy.
+
+The neighbor of a leaf in a direction is the closest leaf on that side whose
+normalized distance on the other axis is within a small margin. Instead of
+building dense N x N distance matrices, the boxes are bucketed on the cross
+axis and sorted once per direction. A query only looks at the buckets
+within the margin of its own extent, binary-searches its start position in
+each and stops as soon as no remaining box can beat the best neighbor found
+so far. The neighbors of a single box are found with one linear scan.
+"""
+
+import bisect
+
+import cognisim.utils.constants as config
+
+
+def pixel_distance(a_x1, a_x2, b_x1, b_x2,
+                   adjacent_threshold=config.ADJACENT_BOUNDING_BOX_THRESHOLD):
+    """Calculates the pixel distance between bounding box a and b on one axis.
+
+    Args:
+      a_x1: The x1 coordinate of box a.
+      a_x2: The x2 coordinate of box a.
+      b_x1: The x1 coordinate of box b.
+      b_x2: The x2 coordinate of box b.
+      adjacent_threshold: Boxes closer than this are treated as adjacent.
+
+    Returns:
+      The pixel distance between box a and b. It is positive when b is
+      right/bottom to a, negative when b is left/top to a, 0 when they overlap
+      and +/-1 when they are adjacent.
+    """
+    # if a and b are close enough, then we set the their distance to be 1
+    # because there are typically padding spaces inside an object's bounding
+    # box
+    if b_x1 <= a_x2 and a_x2 - b_x1 <= adjacent_threshold:
+        return 1
+    if a_x1 <= b_x2 and b_x2 - a_x1 <= adjacent_threshold:
+        return -1
+    # overlap
+    if (a_x1 <= b_x1 <= a_x2) or (a_x1 <= b_x2 <= a_x2) or (
+            b_x1 <= a_x1 <= b_x2) or (b_x1 <= a_x2 <= b_x2):
+        return 0
+    elif b_x1 > a_x2:
+        return b_x1 - a_x2
+    else:
+        return b_x2 - a_x1
+
+
+def _cross_buckets(boxes, order, cross_lo, cross_hi, bucket_size):
+    """Groups box indices by the cross axis buckets their extent touches.
+
+    Returns:
+      A dict mapping a bucket number to the indices of the boxes touching
+      it, in the order of `order`.
+    """
+    buckets = {}
+    for i in order:
+        for k in _bucket_range(boxes[i], cross_lo, cross_hi, bucket_size, 0):
+            buckets.setdefault(k, []).append(i)
+    return buckets
+
+
+def _bucket_range(box, cross_lo, cross_hi, bucket_size, reach):
+    """Returns the buckets within `reach` of the cross extent of a box."""
+    low, high = sorted((box[cross_lo], box[cross_hi]))
+    return range((low - reach) // bucket_size,
+                 (high + reach) // bucket_size + 1)
+
+
+def _cross_reach(cross_size, margin, adjacent_threshold):
+    """Returns the bucket size and the cross axis reach of the sweeps.
+
+    A box further than the reach from a query box on the cross axis is
+    never within `margin` of it, so only the buckets within reach are
+    scanned. The reach is generous, the exact test is `pixel_distance`.
+    """
+    reach = int(max(margin * cross_size, adjacent_threshold)) + 1
+    return max(2 * reach, cross_size // 32, 1), reach
+
+
+def _sweep_after(boxes, lo, hi, cross_lo, cross_hi, cross_size, margin,
+                 adjacent_threshold):
+    """Finds, for every box, the closest box after it on the main axis.
+
+    A box b is after box a when their main axis distance is positive and the
+    normalized cross axis distance is below `margin`. Ties are broken by the
+    smaller index, like np.argmin over the old distance matrix rows.
+
+    Boxes are bucketed on the cross axis, so a query only scans the boxes
+    of the buckets within reach of its own cross extent, and within each of
+    them stops as soon as no remaining box can beat the best one found.
+
+    Args:
+      boxes: List of (x1, y1, x2, y2) tuples.
+      lo, hi: Tuple positions of the main axis coordinates.
+      cross_lo, cross_hi: Tuple positions of the cross axis coordinates.
+      cross_size: Screen size on the cross axis, used for normalization.
+      margin: Normalized cross axis margin.
+      adjacent_threshold: See `pixel_distance`.
+
+    Returns:
+      A list holding the neighbor index (or None) of every box.
+    """
+    order = sorted(range(len(boxes)), key=lambda i: boxes[i][lo])
+    bucket_size, reach = _cross_reach(cross_size, margin, adjacent_threshold)
+    buckets = {
+        k: (members, [boxes[i][lo] for i in members])
+        for k, members in _cross_buckets(
+            boxes, order, cross_lo, cross_hi, bucket_size).items()}
+    result = [None] * len(boxes)
+    for a, box in enumerate(boxes):
+        a_lo, a_hi = box[lo], box[hi]
+        best_dist = best_idx = None
+        for k in _bucket_range(box, cross_lo, cross_hi, bucket_size, reach):
+            if k not in buckets:
+                continue
+            members, starts = buckets[k]
+            # A positive distance needs b's start no earlier than a's end
+            # minus the adjacency threshold; past that it only grows with
+            # b's start.
+            for j in range(bisect.bisect_left(starts, a_hi - adjacent_threshold),
+                           len(members)):
+                if best_dist is not None and starts[j] - a_hi > best_dist:
+                    break
+                b = members[j]
+                if b == a:
+                    continue
+                other = boxes[b]
+                dist = pixel_distance(a_lo, a_hi, other[lo], other[hi],
+                                      adjacent_threshold)
+                if dist <= 0:
+                    continue
+                cross_dist = pixel_distance(box[cross_lo], box[cross_hi],
+                                            other[cross_lo], other[cross_hi],
+                                            adjacent_threshold)
+                if abs(float(cross_dist) / cross_size) >= margin:
+                    continue
+                if best_dist is None or (dist, b) < (best_dist, best_idx):
+                    best_dist, best_idx = dist, b
+        result[a] = best_idx
+    return result
+
+
+def _sweep_before(boxes, lo, hi, cross_lo, cross_hi, cross_size, margin,
+                  adjacent_threshold):
+    """Finds, for every box, the closest box before it on the main axis.
+
+    Mirror image of `_sweep_after`: the distance has to be negative and the
+    largest one wins, ties going to the smaller index like np.argmax.
+    """
+    order = sorted(range(len(boxes)), key=lambda i: -boxes[i][hi])
+    bucket_size, reach = _cross_reach(cross_size, margin, adjacent_threshold)
+    buckets = {
+        k: (members, [-boxes[i][hi] for i in members])
+        for k, members in _cross_buckets(
+            boxes, order, cross_lo, cross_hi, bucket_size).items()}
+    result = [None] * len(boxes)
+    for a, box in enumerate(boxes):
+        a_lo, a_hi = box[lo], box[hi]
+        best_dist = best_idx = None
+        for k in _bucket_range(box, cross_lo, cross_hi, bucket_size, reach):
+            if k not in buckets:
+                continue
+            members, neg_ends = buckets[k]
+            # A negative distance needs b's end no later than a's start plus
+            # the adjacency threshold; before that it only shrinks with b's
+            # end.
+            for j in range(bisect.bisect_left(neg_ends, -(a_lo + adjacent_threshold)),
+                           len(members)):
+                if best_dist is not None and -neg_ends[j] - a_lo < best_dist:
+                    break
+                b = members[j]
+                if b == a:
+                    continue
+                other = boxes[b]
+                dist = pixel_distance(a_lo, a_hi, other[lo], other[hi],
+                                      adjacent_threshold)
+                if dist >= 0:
+                    continue
+                cross_dist = pixel_distance(box[cross_lo], box[cross_hi],
+                                            other[cross_lo], other[cross_hi],
+                                            adjacent_threshold)
+                if abs(float(cross_dist) / cross_size) >= margin:
+                    continue
+                if best_dist is None or dist > best_dist or (
+                        dist == best_dist and b < best_idx):
+                    best_dist, best_idx = dist, b
+        result[a] = best_idx
+    return result
+
+
+def build_neighbor_indices(
+        boxes,
+        screen_width,
+        screen_height,
+        horizontal_margin=config.NORM_HORIZONTAL_NEIGHBOR_MARGIN,
+        vertical_margin=config.NORM_VERTICAL_NEIGHBOR_MARGIN,
+        adjacent_threshold=config.ADJACENT_BOUNDING_BOX_THRESHOLD):
+    """Builds the single direction neighbors of every leaf in one pass.
+
+    If B is A's bottom/top 'single direction neighbor', it means B is the
+    vertical closest neighbor among all object whose horizontal distance to A is
+    smaller than margin threshold. Same with left/right direction neighbor.
+    The dict keys keep the naming of the original adjacency matrix code: the
+    closest box below is stored under 'top', the one above under 'bottom',
+    the one to the right under 'left' and the one to the left under 'right'.
+
+    Args:
+      boxes: Sequence of (x1, y1, x2, y2) boxes, or an (N, 4) array.
+      screen_width, screen_height: Screen width and height.
+      horizontal_margin: Normalized horizontal margin for vertical neighbors.
+      vertical_margin: Normalized vertical margin for horizontal neighbors.
+      adjacent_threshold: See `pixel_distance`.
+
+    Returns:
+      A list with one dict per box, mapping direction to neighbor index.
+    """
+    if hasattr(boxes, 'tolist'):
+        boxes = boxes.tolist()
+    boxes = [tuple(box) for box in boxes]
+    directions = (
+        ('top', _sweep_after(boxes, 1, 3, 0, 2, screen_width,
+                             horizontal_margin, adjacent_threshold)),
+        ('bottom', _sweep_before(boxes, 1, 3, 0, 2, screen_width,
+                                 horizontal_margin, adjacent_threshold)),
+        ('left', _sweep_after(boxes, 0, 2, 1, 3, screen_height,
+                              vertical_margin, adjacent_threshold)),
+        ('right', _sweep_before(boxes, 0, 2, 1, 3, screen_height,
+                                vertical_margin, adjacent_threshold)),
+    )
+    neighbors = [{} for _ in boxes]
+    for direction, indices in directions:
+        for neighbor_dict, idx in zip(neighbors, indices):
+            if idx is not None:
+                neighbor_dict[direction] = idx
+    return neighbors
+
+
+def _closest(boxes, a, lo, hi, cross_lo, cross_hi, cross_size, margin,
+             adjacent_threshold):
+    """Finds the closest boxes before and after box a on the main axis.
+
+    The same as `_sweep_before` and `_sweep_after` for one box, with one
+    scan over all the boxes.
+
+    Returns:
+      The index (or None) of the box before a and of the box after it.
+    """
+    box = boxes[a]
+    before = after = None
+    for b, other in enumerate(boxes):
+        if b == a:
+            continue
+        dist = pixel_distance(box[lo], box[hi], other[lo], other[hi],
+                              adjacent_threshold)
+        if dist == 0:
+            continue
+        cross_dist = pixel_distance(box[cross_lo], box[cross_hi],
+                                    other[cross_lo], other[cross_hi],
+                                    adjacent_threshold)
+        if abs(float(cross_dist) / cross_size) >= margin:
+            continue
+        # Strict comparisons keep the smaller index on ties.
+        if dist > 0:
+            if after is None or dist < after[0]:
+                after = (dist, b)
+        elif before is None or dist > before[0]:
+            before = (dist, b)
+    return (None if before is None else before[1],
+            None if after is None else after[1])
+
+
+def neighbor_indices(
+        index,
+        boxes,
+        screen_width,
+        screen_height,
+        horizontal_margin=config.NORM_HORIZONTAL_NEIGHBOR_MARGIN,
+        vertical_margin=config.NORM_VERTICAL_NEIGHBOR_MARGIN,
+        adjacent_threshold=config.ADJACENT_BOUNDING_BOX_THRESHOLD):
+    """Builds the single direction neighbors of one box.
+
+    The same as `build_neighbor_indices(boxes, ...)[index]`, in time linear
+    in the number of boxes.
+
+    Args:
+      index: Position of the box in `boxes`.
+      boxes: Sequence of (x1, y1, x2, y2) boxes, or an (N, 4) array.
+      screen_width, screen_height: Screen width and height.
+      horizontal_margin: Normalized horizontal margin for vertical neighbors.
+      vertical_margin: Normalized vertical margin for horizontal neighbors.
+      adjacent_threshold: See `pixel_distance`.
+
+    Returns:
+      A dict mapping direction to neighbor index.
+    """
+    if hasattr(boxes, 'tolist'):
+        boxes = boxes.tolist()
+    above, below = _closest(boxes, index, 1, 3, 0, 2, screen_width,
+                            horizontal_margin, adjacent_threshold)
+    left, right = _closest(boxes, index, 0, 2, 1, 3, screen_height,
+                           vertical_margin, adjacent_threshold)
+    # Directions are named like in build_neighbor_indices.
+    directions = (('top', below), ('bottom', above), ('left', right),
+                  ('right', left))
+    return {direction: neighbor for direction, neighbor in directions
+            if neighbor is not None}
@@ -0,0 +1,69 @@
+"""Cheap detection of screens that did not change between two steps.
+
+Fetching and encoding the view hierarchy is the most expensive part of a
+get_state, while the screen often looks exactly as it did on the previous
+step. `ScreenChangeDetector` reduces a screenshot to a small grid of block
+means, which decodes and compares in a few milliseconds, and reports a
+change when any block moved by more than a threshold. Taking the largest
+block difference rather than an average keeps small changes, like a
+toggled checkbox, from being diluted by the rest of the screen. Regions
+that change on their own, like the status bar clock, are left out.
+"""
+
+import math
+
+import attr
+import cv2
+import numpy as np
+
+import cognisim.utils.constants as config
+from cognisim.device import set_of_mark
+
+
+@attr.s(slots=True, frozen=True)
+class ScreenChangeDetector(object):
+    """Compares screenshots by the gray level means of a grid of blocks.
+
+    Attributes:
+      threshold: Largest difference of a block mean, in gray levels (0-255),
+        still considered unchanged.
+      excluded_regions: (x1, y1, x2, y2) regions ignored, as fractions of the
+        screen width and height, e.g. (0, 0, 1, 0.05) for the status bar.
+      grid: (columns, rows) of blocks.
+    """
+    threshold = attr.ib(default=config.SCREEN_CHANGE_THRESHOLD)
+    excluded_regions = attr.ib(default=(), converter=tuple)
+    grid = attr.ib(default=config.SCREEN_CHANGE_GRID)
+
+    def signature(self, screenshot):
+        """Returns the block means of an encoded screenshot or a BGR array.
+
+        Blocks overlapping an excluded region are NaN.
+        """
+        if isinstance(screenshot, np.ndarray):
+            gray = cv2.cvtColor(screenshot, cv2.COLOR_BGR2GRAY)
+        elif set_of_mark.detect_format(screenshot) == 'jpeg':
+            # JPEG frames decode at a quarter of the size for a fraction of
+            # the cost. Other formats are reduced by dropping pixels rather
+            # than averaging them, which misses thin changes
+            gray = cv2.imdecode(np.frombuffer(screenshot, np.uint8),
+                                cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        else:
+            gray = cv2.imdecode(np.frombuffer(screenshot, np.uint8),
+                                cv2.IMREAD_GRAYSCALE)
+        blocks = cv2.resize(gray, self.grid, interpolation=cv2.INTER_AREA).astype(np.float32)
+        rows, columns = blocks.shape
+        for x1, y1, x2, y2 in self.excluded_regions:
+            blocks[math.floor(y1 * rows):math.ceil(y2 * rows),
+                   math.floor(x1 * columns):math.ceil(x2 * columns)] = np.nan
+        return blocks
+
+    def difference(self, previous, current):
+        """Returns the largest block difference of two signatures."""
+        diff = np.abs(current - previous)
+        if np.isnan(diff).all():
+            return 0.0
+        return float(np.nanmax(diff))
+
+    def changed(self, previous, current):
+        return self.difference(previous, current) > self.threshold
@@ -0,0 +1,120 @@
+"""Downscaled screenshots and the mapping of their coordinates to the device.
+
+Vision models are billed and uploaded by the pixel, and ground a step just
+as well on a half size screenshot. A model looking at a downscaled image
+answers in image coordinates though, while taps and swipes take device
+coordinates: pixels on Android, points on iOS, whose screenshots are 2-3x
+larger than the screen. `ScreenTransform` maps between the two, with sizes
+taken from the actual screenshot, and on iOS the window, rather than fixed
+constants.
+"""
+
+import attr
+import cv2
+import numpy as np
+
+from cognisim.device import set_of_mark
+
+
+@attr.s(slots=True, frozen=True)
+class ScreenTransform(object):
+    """Maps image coordinates to device coordinates and back.
+
+    Attributes:
+      image_width: Width of the image shown to the model.
+      image_height: Height of the image shown to the model.
+      device_width: Width of the screen in tap coordinates, which are also
+        the coordinates of the view hierarchy bounds.
+      device_height: Height of the screen in tap coordinates.
+    """
+    image_width = attr.ib()
+    image_height = attr.ib()
+    device_width = attr.ib()
+    device_height = attr.ib()
+
+    @classmethod
+    def identity(cls, width, height):
+        return cls(width, height, width, height)
+
+    @property
+    def scale_x(self):
+        """Device units per image pixel, horizontally."""
+        return self.device_width / self.image_width
+
+    @property
+    def scale_y(self):
+        """Device units per image pixel, vertically."""
+        return self.device_height / self.image_height
+
+    def to_device(self, x, y):
+        """Returns the device point under an image point, clamped to the screen."""
+        x = min(max(round(x * self.scale_x), 0), self.device_width - 1)
+        y = min(max(round(y * self.scale_y), 0), self.device_height - 1)
+        return x, y
+
+    def to_image(self, x, y):
+        """Returns the image point over a device point."""
+        return round(x / self.scale_x), round(y / self.scale_y)
+
+    def boxes_to_image(self, boxes):
+        """Maps an (N, 4) array of (x1, y1, x2, y2) device boxes to the image."""
+        scale = np.array([self.scale_x, self.scale_y] * 2)
+        return np.rint(np.asarray(boxes) / scale).astype(np.int64)
+
+
+def target_scale(width, height, image_size=None, image_scale=None):
+    """Returns the factor that fits a width x height screenshot to a target.
+
+    Args:
+      width: Screenshot width.
+      height: Screenshot height.
+      image_size: (width, height) to fit in, keeping the aspect ratio.
+      image_scale: Scale factor, e.g. 0.5 for half the size.
+
+    Returns:
+      The smaller factor of both targets, never above 1.
+    """
+    scale = 1.0
+    if image_scale is not None:
+        if image_scale <= 0:
+            raise ValueError('image_scale must be positive, got {}'.format(image_scale))
+        scale = min(scale, image_scale)
+    if image_size is not None:
+        max_width, max_height = image_size
+        scale = min(scale, max_width / width, max_height / height)
+    return scale
+
+
+def downscale_screenshot(screenshot, device_size=None, image_size=None, image_scale=None,
+                         image_format=None, quality=None):
+    """Downscales a screenshot and returns the transform of its coordinates.
+
+    Args:
+      screenshot: The encoded screenshot.
+      device_size: (width, height) of the screen in tap coordinates. Defaults
+        to the size of the screenshot, for platforms tapping in its pixels.
+      image_size: (width, height) the image must fit in.
+      image_scale: Scale factor of the image.
+      image_format: 'png', 'jpeg' or 'webp', see set_of_mark.encode_image.
+        Defaults to the format of the screenshot, e.g. jpeg for MJPEG
+        frames, or png when it is not known.
+      quality: 1-100 for jpeg and webp.
+
+    Returns:
+      The encoded image and its ScreenTransform. The screenshot is returned
+      as is, without decoding it, when it needs no downscaling.
+    """
+    width, height = set_of_mark.image_dimensions(screenshot)
+    if device_size is None:
+        device_size = (width, height)
+    scale = target_scale(width, height, image_size, image_scale)
+    if scale >= 1.0:
+        return screenshot, ScreenTransform(width, height, *device_size)
+    img = set_of_mark.decode_image(screenshot)
+    width = max(1, round(width * scale))
+    height = max(1, round(height * scale))
+    img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+    if image_format is None:
+        image_format = set_of_mark.detect_format(screenshot) or 'png'
+    encoded = set_of_mark.encode_image(img, image_format, quality)
+    return encoded.data, ScreenTransform(width, height, *device_size)
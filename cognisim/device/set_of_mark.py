@@ -0,0 +1,302 @@
+"""Set-of-mark screenshots: the element ids of an encoded UI on the screen.
+
+Every labelled element gets a red frame and its id in white on black, so a
+model can refer to the elements of the text encoding by looking at the
+image. `render` selects the elements with one NumPy pass over their boxes,
+reuses the label bitmaps of earlier frames and encodes the result straight
+to the requested format:
+
+  png   Lossless, but the encode dominates the cost of a step.
+  jpeg  About 15x faster to encode than png at 1080x1920.
+  webp  Smallest, when OpenCV is built with it.
+"""
+
+import base64
+import functools
+
+import attr
+import cv2
+import numpy as np
+
+import cognisim.utils.constants as config
+
+# Elements smaller than this many pixels are not labelled.
+MIN_LABELLED_AREA = 3000
+
+_FRAME_COLOR = (0, 0, 255)
+_BOUNDING_BOX_COLOR = (128, 0, 128)
+_FRAME_THICKNESS = 5
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_FONT_SCALE = 2
+_FONT_THICKNESS = 4
+
+# {format: (file extension, mime type, quality flag)}
+_FORMATS = {
+    'png': ('.png', 'image/png', None),
+    'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+# Format used when OpenCV cannot encode the requested one.
+_FALLBACK_FORMAT = 'jpeg'
+
+
+@attr.s(slots=True, frozen=True)
+class EncodedImage(object):
+    """An encoded image and how it was encoded.
+
+    Attributes:
+      data: The encoded bytes.
+      format: 'png', 'jpeg' or 'webp'.
+      scale: Image size relative to the screenshot it was drawn on.
+    """
+    data = attr.ib()
+    format = attr.ib()
+    scale = attr.ib(default=1.0)
+
+    @property
+    def mime_type(self):
+        return _FORMATS[self.format][1]
+
+    def data_url(self):
+        """Returns the image as a base64 data url, e.g. for a chat message."""
+        return 'data:{};base64,{}'.format(
+            self.mime_type, base64.b64encode(self.data).decode('ascii'))
+
+
+def decode_image(image):
+    """Returns a BGR array of encoded image bytes, or the array itself."""
+    if isinstance(image, np.ndarray):
+        return image
+    return cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR)
+
+
+def detect_format(image):
+    """Returns the format of encoded image bytes, None if it is not known."""
+    if image.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if image.startswith(b'\xff\xd8'):
+        return 'jpeg'
+    if image.startswith(b'RIFF') and image[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+# JPEG start of frame markers, which carry the image size. C4, C8 and CC
+# are other markers in the same range.
+_JPEG_FRAME_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _jpeg_dimensions(image):
+    index = 2
+    while index + 9 <= len(image) and image[index] == 0xFF:
+        marker = image[index + 1]
+        if marker == 0xFF:
+            # Fill byte
+            index += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length
+            index += 2
+            continue
+        if marker == 0xE1 and image[index + 4:index + 8] == b'Exif':
+            # May rotate the decoded image
+            return None
+        if marker in _JPEG_FRAME_MARKERS:
+            return (int.from_bytes(image[index + 7:index + 9], 'big'),
+                    int.from_bytes(image[index + 5:index + 7], 'big'))
+        index += 2 + int.from_bytes(image[index + 2:index + 4], 'big')
+    return None
+
+
+def image_dimensions(image):
+    """Returns the (width, height) of encoded image bytes or a BGR array.
+
+    The size of png and jpeg bytes is read from their header, other images
+    are decoded.
+    """
+    if isinstance(image, np.ndarray):
+        height, width = image.shape[:2]
+        return width, height
+    image_format = detect_format(image)
+    dimensions = None
+    if image_format == 'png' and image[12:16] == b'IHDR':
+        dimensions = (int.from_bytes(image[16:20], 'big'),
+                      int.from_bytes(image[20:24], 'big'))
+    elif image_format == 'jpeg':
+        dimensions = _jpeg_dimensions(image)
+    if dimensions is None:
+        height, width = decode_image(image).shape[:2]
+        dimensions = (width, height)
+    return dimensions
+
+
+def encode_image(img, image_format='png', quality=None):
+    """Encodes a BGR array.
+
+    Args:
+      img: The image array.
+      image_format: 'png', 'jpeg' or 'webp'.
+      quality: 1-100 for jpeg and webp, ignored for png. Defaults to
+        constants.SET_OF_MARK_QUALITY.
+
+    Returns:
+      An EncodedImage, in the fallback format if OpenCV cannot encode the
+      requested one.
+
+    Raises:
+      ValueError: If the format is unknown.
+    """
+    if image_format not in _FORMATS:
+        raise ValueError('Invalid image format {!r}. Expected one of: {}.'.format(
+            image_format, ', '.join(sorted(_FORMATS))))
+    extension, _, quality_flag = _FORMATS[image_format]
+    params = []
+    if quality_flag is not None:
+        params = [quality_flag, quality or config.SET_OF_MARK_QUALITY]
+    try:
+        ok, encoded = cv2.imencode(extension, img, params)
+    except cv2.error:
+        ok = False
+    if not ok:
+        if image_format == _FALLBACK_FORMAT:
+            raise ValueError('Could not encode the image as ' + image_format)
+        return encode_image(img, _FALLBACK_FORMAT, quality)
+    return EncodedImage(encoded.tobytes(), image_format)
+
+
+def labelled_elements(ui, min_area=MIN_LABELLED_AREA):
+    """Returns the ids and boxes of the elements to label.
+
+    Elements of at most `min_area` pixels and elements left out of a
+    budgeted encoding, which have no id in the text, are not labelled.
+
+    Returns:
+      An int array of ids and an (N, 4) int array of their boxes.
+    """
+    ids = np.fromiter(ui.elements, dtype=np.int64, count=len(ui.elements))
+    boxes = np.array([
+        (ele.bounding_box.x1, ele.bounding_box.y1,
+         ele.bounding_box.x2, ele.bounding_box.y2)
+        for ele in ui.elements.values()], dtype=np.int64).reshape(-1, 4)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = areas > min_area
+    dropped_ids = getattr(ui, 'dropped_ids', ())
+    if len(dropped_ids):
+        keep &= ~np.isin(ids, dropped_ids)
+    return ids[keep], boxes[keep]
+
+
+@functools.lru_cache(maxsize=1024)
+def _label_bitmap(text):
+    """Renders a label once, ids repeat from frame to frame.
+
+    Returns:
+      The text coverage (0-255, the strokes are antialiased), the offset of
+      the text origin in it, and the text width and height of the label
+      background.
+    """
+    (width, height), _ = cv2.getTextSize(text, _FONT, _FONT_SCALE, 2)
+    (ink_width, ink_height), baseline = cv2.getTextSize(
+        text, _FONT, _FONT_SCALE, _FONT_THICKNESS)
+    # The strokes reach past the text size by up to their thickness.
+    margin = _FONT_THICKNESS * 2
+    origin = (margin, margin + ink_height)
+    canvas = np.zeros((ink_height + baseline + 2 * margin,
+                       ink_width + 2 * margin), np.uint8)
+    cv2.putText(canvas, text, origin, _FONT, _FONT_SCALE, 255, _FONT_THICKNESS)
+    canvas.flags.writeable = False
+    return canvas, origin, width, height
+
+
+def _blend_white(img, coverage, x, y):
+    """Blends white into img by `coverage`, with its top-left corner at (x, y).
+
+    Rounds like cv2.putText, so the result is the same as drawing the text.
+    """
+    height, width = img.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2 = min(x + coverage.shape[1], width)
+    y2 = min(y + coverage.shape[0], height)
+    if x1 >= x2 or y1 >= y2:
+        return
+    alpha = coverage[y1 - y:y2 - y, x1 - x:x2 - x]
+    inked = alpha > 0
+    region = img[y1:y2, x1:x2]
+    background = region[inked].astype(np.int32)
+    region[inked] = background + (
+        (255 - background) * alpha[inked, None].astype(np.int32) + 127) // 255
+
+
+def draw_set_of_mark(img, ids, boxes, position='top-left'):
+    """Draws the frames and labels of elements on a BGR array, in place.
+
+    Args:
+      img: The screenshot array.
+      ids: The element ids.
+      boxes: The (x1, y1, x2, y2) box of every element.
+      position: Where the label goes, 'top-left' or 'center'.
+    """
+    for _id, (x1, y1, x2, y2) in zip(ids.tolist(), boxes.tolist()):
+        cv2.rectangle(img, (x1, y1), (x2, y2), _FRAME_COLOR, _FRAME_THICKNESS)
+        coverage, (origin_x, origin_y), text_width, text_height = _label_bitmap(
+            str(_id))
+        if position == 'top-left':
+            text_x = x1
+            text_y = y1 + text_height
+        else:  # Default to center
+            text_x = (x1 + x2) // 2 - text_width // 2
+            text_y = (y1 + y2) // 2 + text_height // 2
+        # Black background behind the text
+        cv2.rectangle(img, (text_x, text_y - text_height),
+                      (text_x + text_width, text_y), (0, 0, 0),
+                      thickness=cv2.FILLED)
+        # White text
+        _blend_white(img, coverage, text_x - origin_x, text_y - origin_y)
+
+
+def draw_bounding_box(image, bounds):
+    """Returns the png bytes of a screenshot with one element framed.
+
+    Args:
+      image: The screenshot as encoded bytes or a BGR array.
+      bounds: (x1, y1, x2, y2) of the element.
+    """
+    img = decode_image(image)
+    if img is image:
+        img = img.copy()
+    x1, y1, x2, y2 = (int(bound) for bound in bounds[:4])
+    cv2.rectangle(img, (x1, y1), (x2, y2), _BOUNDING_BOX_COLOR, 5)
+    return encode_image(img, 'png').data
+
+
+def render(ui, image, position='top-left', image_format='png', quality=None,
+           scale=1.0, min_area=MIN_LABELLED_AREA, transform=None):
+    """Renders the set-of-mark screenshot of an encoded UI.
+
+    Args:
+      ui: The encoded UI, see BaseUI.encoding.
+      image: The screenshot as encoded bytes or a BGR array, which is left
+        unchanged.
+      position: Where the labels go, 'top-left' or 'center'.
+      image_format: 'png', 'jpeg' or 'webp'.
+      quality: 1-100 for jpeg and webp.
+      scale: Downscales the rendered image, e.g. 0.5 for half the size.
+      min_area: Elements of at most this many pixels are not labelled.
+      transform: The ScreenTransform of an image downscaled by get_state,
+        the element boxes are mapped onto it.
+
+    Returns:
+      An EncodedImage.
+    """
+    img = decode_image(image)
+    if img is image:
+        img = img.copy()
+    ids, boxes = labelled_elements(ui, min_area)
+    if transform is not None:
+        boxes = transform.boxes_to_image(boxes)
+    draw_set_of_mark(img, ids, boxes, position)
+    if scale != 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale,
+                         interpolation=cv2.INTER_AREA)
+    encoded = encode_image(img, image_format, quality)
+    return attr.evolve(encoded, scale=scale)
@@ -0,0 +1,194 @@
+"""Uniform grid spatial index over the bounding boxes of a view hierarchy.
+
+Boxes are bucketed into square cells once, so hit tests, rectangle queries
+and nearest element lookups only look at the boxes of the few cells around
+the query instead of scanning every element. Box bounds are inclusive, like
+the click hit test of `ViewHierarchy.dedup`.
+"""
+
+import collections
+import math
+
+import numpy as np
+
+# Boxes spanning more cells than this, e.g. full screen containers, are not
+# bucketed but checked by every query.
+_MAX_CELLS_PER_BOX = 64
+
+
+class SpatialIndex(object):
+    """Answers point, rectangle and nearest queries over a GeometryTable.
+
+    Results are indices into the table, in ascending order unless stated.
+    """
+
+    def __init__(self, geometry, cell_size=None):
+        """Constructor.
+
+        Args:
+          geometry: GeometryTable of the indexed boxes.
+          cell_size: Side of the square grid cells in pixels. Defaults to a
+            size giving about one box per cell.
+        """
+        self._boxes = geometry.boxes.astype(np.int64)
+        # Candidate sets are small, so they are tested on plain tuples.
+        self._rows = geometry.rows()
+        self._cells = {}
+        self._large = []
+        if not len(self._boxes):
+            self._origin = (0, 0)
+            self._cell_size = 1
+            self._shape = (0, 0)
+            return
+        x1, y1, x2, y2 = self._boxes.T
+        origin_x, origin_y = int(x1.min()), int(y1.min())
+        width = int(x2.max()) - origin_x + 1
+        height = int(y2.max()) - origin_y + 1
+        if cell_size is None:
+            cell_size = math.sqrt(width * height / len(self._boxes))
+        self._cell_size = max(1, int(math.ceil(cell_size)))
+        self._origin = (origin_x, origin_y)
+        self._shape = (width // self._cell_size + 1,
+                       height // self._cell_size + 1)
+
+        cx1 = (x1 - origin_x) // self._cell_size
+        cy1 = (y1 - origin_y) // self._cell_size
+        cx2 = (x2 - origin_x) // self._cell_size
+        cy2 = (y2 - origin_y) // self._cell_size
+        buckets = collections.defaultdict(list)
+        large = []
+        for index, (a, b, c, d) in enumerate(
+                zip(cx1.tolist(), cy1.tolist(), cx2.tolist(), cy2.tolist())):
+            if (c - a + 1) * (d - b + 1) > _MAX_CELLS_PER_BOX:
+                large.append(index)
+                continue
+            for cx in range(a, c + 1):
+                for cy in range(b, d + 1):
+                    buckets[cx, cy].append(index)
+        self._cells = dict(buckets)
+        self._large = large
+
+    def __len__(self):
+        return len(self._boxes)
+
+    def _cell_of(self, x, y):
+        return ((int(x) - self._origin[0]) // self._cell_size,
+                (int(y) - self._origin[1]) // self._cell_size)
+
+    def _candidates(self, cx1, cy1, cx2, cy2):
+        """Returns the sorted indices of the boxes in a range of cells."""
+        cx1, cy1 = max(cx1, 0), max(cy1, 0)
+        cx2, cy2 = min(cx2, self._shape[0] - 1), min(cy2, self._shape[1] - 1)
+        if cx1 == cx2 and cy1 == cy2 and not self._large:
+            return self._cells.get((cx1, cy1), [])
+        found = set(self._large)
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                found.update(self._cells.get((cx, cy), ()))
+        return sorted(found)
+
+    def elements_at(self, x, y):
+        """Returns the indices of all boxes containing the point (x, y)."""
+        cx, cy = self._cell_of(x, y)
+        rows = self._rows
+        return [index for index in self._candidates(cx, cy, cx, cy)
+                if rows[index][0] <= x <= rows[index][2] and
+                rows[index][1] <= y <= rows[index][3]]
+
+    def element_at(self, x, y):
+        """Returns the index of the box under the point (x, y), or None.
+
+        When boxes overlap the smallest one, i.e. the most specific element,
+        wins; ties go to the lowest index.
+        """
+        hits = self.elements_at(x, y)
+        if not hits:
+            return None
+        rows = self._rows
+        return min(hits, key=lambda index: (
+            (rows[index][2] - rows[index][0]) * (rows[index][3] - rows[index][1]),
+            index))
+
+    def elements_in_rect(self, x1, y1, x2, y2, contained=False):
+        """Returns the indices of the boxes overlapping a rectangle.
+
+        Args:
+          x1, y1, x2, y2: The query rectangle.
+          contained: Only return boxes lying entirely inside the rectangle.
+        """
+        cx1, cy1 = self._cell_of(x1, y1)
+        cx2, cy2 = self._cell_of(x2, y2)
+        rows = self._rows
+        if contained:
+            return [index for index in self._candidates(cx1, cy1, cx2, cy2)
+                    if x1 <= rows[index][0] and rows[index][2] <= x2 and
+                    y1 <= rows[index][1] and rows[index][3] <= y2]
+        return [index for index in self._candidates(cx1, cy1, cx2, cy2)
+                if rows[index][0] <= x2 and x1 <= rows[index][2] and
+                rows[index][1] <= y2 and y1 <= rows[index][3]]
+
+    def distance(self, x, y, index):
+        """Returns the distance from (x, y) to a box, 0 inside the box."""
+        x1, y1, x2, y2 = self._rows[index]
+        return math.hypot(max(x1 - x, x - x2, 0), max(y1 - y, y - y2, 0))
+
+    def nearest(self, x, y, k=1, max_distance=None):
+        """Returns the indices of the k boxes closest to the point (x, y).
+
+        Cells are searched in growing square rings around the point until no
+        unvisited cell can hold a closer box than the current k-th one. Once
+        that visits more cells than there are boxes, e.g. for points far off
+        the indexed area, all boxes are measured at once instead.
+
+        Args:
+          x, y: The query point.
+          k: Number of boxes to return.
+          max_distance: Ignore boxes farther away than this.
+
+        Returns:
+          Up to k indices, closest first, ties broken by lowest index.
+        """
+        if not len(self._boxes) or k <= 0:
+            return []
+        cx, cy = self._cell_of(x, y)
+        width, height = self._shape
+        # Rings beyond this radius lie entirely outside the grid.
+        max_ring = max(abs(cx), abs(cy), abs(cx - width + 1),
+                       abs(cy - height + 1))
+        seen = set(self._large)
+        found = sorted((self.distance(x, y, index), index)
+                       for index in self._large)[:k]
+        visited = 0
+        for ring in range(max_ring + 1):
+            rows = range(max(cx - ring, 0), min(cx + ring, width - 1) + 1)
+            columns = range(max(cy - ring, 0), min(cy + ring, height - 1) + 1)
+            ring_cells = [(i, j) for i in rows for j in columns
+                          if max(abs(i - cx), abs(j - cy)) == ring]
+            visited += len(ring_cells)
+            if visited > len(self._boxes):
+                found = self._nearest_by_scan(x, y, k)
+                break
+            new = {index for cell in ring_cells
+                   for index in self._cells.get(cell, ())} - seen
+            if new:
+                seen.update(new)
+                found.extend((self.distance(x, y, index), index)
+                             for index in new)
+                found.sort()
+                del found[k:]
+            # Boxes in cells of the next rings are at least this far away.
+            reach = ring * self._cell_size
+            if max_distance is not None and reach > max_distance:
+                break
+            if len(found) == k and found[-1][0] <= reach:
+                break
+        return [index for distance, index in found
+                if max_distance is None or distance <= max_distance]
+
+    def _nearest_by_scan(self, x, y, k):
+        """Returns the k closest (distance, index) pairs of all boxes."""
+        x1, y1, x2, y2 = self._boxes.T
+        distances = np.hypot(np.maximum(np.maximum(x1 - x, x - x2), 0),
+                             np.maximum(np.maximum(y1 - y, y - y2), 0))
+        order = np.lexsort((np.arange(len(distances)), distances))[:k]
+        return list(zip(distances[order].tolist(), order.tolist()))
@@ -0,0 +1,106 @@
+"""LRU cache of encoded UI states keyed by a hash of the raw page source."""
+
+import collections
+import hashlib
+import threading
+
+import cognisim.utils.constants as config
+
+
+def hash_page_source(page_source):
+    """Returns a 128-bit digest of a raw page source given as str or bytes."""
+    if isinstance(page_source, str):
+        page_source = page_source.encode('utf-8')
+    return hashlib.blake2b(page_source, digest_size=16).digest()
+
+
+class StateCache(object):
+    """Maps raw page sources to their `(encoded_ui, ui)` pair.
+
+    Entries are evicted least recently used first once either `max_entries`
+    or `max_bytes` is exceeded. `max_bytes` only covers text: the size of an
+    entry is the length of its page source plus its encoded UI. The parsed
+    UI objects are not counted, and take several times as much memory.
+
+    Every hit returns the same `(encoded_ui, ui)` pair. Cached UIs are
+    read-only: calling `encoding` on one again, or changing its elements,
+    changes the state returned by later hits.
+    """
+
+    def __init__(self, max_entries=config.STATE_CACHE_MAX_ENTRIES,
+                 max_bytes=config.STATE_CACHE_MAX_BYTES):
+        """Constructor.
+
+        Args:
+          max_entries: Maximum number of cached states, 0 disables the cache.
+          max_bytes: Maximum total length of the cached page sources and
+            encoded UIs.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        """Total length of the cached page sources and encoded UIs."""
+        return self._size
+
+    def get_or_build(self, page_source, build):
+        """Returns the cached state of `page_source`, building it on a miss.
+
+        Args:
+          page_source: The raw view hierarchy as str or bytes.
+          build: Callable taking `page_source` and returning the
+            `(encoded_ui, ui)` pair to cache.
+
+        Returns:
+          The `(encoded_ui, ui)` pair.
+        """
+        key = hash_page_source(page_source)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # Build outside the lock, so other devices are not serialized on it.
+        state = build(page_source)
+        self._put(key, state, len(page_source) + len(state[0] or ''))
+        return state
+
+    def _put(self, key, state, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (state, size)
+            self._size += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._size > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self):
+        """Drops all cached states and resets the hit/miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Returns the hit/miss counters and current usage as a dict."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'bytes': self._size,
+        }
@@ -0,0 +1,194 @@
+"""Single pass, iterative traversal of view hierarchy element trees.
+
+Trees are either etree elements, see `walk_tree`, or the nested dicts of a
+JSON hierarchy dump, see `walk_json`. The hash functions take the matching
+`*_values` and `*_kind` functions to read the nodes of either.
+"""
+
+import hashlib
+
+import attr
+
+
+@attr.s(slots=True)
+class DomNode(object):
+    """A node visited by `walk_tree` with its position in the tree."""
+    element = attr.ib()
+    depth = attr.ib()
+    preorder_index = attr.ib()
+    postorder_index = attr.ib(default=None)
+    is_leaf = attr.ib(default=True)
+    parent = attr.ib(default=None)
+    # Values propagated down from the ancestors, see `walk_tree`.
+    inherited = attr.ib(default=None)
+
+    @property
+    def dom_location(self):
+        """[depth, preorder-index, postorder-index] of the node."""
+        return [self.depth, self.preorder_index, self.postorder_index]
+
+
+def walk_tree(root, inherit=None):
+    """Visits every node of an element tree once, without recursion.
+
+    Leaf status, depth (number of ancestors), preorder and postorder index are
+    all computed in the same pass, so the cost is linear in the tree size and
+    deep hierarchies cannot hit the interpreter recursion limit. Like the
+    recursive pre/post order walks it replaces, indices count every child
+    node, while only elements without element children are leaves.
+
+    Context from the ancestors, e.g. whether one of them is clickable, is
+    propagated down in the same pass: the children of a node inherit
+    `inherit(node.inherited, node.element)`, the root inherits None.
+
+    Args:
+      root: The etree root element.
+      inherit: Computes what the children of a node inherit, or None.
+
+    Returns:
+      The list of DomNode objects in preorder.
+    """
+    nodes = []
+    postorder_index = 0
+    # Entries are (element, parent, inherited, None) on the way down and
+    # (None, None, None, node) on the way back up, once all children are
+    # visited.
+    stack = [(root, None, None, None)]
+    while stack:
+        element, parent, inherited, finished = stack.pop()
+        if finished is not None:
+            finished.postorder_index = postorder_index
+            postorder_index += 1
+            continue
+        depth = parent.depth + 1 if parent is not None else 0
+        node = DomNode(element, depth, len(nodes),
+                       is_leaf=isinstance(element.tag, str), parent=parent,
+                       inherited=inherited)
+        nodes.append(node)
+        stack.append((None, None, None, node))
+        if len(element):
+            inherited = inherit(inherited, element) if inherit else None
+        for child in reversed(element):
+            if isinstance(child.tag, str):
+                node.is_leaf = False
+            stack.append((child, node, inherited, None))
+    return nodes
+
+
+def walk_json(root, inherit=None):
+    """Visits every node of a JSON hierarchy once, like `walk_tree`.
+
+    Nodes are dicts listing their child nodes under 'children', where null
+    children are skipped. No element tree is built, the DomNode elements are
+    the dicts themselves.
+
+    Args:
+      root: The root node dict.
+      inherit: Computes what the children of a node inherit, or None.
+
+    Returns:
+      The list of DomNode objects in preorder.
+    """
+    nodes = []
+    postorder_index = 0
+    stack = [(root, None, None, None)]
+    while stack:
+        element, parent, inherited, finished = stack.pop()
+        if finished is not None:
+            finished.postorder_index = postorder_index
+            postorder_index += 1
+            continue
+        depth = parent.depth + 1 if parent is not None else 0
+        node = DomNode(element, depth, len(nodes), parent=parent,
+                       inherited=inherited)
+        nodes.append(node)
+        stack.append((None, None, None, node))
+        children = element.get('children')
+        if children:
+            inherited = inherit(inherited, element) if inherit else None
+            for child in reversed(children):
+                if child:
+                    node.is_leaf = False
+                    stack.append((child, node, inherited, None))
+    return nodes
+
+
+def element_values(element):
+    """The tag and attributes of an etree element."""
+    # Names are hashed along with the values: XCUITest leaves out empty
+    # attributes, e.g. `name` or `label`, so the same values may belong to
+    # different attributes.
+    return element.tag, tuple(element.items())
+
+
+def element_kind(element):
+    """The tag and class of an etree element."""
+    return element.tag, element.get('class')
+
+
+def json_values(node):
+    """The attributes of a JSON node, without its children."""
+    return tuple((key, tuple(value) if isinstance(value, list) else value)
+                 for key, value in node.items() if key != 'children')
+
+
+def json_kind(node):
+    """The tag of the nodes of xml dumps and the class of a JSON node."""
+    return 'node', node.get('class')
+
+
+def subtree_hashes(nodes, node_values=element_values):
+    """Computes a Merkle hash of every subtree visited by `walk_tree`.
+
+    A node's hash combines its tag, its attributes and the hashes of its
+    children in order, so identical subtrees hash equally and a change only
+    alters the hashes of the changed nodes and their ancestors. Hashes are
+    built bottom-up in a single pass over the nodes in reverse preorder, where
+    every subtree is finished right before its root is reached. They use the
+    built-in `hash`, so they are only comparable within one process.
+
+    Args:
+      nodes: The preorder list of DomNode objects returned by `walk_tree`.
+      node_values: Returns the hashed values of a node's element.
+
+    Returns:
+      The list of subtree hashes, indexed by preorder index.
+    """
+    hashes = [None] * len(nodes)
+    # (depth, hash) of finished subtrees whose parent is not reached yet. The
+    # children of a node are on top, first child last pushed.
+    finished = []
+    for node in reversed(nodes):
+        child_hashes = []
+        while finished and finished[-1][0] > node.depth:
+            child_hashes.append(finished.pop()[1])
+        node_hash = hash((node_values(node.element), tuple(child_hashes)))
+        hashes[node.preorder_index] = node_hash
+        finished.append((node.depth, node_hash))
+    return hashes
+
+
+def path_hashes(nodes, node_kind=element_kind):
+    """Computes a digest of the DOM path leading to every node of `walk_tree`.
+
+    A node's path combines its parent's path with its tag and `class`
+    attribute. Sibling positions are left out, so inserting or removing a
+    sibling, of any kind, leaves the paths of the others unchanged, and
+    siblings of the same kind share a path. Unlike subtree hashes, paths are
+    blake2b digests, reproducible across processes.
+
+    Args:
+      nodes: The preorder list of DomNode objects returned by `walk_tree`.
+      node_kind: Returns the kind of a node's element, e.g. its tag and class.
+
+    Returns:
+      The list of 8 byte path digests, indexed by preorder index.
+    """
+    hashes = [None] * len(nodes)
+    for node in nodes:
+        parent_hash = (hashes[node.parent.preorder_index]
+                       if node.parent is not None else b'')
+        hashes[node.preorder_index] = hashlib.blake2b(
+            parent_hash + repr(node_kind(node.element)).encode('utf-8'),
+            digest_size=8).digest()
+    return hashes
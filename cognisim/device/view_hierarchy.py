@@ -0,0 +1,717 @@
+"""Platform independent core of the Android and iOS view hierarchies.
+
+`BaseViewHierarchy` extracts the visible leaves of a hierarchy, their
+geometry, DOM locations and hashes. `BaseLeafNode` builds the UI object of a
+leaf, and `BaseUI` sorts, identifies and encodes them. The platform modules
+only subclass the three and map their attributes: Android reads `bounds` and
+`displayed`, iOS reads `x`, `y`, `width`, `height` and `visible`, and each
+fills in its own UI object fields.
+"""
+
+import collections
+import functools
+
+import attr
+from enum import Enum
+from loguru import logger
+from str2bool import str2bool as strtobool
+
+import cognisim.utils.constants as config
+from cognisim.device.budget import select_within_budget
+from cognisim.device.delta import diff_elements, encode_delta
+from cognisim.device.encoders import get_encoder
+from cognisim.device.geometry import GeometryTable
+from cognisim.device.identity import ElementIdentities, identity_keys
+from cognisim.device.lazy import defer
+from cognisim.device.neighbors import (
+    build_neighbor_indices, neighbor_indices, pixel_distance)
+from cognisim.device.spatial_index import SpatialIndex
+from cognisim.device.traversal import (
+    element_kind, element_values, path_hashes, subtree_hashes, walk_tree)
+from cognisim.device.xml_parser import parse_xml
+
+
+class UIObjectGridLocation(Enum):
+    """The on-screen grid location (3x3 grid) of an UI object."""
+    TOP_LEFT = 0
+    TOP_CENTER = 1
+    TOP_RIGHT = 2
+    LEFT = 3
+    CENTER = 4
+    RIGHT = 5
+    BOTTOM_LEFT = 6
+    BOTTOM_CENTER = 7
+    BOTTOM_RIGHT = 8
+
+
+class DomLocationKey(Enum):
+    """Keys of dom location info."""
+    DEPTH = 0
+    PREORDER_INDEX = 1
+    POSTORDER_INDEX = 2
+
+
+@attr.s(slots=True)
+class BoundingBox(object):
+    """The bounding box with horizontal/vertical coordinates of an UI object."""
+    x1 = attr.ib()
+    y1 = attr.ib()
+    x2 = attr.ib()
+    y2 = attr.ib()
+
+
+@functools.lru_cache(maxsize=config.ATTRIBUTE_CACHE_MAX_ENTRIES)
+def parse_bool(value):
+    """Returns str2bool of an attribute value, memoized for the process."""
+    return strtobool(value)
+
+
+def grid_location(bbox, screen_width, screen_height):
+    """Returns the UIObjectGridLocation of the center of a BoundingBox."""
+    geometry = GeometryTable([(bbox.x1, bbox.y1, bbox.x2, bbox.y2)])
+    return UIObjectGridLocation(
+        int(geometry.grid_locations(screen_width, screen_height)[0]))
+
+
+def build_grid_locations(geometry, screen_width, screen_height):
+    """Returns the UIObjectGridLocation of every box in a GeometryTable."""
+    return [UIObjectGridLocation(grid) for grid in
+            geometry.grid_locations(screen_width, screen_height).tolist()]
+
+
+def build_neighbor_pointers(pointers, geometry, screen_width, screen_height,
+                            options=None):
+    """Builds the neighbours of every box in a GeometryTable.
+
+    Only needs the leaf pointers, not the etree elements, so a deferred call
+    does not keep the element tree alive.
+
+    Args:
+      pointers: The `pointer` attribute of every leaf, in table order.
+      geometry: GeometryTable of the leaves.
+      screen_width, screen_height: Screen width and height.
+      options: dict of margins and threshold passed to
+        `build_neighbor_indices`, defaults to the configured ones.
+
+    Returns:
+      A list of neighbour direction to object pointer dicts, one per leaf.
+    """
+    neighbors = build_neighbor_indices(
+        geometry.boxes, screen_width, screen_height, **(options or {}))
+    for neighbor_dict in neighbors:
+        for k, v in neighbor_dict.items():
+            neighbor_dict[k] = pointers[v]
+    return neighbors
+
+
+class BaseLeafNode(object):
+    """A visible leaf of a view hierarchy and its UI object.
+
+    Subclasses build the UI object of their platform in `_new_uiobject` and
+    `_reuse_uiobject`, and read the bounding box of an element in
+    `_build_bounding_box`.
+    """
+
+    # Margins and threshold of the neighbour search, see build_neighbor_indices.
+    neighbor_options = {}
+
+    def __init__(self,
+                 element,
+                 all_elements=None,
+                 dom_location=None,
+                 screen_width=config.SCREEN_WIDTH,
+                 screen_height=config.SCREEN_HEIGHT,
+                 neighbors=None,
+                 bounding_box=None,
+                 grid_location=None,
+                 lazy=False,
+                 template=None,
+                 inherited=None):
+        """Constructor.
+
+        Args:
+          element: The leaf element.
+          all_elements: All the leaf elements of the view hierarchy.
+          dom_location: [depth, preorder-index, postorder-index] of element.
+          screen_width: The width of the screen associated with the element.
+          screen_height: The height of the screen associated with the element.
+          neighbors: Precomputed neighbours of the element. When omitted they
+            are built from `all_elements`.
+          bounding_box: Precomputed BoundingBox of the element.
+          grid_location: Precomputed UIObjectGridLocation of the element.
+          lazy: Defer the word sequence, grid location and neighbours until
+            they are first read.
+          template: UI object of a leaf with identical attributes from an
+            earlier snapshot. Its attribute derived fields are reused, the
+            ones depending on the element's position are rebuilt.
+          inherited: What the element inherits from its ancestors, see
+            BaseViewHierarchy.inherit.
+        """
+        assert self._is_leaf(element)
+        self.element = element
+        self._inherited = inherited
+        self._screen_width = screen_width
+        self._screen_height = screen_height
+        bbox = bounding_box if bounding_box is not None else \
+            self._build_bounding_box(element)
+        if grid_location is None:
+            grid_location = defer(lazy, self._build_grid_location, bbox)
+        if neighbors is None:
+            neighbors = defer(lazy, self._build_neighbors, element, all_elements)
+        if template is not None:
+            self.uiobject = self._reuse_uiobject(
+                element, template, grid_location, dom_location, neighbors)
+        else:
+            self.uiobject = self._new_uiobject(
+                element, bbox, grid_location, dom_location, neighbors, lazy)
+
+    def _new_uiobject(self, element, bbox, grid_location, dom_location,
+                      neighbors, lazy):
+        """Returns the UI object of the element."""
+        raise NotImplementedError
+
+    def _reuse_uiobject(self, element, template, grid_location, dom_location,
+                        neighbors):
+        """Returns the UI object of the element from the one of an earlier
+        snapshot, with the given position dependent fields."""
+        raise NotImplementedError
+
+    def _is_leaf(self, element):
+        return not len(element)
+
+    def _build_bounding_box(self, element):
+        """Returns the BoundingBox of an element."""
+        raise NotImplementedError
+
+    def _pointer(self, element):
+        return element.get('pointer')
+
+    def _build_grid_location(self, bbox):
+        return grid_location(bbox, self._screen_width, self._screen_height)
+
+    def _build_neighbors(self, element, all_elements):
+        """Builds the neighbours of the element among all the leaf elements.
+
+        Only used when they are not precomputed, see
+        BaseViewHierarchy.get_leaf_nodes. Scans the other leaves once.
+        """
+        if all_elements is None:
+            return None
+        index = next(i for i, other in enumerate(all_elements)
+                     if other is element)
+        boxes = [attr.astuple(self._build_bounding_box(other))
+                 for other in all_elements]
+        neighbors = neighbor_indices(
+            index, boxes, self._screen_width, self._screen_height,
+            **self.neighbor_options)
+        return {direction: self._pointer(all_elements[neighbor])
+                for direction, neighbor in neighbors.items()}
+
+    def normalized_pixel_distance(self, other_node):
+        """Calculates normalized pixel distance between this node and other node.
+
+        Args:
+          other_node: Another leaf node of the same view hierarchy.
+
+        Returns:
+          Normalized pixel distance on both horizontal and vertical direction.
+        """
+        box1 = self.uiobject.bounding_box
+        box2 = other_node.uiobject.bounding_box
+        threshold = self.neighbor_options.get(
+            'adjacent_threshold', config.ADJACENT_BOUNDING_BOX_THRESHOLD)
+        h_distance = pixel_distance(box1.x1, box1.x2, box2.x1, box2.x2,
+                                    threshold)
+        v_distance = pixel_distance(box1.y1, box1.y2, box2.y1, box2.y2,
+                                    threshold)
+        return (float(h_distance) / self._screen_width,
+                float(v_distance) / self._screen_height)
+
+    def dom_distance(self, other_node):
+        """Calculates dom distance between this node and other node.
+
+        Only supported for element trees.
+
+        Args:
+          other_node: Another leaf node of the same view hierarchy.
+
+        Returns:
+          The dom distance in between two leaf nodes: defined as the number of
+          nodes on the path from one leaf node to the other on the tree.
+        """
+        intersection = [
+            node for node in self.element.iterancestors()
+            if node in other_node.element.iterancestors()
+        ]
+        assert intersection
+        ancestor_list = list(self.element.iterancestors())
+        other_ancestor_list = list(other_node.element.iterancestors())
+        return ancestor_list.index(
+            intersection[0]) + other_ancestor_list.index(intersection[0]) + 1
+
+
+class BaseViewHierarchy(object):
+    """The view hierarchy of a screen and its visible leaves.
+
+    Subclasses set `leaf_node_class` to a BaseLeafNode subclass and implement
+    `_build_geometry`, and may override the other class attributes and hooks
+    below.
+    """
+
+    # Class building the UI object of a leaf, see get_leaf_nodes().
+    leaf_node_class = None
+    # Attribute telling whether an element is displayed.
+    visibility_attribute = 'displayed'
+    # Keep leaves partially on screen, not only those entirely on it.
+    partial_within_screen = False
+    # Among duplicates under a click, dedup keeps the first hit, not the last.
+    dedup_keeps_first_hit = False
+    # Margins and threshold of the neighbour sweep, see build_neighbor_indices.
+    neighbor_options = {}
+    # Values and kind of a tree node hashed by subtree_hashes and path_hashes.
+    node_values = staticmethod(element_values)
+    node_kind = staticmethod(element_kind)
+    # What the children of an element inherit from it and its ancestors,
+    # passed to the leaf nodes, see traversal.walk_tree.
+    inherit = None
+
+    def __init__(self, screen_width, screen_height):
+        """Constructor.
+
+        Args:
+          screen_width: The pixel width of the screen for the view hierarchy.
+          screen_height: The pixel height of the screen for the view hierarchy.
+        """
+        self._root = None
+        self._root_element = None
+        self._all_visible_leaves = []
+        self._leaf_geometry = GeometryTable()
+        self._dom_location_dict = None
+        self._leaf_hashes = []
+        self._leaf_paths = []
+        self._leaf_inherited = []
+        self._root_hash = None
+        self._spatial_index = None
+        self._screen_width = screen_width
+        self._screen_height = screen_height
+
+    def _build_geometry(self, elements):
+        """Returns the GeometryTable of a list of elements."""
+        raise NotImplementedError
+
+    def _prepare_tree(self):
+        """Adjusts the tree before its leaves are indexed."""
+
+    def _walk_tree(self):
+        """Returns the DomNodes of the tree in preorder."""
+        return walk_tree(self._root, self.inherit)
+
+    def _is_displayed(self, element):
+        return parse_bool(element.get(self.visibility_attribute, default='true'))
+
+    def _object_name(self, element):
+        """Returns the name duplicates are found by in dedup()."""
+        return element.get('text') or element.get('content-desc')
+
+    def _remove_element(self, element):
+        element.getparent().remove(element)
+
+    def _pointer(self, element):
+        return element.get('pointer')
+
+    def _new_leaf_node(self, element, *args, **kwargs):
+        """Returns the leaf_node_class object of a visible leaf."""
+        return self.leaf_node_class(element, *args, **kwargs)
+
+    def load_xml(self, xml_content):
+        """Builds the etree from xml content.
+
+        Args:
+          xml_content: The str or bytes containing xml content.
+        """
+        self._root = parse_xml(xml_content)
+        self._root_element = self._root[0]
+        self._index_visible_leaves()
+
+    @property
+    def leaf_geometry(self):
+        """GeometryTable of the visible leaves, in get_leaf_nodes() order."""
+        return self._leaf_geometry
+
+    @property
+    def spatial_index(self):
+        """SpatialIndex of the visible leaves, in get_leaf_nodes() order."""
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex(self._leaf_geometry)
+        return self._spatial_index
+
+    @property
+    def leaf_hashes(self):
+        """Subtree hashes of the visible leaves, in get_leaf_nodes() order."""
+        return self._leaf_hashes
+
+    @property
+    def leaf_paths(self):
+        """DOM path hashes of the visible leaves, in get_leaf_nodes() order."""
+        return self._leaf_paths
+
+    @property
+    def root_hash(self):
+        """Merkle hash of the whole hierarchy, equal for identical trees."""
+        return self._root_hash
+
+    def get_leaf_nodes(self, lazy=False, reuse=None):
+        """Returns a list of all the leaf Nodes.
+
+        Args:
+          lazy: Defer neighbors, grid location and word sequence of every UI
+            object until first read. Neighbors and grid locations are still
+            computed for all leaves at once, by the first leaf needing them.
+          reuse: dict of {leaf hash: UI object} from an earlier snapshot.
+            Leaves whose subtree hash is in it reuse its attribute derived
+            fields and only recompute the position dependent ones.
+        """
+        reuse = reuse or {}
+        geometry = self._leaf_geometry
+        leaves = self._all_visible_leaves
+        pointers = [self._pointer(element) for element in leaves]
+        neighbors = defer(lazy, build_neighbor_pointers, pointers, geometry,
+                          self._screen_width, self._screen_height,
+                          self.neighbor_options)
+        grid_locations = defer(lazy, build_grid_locations, geometry,
+                               self._screen_width, self._screen_height)
+        leaf_nodes = []
+        for index, (element, box, leaf_hash, inherited) in enumerate(
+                zip(leaves, geometry.rows(), self._leaf_hashes,
+                    self._leaf_inherited)):
+            if lazy:
+                element_neighbors = neighbors.item(index)
+                element_grid_location = grid_locations.item(index)
+            else:
+                element_neighbors = neighbors[index]
+                element_grid_location = grid_locations[index]
+            leaf_nodes.append(self._new_leaf_node(
+                element, leaves, self._dom_location_dict[id(element)],
+                self._screen_width, self._screen_height,
+                neighbors=element_neighbors,
+                bounding_box=BoundingBox(*box),
+                grid_location=element_grid_location,
+                lazy=lazy,
+                template=reuse.get(leaf_hash),
+                inherited=inherited))
+        return leaf_nodes
+
+    def get_ui_objects(self, lazy=False):
+        """Returns a list of all ui objects represented by leaf nodes."""
+        return [leaf.uiobject for leaf in self.get_leaf_nodes(lazy)]
+
+    def dedup(self, click_x_and_y):
+        """Dedup UI objects with same text or content_desc.
+
+        Of every group of visible leaves sharing a name, only one is kept: the
+        one under the click if any, otherwise the first one.
+
+        Args:
+          click_x_and_y: the event x and y (like: click pos in screen)
+        """
+        click_x, click_y = click_x_and_y
+
+        # Map of {'name': [indices of the leaves with this name]}
+        name_element_map = collections.defaultdict(list)
+        for index, element in enumerate(self._all_visible_leaves):
+            name_element_map[self._object_name(element)].append(index)
+
+        hits = set(self.spatial_index.elements_at(click_x, click_y))
+        for name, indices in name_element_map.items():
+            if not name:
+                continue
+            elements = [self._all_visible_leaves[i] for i in indices]
+            # Search if the event (x, y) happens in one of these objects
+            target_index = None
+            for index, leaf_index in enumerate(indices):
+                if leaf_index in hits:
+                    target_index = index
+                    if self.dedup_keeps_first_hit:
+                        break
+
+            if target_index is None:  # target UI obj is not in this elements
+                for ele in elements[1:]:
+                    self._remove_element(ele)
+            else:  # if target UI obj is one of them, delete the rest UI objs
+                for ele in elements[:target_index] + \
+                        elements[target_index + 1:]:
+                    self._remove_element(ele)
+
+        num_leaves = len(self._all_visible_leaves)
+        self._index_visible_leaves()
+        logger.debug('Dedup: {} -> {}'.format(num_leaves, len(self._all_visible_leaves)))
+
+    def _index_visible_leaves(self):
+        """Indexes all the visible leaves and their locations in one tree walk.
+
+        All leaf elements will be filtered and cached in
+        self._all_visible_leaves. This is necessary because dom_location_dict
+        uses id(element) as keys, and the id of the same XML element is not
+        fixed across _root.iter('*') calls.
+
+        Sets:
+          _all_visible_leaves: The list of all the visible leaf elements.
+          _leaf_geometry: GeometryTable of the visible leaf elements.
+          _dom_location_dict: dict of
+            {id(element): [depth, preorder-index, postorder-index]}
+          _leaf_hashes: The subtree hash of every visible leaf element.
+          _leaf_paths: The DOM path hash of every visible leaf element.
+          _leaf_inherited: What every visible leaf element inherits.
+          _root_hash: The subtree hash of the root.
+        """
+        self._prepare_tree()
+        nodes = self._walk_tree()
+        hashes = subtree_hashes(nodes, self.node_values)
+        displayed_leaves = [
+            node for node in nodes
+            if node.is_leaf and self._is_displayed(node.element)
+        ]
+        # Every leaf's geometry is read once, the screen filter runs on the
+        # whole table at once.
+        geometry = self._build_geometry(
+            [node.element for node in displayed_leaves])
+        within_screen = geometry.within_screen(
+            self._screen_width, self._screen_height,
+            partial=self.partial_within_screen)
+        visible_leaves = [
+            node for node, visible in zip(displayed_leaves, within_screen)
+            if visible
+        ]
+        dom_location_dict = collections.defaultdict(lambda: [None, None, None])
+        for node in visible_leaves:
+            dom_location_dict[id(node.element)] = node.dom_location
+        self._all_visible_leaves = [node.element for node in visible_leaves]
+        self._leaf_geometry = geometry[within_screen]
+        self._dom_location_dict = dom_location_dict
+        self._leaf_hashes = [hashes[node.preorder_index]
+                             for node in visible_leaves]
+        paths = path_hashes(nodes, self.node_kind)
+        self._leaf_paths = [paths[node.preorder_index]
+                            for node in visible_leaves]
+        self._leaf_inherited = [node.inherited for node in visible_leaves]
+        self._root_hash = hashes[0]
+        self._spatial_index = None
+
+
+class BaseUI(object):
+    """An encoded snapshot of a screen.
+
+    Subclasses set the class attributes and implement the element hooks
+    below for their platform's UI objects.
+
+    Attributes:
+      elements: {display id: UI object} of the encoded leaves, in reading
+        order.
+      leaf_records: {leaf subtree hash: UI object}, reused by the next
+        snapshot. Only the records are kept, not the previous UI, so
+        snapshots do not chain up in memory.
+      dropped_ids: Display ids left out of the last budgeted encoding.
+      fragments: Encoded element by display id, kept for delta encodings.
+      stable_ids: Stable id of every element by display id, see
+        cognisim.device.identity.
+      display_ids: {stable id: display id}.
+    """
+
+    # BaseViewHierarchy subclass parsing the platform's hierarchy.
+    view_hierarchy_class = None
+    # Screen size of the hierarchy coordinates.
+    screen_width = None
+    screen_height = None
+    # {element type name: html tag}, see cognisim.device.encoders.
+    class_mapping = {}
+    # Pixels of misalignment tolerated within a row of the reading order.
+    reading_row_tolerance = config.READING_ROW_TOLERANCE
+
+    def __init__(self, xml_content, previous=None, state_representation='html',
+                 identities=None):
+        """Constructor.
+
+        Args:
+          xml_content: The view hierarchy xml as str or bytes, e.g.
+            driver.page_source.
+          previous: The UI of an earlier snapshot, whose UI objects are reused
+            for unchanged leaves.
+          state_representation: Name of a registered encoder, see
+            cognisim.device.encoders.
+          identities: The ElementIdentities assigning stable ids, defaults to
+            the one of previous.
+        """
+        self.xml_content = xml_content
+        # Looked up here so an unknown name fails before the first encoding.
+        get_encoder(state_representation)
+        self.state_representation = state_representation
+        self.elements = {}
+        self.leaf_records = {}
+        self._reuse = previous.leaf_records if previous is not None else None
+        self._spatial_index = None
+        self.dropped_ids = []
+        self.fragments = []
+        if identities is None:
+            identities = (previous.identities if previous is not None
+                          else ElementIdentities())
+        self.identities = identities
+        self.stable_ids = []
+        self.display_ids = {}
+
+    @classmethod
+    def from_file(cls, xml_file, state_representation='html'):
+        """Creates the UI from a view hierarchy xml file."""
+        with open(xml_file, 'rb') as f:
+            return cls(f.read(), state_representation=state_representation)
+
+    @staticmethod
+    def element_class(resource_id):
+        """Returns the class of an element derived from its resource id."""
+        return resource_id
+
+    def load_view_hierarchy(self):
+        """Returns the view_hierarchy_class object of the hierarchy, loaded."""
+        vh = self.view_hierarchy_class(
+            screen_width=self.screen_width,
+            screen_height=self.screen_height)
+        vh.load_xml(self.xml_content)
+        return vh
+
+    def element_fields(self, uiobject):
+        """Returns the `(obj_type, text, content_desc, resource_id)` encoded."""
+        raise NotImplementedError
+
+    def identity_fields(self, uiobject):
+        """Returns the `(resource_id, class)` stable ids are derived from."""
+        raise NotImplementedError
+
+    def element_usefulness(self, uiobject):
+        """Returns the ranking score of an element in budgeted encodings."""
+        raise NotImplementedError
+
+    def element_encoding(self, _id, _obj_type, _text, _content_desc,
+                         _resource_id):
+        """Returns the html encoding of one element."""
+        raise NotImplementedError
+
+    def sortchildrenby_viewhierarchy(self, view, attr='bounds', geometry=None,
+                                     row_tolerance=None):
+        """Sorts leaf nodes in reading order, top to bottom, left to right.
+
+        Args:
+          view: The leaf nodes, sorted in place.
+          attr: What to sort by, only 'bounds' is supported.
+          geometry: GeometryTable of the leaf nodes, built from their
+            bounding boxes if omitted.
+          row_tolerance: See GeometryTable.reading_order, defaults to
+            self.reading_row_tolerance.
+        """
+        if attr == 'bounds':
+            if geometry is None:
+                geometry = GeometryTable([
+                    (ele.uiobject.bounding_box.x1, ele.uiobject.bounding_box.y1,
+                     ele.uiobject.bounding_box.x2, ele.uiobject.bounding_box.y2)
+                    for ele in view])
+            if row_tolerance is None:
+                row_tolerance = self.reading_row_tolerance
+            view[:] = [view[i] for i in geometry.reading_order(row_tolerance)]
+
+    def encoding(self, budget=None, count=len):
+        """Encodes the visible leaves in the UI's state representation.
+
+        Args:
+          budget: Maximum size of the encoding. When set, the most useful
+            elements are kept until it is reached and the ids of the others
+            are listed in self.dropped_ids. Kept elements keep their ids.
+          count: Measures the size of a string, `len` for characters or a
+            tokenizer's token count.
+
+        Returns:
+          The encoded UI.
+        """
+        logger.info('reading hierarchy tree ({} chars) ...'.format(
+            len(self.xml_content)))
+        vh = self.load_view_hierarchy()
+        leaf_nodes = vh.get_leaf_nodes(lazy=True, reuse=self._reuse)
+        self.leaf_records = dict(zip(
+            vh.leaf_hashes, [ele.uiobject for ele in leaf_nodes]))
+        self._reuse = None
+        leaf_paths = dict(zip(map(id, leaf_nodes), vh.leaf_paths))
+        self.sortchildrenby_viewhierarchy(leaf_nodes, 'bounds', vh.leaf_geometry)
+
+        uiobjects = [ele.uiobject for ele in leaf_nodes]
+        identity_fields = [self.identity_fields(uiobject) for uiobject in uiobjects]
+        self.stable_ids = self.identities.assign(identity_keys(
+            [leaf_paths[id(ele)] for ele in leaf_nodes],
+            [resource_id for resource_id, _ in identity_fields],
+            [_class for _, _class in identity_fields],
+            [(uiobject.bounding_box.x1, uiobject.bounding_box.y1,
+              uiobject.bounding_box.x2, uiobject.bounding_box.y2)
+             for uiobject in uiobjects],
+            self.screen_width))
+        self.display_ids = {stable_id: _id
+                            for _id, stable_id in enumerate(self.stable_ids)}
+
+        logger.debug('encoding the ui elements in hierarchy tree...')
+        encoder = get_encoder(self.state_representation)(
+            self.class_mapping, self.element_class, self.element_encoding)
+        fragments = []
+        for _id, uiobject in enumerate(uiobjects):
+            fragments.append(encoder.element(_id, *self.element_fields(uiobject)))
+            self.elements[_id] = uiobject
+        scores = None
+        if budget is not None:
+            scores = [self.element_usefulness(uiobject) for uiobject in uiobjects]
+        kept, self.dropped_ids = select_within_budget(
+            fragments, scores, budget, count,
+            overhead=count(encoder.document(())))
+        if self.dropped_ids:
+            logger.debug('dropped {} of {} elements over the budget'.format(
+                len(self.dropped_ids), len(fragments)))
+        codes = encoder.document(fragments[i] for i in kept)
+        self.fragments = fragments
+        self._spatial_index = None
+        return codes
+
+    def delta_encoding(self, previous):
+        """Encodes only the elements added, removed or changed since previous.
+
+        Both UIs must be encoded already, see cognisim.device.delta.
+        """
+        if previous.identities is self.identities:
+            # Elements are matched by stable id.
+            delta = diff_elements(previous.elements, self.elements,
+                                  previous.stable_ids, self.stable_ids)
+        else:
+            delta = diff_elements(previous.elements, self.elements)
+        return encode_delta(delta, previous.fragments, self.fragments)
+
+    @property
+    def spatial_index(self):
+        """SpatialIndex of the encoded elements, built on first use.
+
+        Positions in the index are the keys of self.elements.
+        """
+        if self._spatial_index is None:
+            self._spatial_index = SpatialIndex(GeometryTable([
+                (ele.bounding_box.x1, ele.bounding_box.y1,
+                 ele.bounding_box.x2, ele.bounding_box.y2)
+                for ele in self.elements.values()]))
+        return self._spatial_index
+
+    def element_at(self, x, y):
+        """Returns the id of the smallest element under (x, y), or None."""
+        index = self.spatial_index.element_at(x, y)
+        return None if index is None else list(self.elements)[index]
+
+    def elements_in_rect(self, x1, y1, x2, y2, contained=False):
+        """Returns the ids of the elements overlapping (or inside) a rect."""
+        ids = list(self.elements)
+        return [ids[index] for index in self.spatial_index.elements_in_rect(
+            x1, y1, x2, y2, contained)]
+
+    def nearest_elements(self, x, y, k=1, max_distance=None):
+        """Returns the ids of the k elements closest to (x, y), closest first."""
+        ids = list(self.elements)
+        return [ids[index] for index in self.spatial_index.nearest(
+            x, y, k, max_distance)]
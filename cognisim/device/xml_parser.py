@@ -0,0 +1,36 @@
+"""In-memory parsing of view hierarchy XML documents."""
+
+import threading
+
+from lxml import etree
+
+_thread_local = threading.local()
+
+
+def _get_parser():
+    """Returns the lxml parser of the calling thread.
+
+    Parsers are reusable but not thread safe, so each thread creating view
+    hierarchies gets its own instead of building a new one per document.
+    """
+    parser = getattr(_thread_local, 'parser', None)
+    if parser is None:
+        # huge_tree lifts libxml2's depth and size limits for deep hierarchies.
+        parser = _thread_local.parser = etree.XMLParser(huge_tree=True)
+    return parser
+
+
+def parse_xml(xml_content):
+    """Parses a view hierarchy document without touching the filesystem.
+
+    Args:
+      xml_content: The document as str or bytes. A str is encoded to UTF-8
+        first, since lxml rejects str input carrying an encoding declaration,
+        which Appium's page_source has.
+
+    Returns:
+      The root etree.Element.
+    """
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode('utf-8')
+    return etree.fromstring(xml_content, _get_parser())
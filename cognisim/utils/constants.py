@@ -17,5 +17,53 @@ XML_SCREEN_HEIGHT = 2960
 
 MAX_REFLECTIONS = 5
 
+# Encoded UI state cache, keyed by a hash of the page source. The byte limit
+# covers the page sources and encodings, not the UI objects.
+STATE_CACHE_MAX_ENTRIES = 32
+STATE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Distinct attribute values (classes, booleans) memoized per process
+ATTRIBUTE_CACHE_MAX_ENTRIES = 4096
+
+# Set-of-mark screenshots: 'png', 'jpeg' or 'webp', and the quality of the
+# lossy formats
+SET_OF_MARK_FORMAT = 'jpeg'
+SET_OF_MARK_QUALITY = 80
+
+# Worker threads per device for the blocking Appium calls, get_state fetches
+# the view hierarchy and the screenshot concurrently
+CAPTURE_WORKERS = 2
+
+# Seconds before a driver call of a device method times out, None waits
+# forever. Starting a session may install the app and gets longer
+DRIVER_CALL_TIMEOUT = 120
+SESSION_START_TIMEOUT = 600
+
+# MJPEG screen stream: frames kept, seconds without data before reconnecting,
+# longest delay between reconnects, and how long get_state waits for a frame
+# newer than its call before using the latest one
+MJPEG_RING_SIZE = 8
+MJPEG_READ_TIMEOUT = 5
+MJPEG_MAX_RECONNECT_DELAY = 30
+MJPEG_FRAME_WAIT = 0.1
+
+# Screen change detection of get_state(skip_unchanged=True): largest change of
+# a block mean, in gray levels, still considered the same screen, and the
+# (columns, rows) of the blocks
+SCREEN_CHANGE_THRESHOLD = 4.0
+SCREEN_CHANGE_GRID = (32, 64)
+
+# wait_until_stable: seconds to wait at most, how long the screen must stay
+# the same, and the bounds of the polling interval, which grows while the
+# screen holds still
+STABLE_TIMEOUT = 5
+STABLE_MIN_MS = 300
+STABLE_POLL_MIN_INTERVAL = 0.05
+STABLE_POLL_MAX_INTERVAL = 0.25
+
+# Pixels an element may sit below the top of a row and still be read on it,
+# 0 reads elements strictly by their top edge
+READING_ROW_TOLERANCE = 0
+
 # PLAYWRIGHT TIMEOUTS
 BOUNDING_BOX_TIMEOUT = 3000
@@ -1,5 +1,4 @@
 import asyncio
-import base64
 import io
 import json
 import os
@@ -16,7 +15,7 @@ from cognisim import mobileadapt
 openai.api_key = "<your_openai_api_key>"
 
 
-def llm_call(html_state: str, image: bytes, nlp_task: str):
+def llm_call(html_state: str, image_url: str, nlp_task: str):
     client = OpenAI()
 
     function_call_instruction_guided_replay = {
@@ -69,7 +68,7 @@ def llm_call(html_state: str, image: bytes, nlp_task: str):
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64.b64encode(image).decode('utf-8')}"
+                            "url": image_url
                         },
                     },
                 ],
@@ -97,12 +96,12 @@ async def main():
 
     encoded_ui, screenshot, ui = await android_device.get_state()
 
-    # Create set of mark screenshot
-    set_of_mark: bytes = android_device.generate_set_of_mark(ui, screenshot)
+    # Create set of mark screenshot, JPEG keeps the request small
+    set_of_mark = android_device.render_set_of_mark(ui, screenshot)
 
     action_grounded: Dict[str, Any] = llm_call(
         html_state=encoded_ui,
-        image=set_of_mark,
+        image_url=set_of_mark.data_url(),
         nlp_task="Press the buttom with the text 'Add a new task'",
     )
 
@@ -0,0 +1,98 @@
+"""Fake drivers and devices for the tests of the device classes.
+
+`PlaybackDriver` stands in for the Appium driver: it plays back a list of
+screenshots and page sources, one per call, repeating the last one.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+from cognisim.device.device import Device
+
+
+def png(level, width=32, height=64):
+    """Returns a gray png screenshot."""
+    return cv2.imencode('.png', np.full((height, width, 3), level, np.uint8))[1].tobytes()
+
+
+class PlaybackDriver(object):
+    """Plays back screenshots and page sources.
+
+    Attributes:
+      screenshot_calls: Number of screenshots taken.
+      page_source_calls: Number of page sources read.
+    """
+
+    def __init__(self, screenshots=(), page_sources=(), window_size=(1080, 1920),
+                 on_call=None, block=None):
+        """Constructor.
+
+        Args:
+          screenshots: Encoded screenshots, a black one if empty.
+          page_sources: Page sources, an empty hierarchy if empty.
+          window_size: (width, height) returned by get_window_size.
+          on_call: Called with the name of every driver call, e.g. to
+            advance a fake clock.
+          block: threading.Event every page source read waits for.
+        """
+        self.screenshots = list(screenshots) or [png(0)]
+        self.page_sources = list(page_sources) or ['<hierarchy/>']
+        self.window_size = {'width': window_size[0], 'height': window_size[1]}
+        self.on_call = on_call
+        self.block = block
+        self.screenshot_calls = 0
+        self.page_source_calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        if self.on_call is not None:
+            self.on_call(name)
+
+    def get_screenshot_as_png(self):
+        self._call('screenshot')
+        with self._lock:
+            index = min(self.screenshot_calls, len(self.screenshots) - 1)
+            self.screenshot_calls += 1
+        return self.screenshots[index]
+
+    @property
+    def page_source(self):
+        self._call('page_source')
+        if self.block is not None:
+            self.block.wait()
+        with self._lock:
+            index = min(self.page_source_calls, len(self.page_sources) - 1)
+            self.page_source_calls += 1
+        return self.page_sources[index]
+
+    def get_window_size(self):
+        return self.window_size
+
+
+class FakeDevice(Device):
+    """A Device with a fake driver and no platform."""
+
+    def __init__(self, driver=None, **device_options):
+        super().__init__('com.example', **device_options)
+        self.driver = driver if driver is not None else PlaybackDriver()
+
+    def start_device(self):
+        pass
+
+    def stop_device(self):
+        self.stop_frame_grabber()
+        self.capture_pool.shutdown(wait=False)
+
+    def get_state(self):
+        pass
+
+    def tap(self, x, y):
+        pass
+
+    def input(self, x, y, text):
+        pass
+
+    def swipe(self, x, y, direction):
+        pass
@@ -0,0 +1,172 @@
+"""Random view hierarchies of the shapes the tests need.
+
+The trees are deterministic for a seed: nested containers with clipped,
+grid snapped, duplicated and off screen boxes, invisible leaves, and texts
+with newlines, like the page sources of real apps.
+"""
+
+import random
+from xml.sax.saxutils import quoteattr
+
+ANDROID_CLASSES = [
+    'android.widget.TextView', 'android.widget.Button', 'android.widget.ImageView',
+    'android.widget.ImageButton', 'android.widget.EditText', 'android.widget.CheckBox',
+    'android.widget.Switch', 'android.widget.RadioButton', 'android.widget.Spinner',
+    'android.view.View', 'androidx.appcompat.widget.AppCompatTextView',
+    'com.foo.CustomImageView', 'android.widget.ToggleButton']
+ANDROID_CONTAINERS = [
+    'android.widget.FrameLayout', 'android.widget.LinearLayout',
+    'android.widget.ListView', 'androidx.recyclerview.widget.RecyclerView']
+ANDROID_WIDTH, ANDROID_HEIGHT = 1440, 2960
+
+IOS_TYPES = [
+    'XCUIElementTypeStaticText', 'XCUIElementTypeButton', 'XCUIElementTypeImage',
+    'XCUIElementTypeSwitch', 'XCUIElementTypeTextField', 'XCUIElementTypeCell',
+    'XCUIElementTypeOther', 'XCUIElementTypeLink', 'XCUIElementTypeKey']
+IOS_CONTAINERS = [
+    'XCUIElementTypeOther', 'XCUIElementTypeTable', 'XCUIElementTypeCell',
+    'XCUIElementTypeButton', 'XCUIElementTypeNavigationBar']
+IOS_WIDTH, IOS_HEIGHT = 430, 932
+
+
+def android_xml(seed, n_leaves=60, with_pointer=True):
+    """Returns the page source of a random Android hierarchy."""
+    rnd = random.Random(seed)
+    count = [0]
+    pointer = [0]
+    W, H = ANDROID_WIDTH, ANDROID_HEIGHT
+
+    def attributes(cls, box, clickable):
+        pointer[0] += 1
+        text = rnd.choice(['', 'Hello world', 'OK', 'Settings', 'foo_bar', 'a\nb', ''])
+        resource_id = rnd.choice(['', 'com.example:id/title_text', 'com.example:id/icon'])
+        desc = rnd.choice(['', 'desc', 'Navigate up'])
+        checkable = rnd.choice(['false', 'false', 'true'])
+        displayed = rnd.choice(['true'] * 9 + ['false'])
+        s = ('index="0" text=%s class=%s package="com.example" content-desc=%s resource-id=%s '
+             'checkable="%s" checked="false" clickable="%s" enabled="true" focusable="false" focused="false" '
+             'scrollable="false" long-clickable="false" password="false" selected="false" displayed="%s" '
+             'bounds="[%d,%d][%d,%d]"'
+             % (quoteattr(text), quoteattr(cls), quoteattr(desc), quoteattr(resource_id), checkable,
+                clickable, displayed, *box))
+        if with_pointer:
+            s += ' pointer="p%d"' % pointer[0]
+        return s
+
+    def random_box(parent):
+        x1, y1, x2, y2 = parent
+        if rnd.random() < 0.05:
+            return (rnd.randint(0, W), rnd.randint(0, H), rnd.randint(0, W + 200), rnd.randint(0, H + 300))
+        if rnd.random() < 0.1:
+            return parent
+        w = max(1, x2 - x1)
+        h = max(1, y2 - y1)
+        a = x1 + rnd.randint(0, w // 2)
+        b = y1 + rnd.randint(0, h // 2)
+        c = a + rnd.randint(0, max(1, x2 - a))
+        d = b + rnd.randint(0, max(1, y2 - b))
+        # Snapped to a grid for adjacent and identical bounds
+        if rnd.random() < 0.5:
+            a, b, c, d = (v // 40 * 40 for v in (a, b, c, d))
+        return (a, b, c, d)
+
+    def build(parent_box, depth):
+        out = []
+        for _ in range(rnd.randint(1, 4)):
+            if count[0] >= n_leaves:
+                break
+            box = random_box(parent_box)
+            if depth < 5 and rnd.random() < 0.45:
+                cls = rnd.choice(ANDROID_CONTAINERS)
+                inner = build(box, depth + 1)
+                out.append('<node %s>%s</node>' % (
+                    attributes(cls, box, rnd.choice(['true', 'false'])), ''.join(inner)))
+            else:
+                count[0] += 1
+                out.append('<node %s/>' % attributes(
+                    rnd.choice(ANDROID_CLASSES), box, rnd.choice(['true', 'false', 'false'])))
+        return out
+
+    body = []
+    while count[0] < n_leaves:
+        body.extend(build((0, 0, W, H), 0))
+    return ("<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>"
+            '<hierarchy rotation="0"><node %s>%s</node></hierarchy>'
+            % (attributes('android.widget.FrameLayout', (0, 0, W, H), 'false'), ''.join(body)))
+
+
+def ios_xml(seed, n_leaves=60, W=IOS_WIDTH, H=IOS_HEIGHT):
+    """Returns the page source of a random iOS hierarchy."""
+    rnd = random.Random(seed)
+    count = [0]
+
+    def attributes(element_type, box):
+        x1, y1, x2, y2 = box
+        name = rnd.choice(['', 'com.app.icon', 'Settings', 'Back', 'Done'])
+        label = rnd.choice(['', 'Hello', 'Tap me', 'multi\nline'])
+        return ('type=%s name=%s label=%s enabled="true" visible=%s accessible=%s '
+                'x="%d" y="%d" width="%d" height="%d"'
+                % (quoteattr(element_type), quoteattr(name), quoteattr(label),
+                   quoteattr(rnd.choice(['true'] * 8 + ['false'])),
+                   quoteattr(rnd.choice(['true', 'false'])), x1, y1, x2 - x1, y2 - y1))
+
+    def random_box(parent):
+        x1, y1, x2, y2 = parent
+        if rnd.random() < 0.05:
+            return (rnd.randint(-50, W), rnd.randint(-50, H), rnd.randint(0, W + 100), rnd.randint(0, H + 100))
+        w = max(1, x2 - x1)
+        h = max(1, y2 - y1)
+        a = x1 + rnd.randint(0, w // 2)
+        b = y1 + rnd.randint(0, h // 2)
+        c = a + rnd.randint(1, max(1, x2 - a))
+        d = b + rnd.randint(1, max(1, y2 - b))
+        if rnd.random() < 0.5:
+            a, b, c, d = (v // 10 * 10 for v in (a, b, c, d))
+        return (a, b, max(c, a), max(d, b))
+
+    def build(parent_box, depth):
+        out = []
+        for _ in range(rnd.randint(1, 4)):
+            if count[0] >= n_leaves:
+                break
+            box = random_box(parent_box)
+            if depth < 5 and rnd.random() < 0.45:
+                out.append('<XCUIElementTypeOther %s>%s</XCUIElementTypeOther>' % (
+                    attributes(rnd.choice(IOS_CONTAINERS), box), ''.join(build(box, depth + 1))))
+            else:
+                count[0] += 1
+                out.append('<Leaf %s/>' % attributes(rnd.choice(IOS_TYPES), box))
+        return out
+
+    body = []
+    while count[0] < n_leaves:
+        body.extend(build((0, 0, W, H), 0))
+    return ('<?xml version="1.0" encoding="UTF-8"?><AppiumAUT><XCUIElementTypeApplication %s>%s'
+            '</XCUIElementTypeApplication></AppiumAUT>'
+            % (attributes('XCUIElementTypeApplication', (0, 0, W, H)), ''.join(body)))
+
+
+def android_page(leaves, width=ANDROID_WIDTH, height=ANDROID_HEIGHT):
+    """Returns the page source of a screen with the given leaves.
+
+    Args:
+      leaves: Dicts of the leaf attributes 'class', 'bounds' (x1, y1, x2, y2),
+        and optionally 'text', 'resource-id', 'content-desc' and 'clickable'
+        (a bool), under one full screen FrameLayout.
+    """
+    def node(leaf):
+        return ('<node index="0" text=%s class=%s package="com.example" content-desc=%s '
+                'resource-id=%s checkable="false" checked="false" clickable="%s" enabled="true" '
+                'focusable="false" focused="false" scrollable="false" long-clickable="false" '
+                'password="false" selected="false" displayed="true" bounds="[%d,%d][%d,%d]"/>'
+                % (quoteattr(leaf.get('text', '')), quoteattr(leaf['class']),
+                   quoteattr(leaf.get('content-desc', '')), quoteattr(leaf.get('resource-id', '')),
+                   str(leaf.get('clickable', False)).lower(), *leaf['bounds']))
+
+    return ("<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>"
+            '<hierarchy rotation="0"><node index="0" text="" class="android.widget.FrameLayout" '
+            'package="com.example" content-desc="" resource-id="" checkable="false" checked="false" '
+            'clickable="false" enabled="true" focusable="false" focused="false" scrollable="false" '
+            'long-clickable="false" password="false" selected="false" displayed="true" '
+            'bounds="[0,0][%d,%d]">%s</node></hierarchy>'
+            % (width, height, ''.join(node(leaf) for leaf in leaves)))
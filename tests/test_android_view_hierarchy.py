@@ -0,0 +1,137 @@
+import enum
+import json
+import os
+import re
+import unittest
+
+from lxml import etree
+
+from cognisim.device.android import android_device, android_view_hierarchy
+
+import hierarchies
+
+# UI objects and encodings of the original implementation for a few
+# random hierarchies, see hierarchies.android_xml
+BASELINE = os.path.join(os.path.dirname(__file__), 'data', 'android_baseline.json')
+
+FIELDS = [
+    'obj_type', 'obj_name', 'word_sequence', 'text', 'resource_id', 'android_class',
+    'android_package', 'content_desc', 'clickable', 'visible', 'enabled', 'focusable',
+    'focused', 'scrollable', 'long_clickable', 'selected', 'bounding_box', 'grid_location',
+    'dom_location', 'pointer', 'neighbors']
+
+
+def to_json(value):
+    """Returns a UI object field as it is stored in the baseline."""
+    if isinstance(value, enum.Enum):
+        return value.name
+    if hasattr(value, 'x1') and hasattr(value, 'y2'):
+        return [value.x1, value.y1, value.x2, value.y2]
+    if isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    if value is not None and not isinstance(value, (str, int, float, bool)):
+        return [to_json(v) for v in value]
+    return value
+
+
+def snapshot(uiobject):
+    return {field: to_json(getattr(uiobject, field)) for field in FIELDS}
+
+
+class BaselineTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(BASELINE) as f:
+            cls.cases = json.load(f)
+
+    def test_leaves_match_baseline(self):
+        for case in self.cases:
+            xml = hierarchies.android_xml(case['seed'], case['n_leaves'])
+            vh = android_view_hierarchy.ViewHierarchy(
+                hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT)
+            vh.load_xml(xml.encode())
+            leaves = [snapshot(leaf.uiobject) for leaf in vh.get_leaf_nodes()]
+            self.assertEqual(leaves, case['leaves'], case['seed'])
+
+    def test_encoding_matches_baseline(self):
+        for case in self.cases:
+            ui = android_device.UI(hierarchies.android_xml(case['seed'], case['n_leaves']))
+            self.assertEqual(ui.encoding(), case['encoding'], case['seed'])
+            elements = [[i, snapshot(uiobject)] for i, uiobject in ui.elements.items()]
+            self.assertEqual(elements, case['elements'], case['seed'])
+
+    def test_geometry_table_matches_leaves(self):
+        xml = hierarchies.android_xml(3, 60)
+        vh = android_view_hierarchy.ViewHierarchy(
+            hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT)
+        vh.load_xml(xml.encode())
+        leaves = vh.get_leaf_nodes()
+        boxes = [to_json(leaf.uiobject.bounding_box) for leaf in leaves]
+        self.assertEqual(vh.leaf_geometry.boxes.tolist(), boxes)
+
+
+def json_dump(element):
+    """The UIAutomator JSON dump of an xml element."""
+    node = {key: element.get(key) for key in (
+        'class', 'text', 'resource-id', 'package', 'pointer')}
+    node['content-desc'] = [element.get('content-desc') or None]
+    node['bounds'] = [int(v) for v in re.findall(r'\d+', element.get('bounds'))]
+    node.update({key: element.get(key) == 'true' for key in (
+        'clickable', 'checkable', 'enabled', 'focusable', 'focused', 'long-clickable',
+        'selected', 'displayed')})
+    children = [json_dump(child) for child in element]
+    if children:
+        node['children'] = children
+    return node
+
+
+class JsonUI(android_device.UI):
+    """Reads the xml content as a JSON dump."""
+
+    def load_view_hierarchy(self):
+        vh = android_view_hierarchy.JsonViewHierarchy(self.screen_width, self.screen_height)
+        vh.load_json(self.xml_content)
+        return vh
+
+
+class LoadJsonTest(unittest.TestCase):
+
+    def dumps(self, seed):
+        xml = hierarchies.android_xml(seed, 60)
+        root = etree.fromstring(xml.encode())
+        return xml, json.dumps({'activity': {'root': json_dump(root[0])}})
+
+    def test_same_encoding(self):
+        for seed in range(5):
+            xml, dump = self.dumps(seed)
+            from_xml = android_device.UI(xml)
+            from_json = JsonUI(dump)
+            self.assertEqual(from_json.encoding(), from_xml.encoding(), seed)
+
+    def test_same_leaves(self):
+        # JSON dumps do not mark elements under clickable ones as clickable
+        fields = [field for field in FIELDS if field != 'clickable']
+        for seed in range(5):
+            xml, dump = self.dumps(seed)
+            from_xml = android_view_hierarchy.ViewHierarchy(
+                hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT)
+            from_xml.load_xml(xml.encode())
+            from_json = android_view_hierarchy.JsonViewHierarchy(
+                hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT)
+            from_json.load_json(dump)
+            for vh in (from_xml, from_json):
+                vh.dedup((700, 1500))
+            xml_leaves = [snapshot(leaf.uiobject) for leaf in from_xml.get_leaf_nodes()]
+            json_leaves = [snapshot(leaf.uiobject) for leaf in from_json.get_leaf_nodes()]
+            self.assertTrue(xml_leaves)
+            self.assertEqual([{field: leaf[field] for field in fields} for leaf in json_leaves],
+                             [{field: leaf[field] for field in fields} for leaf in xml_leaves])
+
+    def test_only_json(self):
+        with self.assertRaises(NotImplementedError):
+            android_view_hierarchy.JsonViewHierarchy().load_xml(hierarchies.android_xml(0, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from cognisim.device.android.android_device import UI
+from cognisim.device.budget import select_within_budget, usefulness
+
+import hierarchies
+
+
+class SelectWithinBudgetTest(unittest.TestCase):
+
+    def test_no_budget_keeps_everything(self):
+        self.assertEqual(select_within_budget(['a', 'b'], None, None), ([0, 1], []))
+
+    def test_keeps_highest_scores_in_id_order(self):
+        fragments = ['aaaa', 'bbbb', 'cccc', 'dddd']
+        scores = [1, 3, 2, 3]
+        self.assertEqual(select_within_budget(fragments, scores, 8), ([1, 3], [0, 2]))
+        self.assertEqual(select_within_budget(fragments, scores, 12), ([1, 2, 3], [0]))
+
+    def test_stops_at_the_first_fragment_that_does_not_fit(self):
+        # The short fragment after the long one is not squeezed in
+        fragments = ['aa', 'b' * 10, 'c']
+        scores = [3, 2, 1]
+        self.assertEqual(select_within_budget(fragments, scores, 5), ([0], [1, 2]))
+
+    def test_overhead_and_count(self):
+        fragments = ['one two', 'three']
+        scores = [2, 1]
+        words = lambda s: len(s.split())  # noqa: E731
+        self.assertEqual(select_within_budget(fragments, scores, 3, words, overhead=1), ([0], [1]))
+        self.assertEqual(select_within_budget(fragments, scores, 3, words), ([0, 1], []))
+
+    def test_usefulness_order(self):
+        editable = usefulness(False, True, False, 0.0)
+        clickable = usefulness(True, False, True, 1.0)
+        text = usefulness(False, False, True, 1.0)
+        bare = usefulness(False, False, False, 1.0)
+        self.assertGreater(editable, clickable)
+        self.assertGreater(clickable, text)
+        self.assertGreater(text, bare)
+        self.assertGreater(usefulness(False, False, True, 0.5), usefulness(False, False, True, 0.1))
+
+
+class BudgetedEncodingTest(unittest.TestCase):
+
+    def setUp(self):
+        # In reading order: a label, a button, a text field, a bare image
+        self.xml = hierarchies.android_page([
+            {'class': 'android.widget.TextView', 'text': 'Sign in', 'bounds': (0, 100, 1440, 200)},
+            {'class': 'android.widget.Button', 'text': 'Next', 'clickable': True,
+             'bounds': (0, 300, 1440, 400)},
+            {'class': 'android.widget.EditText', 'text': 'Email', 'bounds': (0, 500, 1440, 600)},
+            {'class': 'android.widget.ImageView', 'bounds': (0, 700, 1440, 800)},
+        ])
+
+    def test_drops_least_useful_elements_first(self):
+        full = UI(self.xml).encoding()
+        for dropped in ([], [3], [0, 3], [0, 1, 3]):
+            ui = UI(self.xml)
+            kept_lines = [line for i, line in enumerate(full.splitlines()[1:-1]) if i not in dropped]
+            budget = len('<html>\n</html>') + sum(len(line) + 1 for line in kept_lines)
+            encoding = ui.encoding(budget=budget)
+            self.assertLessEqual(len(encoding), budget)
+            self.assertEqual(ui.dropped_ids, dropped)
+            self.assertEqual(encoding.splitlines()[1:-1], kept_lines)
+
+    def test_kept_elements_keep_their_ids(self):
+        ui = UI(self.xml)
+        encoding = ui.encoding(budget=50)
+        self.assertEqual(ui.dropped_ids, [0, 1, 3])
+        self.assertIn('id=2', encoding)
+        self.assertEqual(sorted(ui.elements), [0, 1, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from cognisim.device.android.android_device import AndroidDevice
+from cognisim.device.capture import CapturePool, CaptureTiming, DeviceState
+from cognisim.device.ios.ios_device import IOSDevice
+from cognisim.device.screen_transform import ScreenTransform
+
+import fakes
+import hierarchies
+
+
+class BrokenHierarchyDriver(fakes.PlaybackDriver):
+    """Fails to read the page source, screenshots wait for `screenshot_block`."""
+
+    def __init__(self, screenshot_block):
+        super().__init__()
+        self.screenshot_block = screenshot_block
+
+    def get_screenshot_as_png(self):
+        self.screenshot_block.wait()
+        return super().get_screenshot_as_png()
+
+    @property
+    def page_source(self):
+        raise RuntimeError('session lost')
+
+
+class CaptureTimingTest(unittest.TestCase):
+
+    def test_skew_and_duration(self):
+        timing = CaptureTiming(10.0, 10.4, 10.1, 10.9)
+        self.assertAlmostEqual(timing.skew, 0.3)
+        self.assertAlmostEqual(timing.duration, 0.9)
+        # Screenshot first
+        timing = CaptureTiming(10.5, 10.7, 10.0, 10.2)
+        self.assertAlmostEqual(timing.skew, -0.5)
+        self.assertAlmostEqual(timing.duration, 0.7)
+
+
+class CapturePoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = CapturePool(max_workers=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_calls_run_concurrently(self):
+        # Each call waits for the other one, which only returns if both run
+        # on their own thread
+        barrier = threading.Barrier(2, timeout=5)
+
+        async def both():
+            return await asyncio.gather(
+                self.pool.run(barrier.wait), self.pool.run(barrier.wait))
+
+        self.assertEqual(sorted(asyncio.run(both())), [0, 1])
+
+    def test_run_timed(self):
+        async def call():
+            return await self.pool.run_timed(sum, [1, 2])
+
+        before = time.time()
+        result, started, finished = asyncio.run(call())
+        self.assertEqual(result, 3)
+        self.assertLessEqual(before, started)
+        self.assertLessEqual(started, finished)
+        self.assertLessEqual(finished, time.time())
+
+    def test_restarts_after_shutdown(self):
+        async def thread_name():
+            return await self.pool.run(lambda: threading.current_thread().name)
+
+        self.assertTrue(asyncio.run(thread_name()).startswith('cognisim-capture'))
+        self.pool.shutdown()
+        self.assertTrue(asyncio.run(thread_name()).startswith('cognisim-capture'))
+
+    def test_errors_are_raised_by_the_awaitable(self):
+        async def call():
+            return await self.pool.run(int, 'not a number')
+
+        with self.assertRaises(ValueError):
+            asyncio.run(call())
+
+
+class GetStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.screenshot = fakes.png(0, 720, 1480)
+        self.device = AndroidDevice('com.example')
+        self.device.driver = fakes.PlaybackDriver(
+            [self.screenshot], [hierarchies.android_xml(0, 20)])
+
+    def tearDown(self):
+        self.device.capture_pool.shutdown()
+
+    def test_state(self):
+        state = asyncio.run(self.device.get_state())
+        self.assertIsInstance(state, DeviceState)
+        self.assertIs(state.ui, self.device.ui)
+        self.assertEqual(state.encoded_ui, state.ui.encoding())
+        self.assertIs(state.screenshot, self.screenshot)
+        self.assertIsNone(state.transform)
+        self.assertIs(state.timing, self.device.last_capture)
+        encoded_ui, screenshot, ui = state
+        self.assertEqual((encoded_ui, screenshot, ui), (state.encoded_ui, state.screenshot, state.ui))
+
+    def test_downscaled_state(self):
+        state = asyncio.run(self.device.get_state(image_scale=0.5))
+        self.assertEqual(state.transform, ScreenTransform(360, 740, 720, 1480))
+        self.assertIsNot(state.screenshot, self.screenshot)
+        self.assertEqual(len(tuple(state)), 3)
+
+
+class CallDriverTest(unittest.TestCase):
+
+    def test_timeout_leaves_the_loop_responsive(self):
+        block = threading.Event()
+        device = fakes.FakeDevice(driver_timeout=0.3)
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def call():
+            ticker = asyncio.ensure_future(tick())
+            try:
+                started = time.monotonic()
+                with self.assertRaises(asyncio.TimeoutError):
+                    await device.call_driver(block.wait)
+                return time.monotonic() - started
+            finally:
+                ticker.cancel()
+
+        try:
+            elapsed = asyncio.run(call())
+        finally:
+            block.set()
+            device.stop_device()
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(elapsed, 2)
+        # The loop kept running the ticker while the call was blocked
+        self.assertGreater(len(ticks), 10)
+        self.assertLess(max(later - earlier for earlier, later in zip(ticks, ticks[1:])), 0.2)
+
+    def test_explicit_timeout(self):
+        block = threading.Event()
+        device = fakes.FakeDevice()
+        try:
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(device.call_driver(block.wait, timeout=0.1))
+            self.assertEqual(asyncio.run(device.call_driver(sum, [1, 2])), 3)
+        finally:
+            block.set()
+            device.stop_device()
+
+
+class FailedHierarchyTest(unittest.TestCase):
+
+    def get_state(self, device, **kwargs):
+        """Returns the captures get_state started, once it raised."""
+        block = threading.Event()
+        device.driver = BrokenHierarchyDriver(block)
+        captures = []
+        run = device.capture_pool.run
+
+        def record(fn, *args):
+            capture = run(fn, *args)
+            captures.append(capture)
+            return capture
+
+        device.capture_pool.run = record
+        try:
+            with self.assertRaises(RuntimeError):
+                asyncio.run(device.get_state(**kwargs))
+        finally:
+            block.set()
+            device.capture_pool.shutdown()
+        return captures
+
+    def test_android_screenshot_is_cancelled(self):
+        captures = self.get_state(AndroidDevice('com.example', driver_timeout=5))
+        self.assertTrue(captures[0].cancelled())
+        self.assertTrue(all(capture.done() for capture in captures))
+
+    def test_ios_screenshot_is_cancelled(self):
+        captures = self.get_state(IOSDevice('com.example', driver_timeout=5), use_maestro=False)
+        self.assertTrue(captures[0].cancelled())
+        self.assertTrue(all(capture.done() for capture in captures))
+
+
+if __name__ == '__main__':
+    unittest.main()
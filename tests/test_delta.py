@@ -0,0 +1,94 @@
+import unittest
+
+from cognisim.device.android.android_device import UI
+from cognisim.device.delta import StateDelta, diff_elements, encode_delta
+
+import hierarchies
+
+BANNER = {'class': 'android.widget.TextView', 'text': 'Banner', 'clickable': True,
+          'bounds': (0, 100, 1440, 200)}
+DELETE = {'class': 'android.widget.Button', 'text': 'Delete account', 'clickable': True,
+          'resource-id': 'com.example:id/delete', 'bounds': (0, 1000, 1440, 1100)}
+CANCEL = {'class': 'android.widget.Button', 'text': 'Cancel', 'clickable': True,
+          'resource-id': 'com.example:id/cancel', 'bounds': (0, 1200, 1440, 1300)}
+
+
+def encoded(leaves, previous=None):
+    ui = UI(hierarchies.android_page(leaves), previous=previous)
+    ui.encoding()
+    return ui
+
+
+class DeltaEncodingTest(unittest.TestCase):
+
+    def test_unchanged_screen(self):
+        previous = encoded([DELETE, CANCEL])
+        current = encoded([DELETE, CANCEL], previous)
+        self.assertEqual(current.delta_encoding(previous), 'unchanged: 2 elements\n')
+
+    def test_changed_added_and_removed(self):
+        previous = encoded([DELETE, CANCEL])
+        current = encoded([dict(DELETE, text='Deleting...'),
+                           {'class': 'android.widget.TextView', 'text': 'Please wait',
+                            'bounds': (0, 1400, 1440, 1500)}],
+                          previous)
+        self.assertEqual(current.delta_encoding(previous), (
+            '+   <p id=1">Please wait</p>\n'
+            '~   <button id=0 class="delete">Deleting...</button>\n'
+            '-   <button id=1 class="cancel">Cancel</button>\n'
+            'unchanged: 0 elements\n'))
+
+    def test_insertion_above_renumbers_elements(self):
+        # The banner takes id 0, which the model knew as "Delete account"
+        previous = encoded([DELETE, CANCEL])
+        current = encoded([BANNER, DELETE, CANCEL], previous)
+        self.assertEqual(current.delta_encoding(previous), (
+            '+   <p id=0">Banner</p>\n'
+            '~   <button id=1 class="delete">Delete account</button>\n'
+            '~   <button id=2 class="cancel">Cancel</button>\n'
+            'unchanged: 0 elements\n'))
+
+    def test_insertion_below_keeps_ids(self):
+        previous = encoded([BANNER, DELETE])
+        current = encoded([BANNER, DELETE, CANCEL], previous)
+        self.assertEqual(current.delta_encoding(previous), (
+            '+   <button id=2 class="cancel">Cancel</button>\n'
+            'unchanged: 2 elements\n'))
+
+    def test_removal_above_renumbers_elements(self):
+        previous = encoded([BANNER, DELETE, CANCEL])
+        current = encoded([DELETE, CANCEL], previous)
+        self.assertEqual(current.delta_encoding(previous), (
+            '~   <button id=0 class="delete">Delete account</button>\n'
+            '~   <button id=1 class="cancel">Cancel</button>\n'
+            '-   <p id=0">Banner</p>\n'
+            'unchanged: 0 elements\n'))
+
+    def test_without_shared_identities(self):
+        previous = encoded([DELETE, CANCEL])
+        current = encoded([BANNER, DELETE, CANCEL])
+        self.assertEqual(current.delta_encoding(previous), (
+            '+   <p id=0">Banner</p>\n'
+            '~   <button id=1 class="delete">Delete account</button>\n'
+            '~   <button id=2 class="cancel">Cancel</button>\n'
+            'unchanged: 0 elements\n'))
+
+
+class EncodeDeltaTest(unittest.TestCase):
+
+    def test_renumbered(self):
+        delta = StateDelta(added=[0], changed={2: 1}, unchanged={1: 0, 3: 3})
+        self.assertEqual(delta.renumbered, {1: 0})
+        self.assertEqual(
+            encode_delta(delta, ['a\n', 'b\n', 'c\n', 'd\n'], ['A\n', 'B\n', 'C\n', 'D\n']),
+            '+ A\n~ B\n~ C\nunchanged: 1 elements\n')
+
+    def test_diff_elements_pairs_duplicates_in_reading_order(self):
+        previous = encoded([DELETE, dict(DELETE, bounds=(0, 1200, 1440, 1300))])
+        current = encoded([DELETE, dict(DELETE, bounds=(0, 1200, 1440, 1300))])
+        delta = diff_elements(previous.elements, current.elements)
+        self.assertEqual(delta.unchanged, {0: 0, 1: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
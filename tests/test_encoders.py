@@ -0,0 +1,106 @@
+import json
+import re
+import unittest
+
+from cognisim.device.android.android_device import UI, element_class
+from cognisim.device.encoders import available_encoders, get_encoder
+
+import hierarchies
+
+# `<id> <tag> "<label>" .<class>` with the label and the class optional
+COMPACT_LINE = re.compile(r'^(\d+) (\S+)(?: "((?:[^"\\]|\\.)*)")?(?: \.(\S+))?$')
+UNESCAPES = {'n': '\n', 'r': '\r'}
+
+
+def unquote(label):
+    return re.sub(r'\\(.)', lambda match: UNESCAPES.get(match.group(1), match.group(1)), label)
+
+
+def expected_fields(ui):
+    """The id, tag, label and class every encoder carries, by element."""
+    fields = []
+    for _id, uiobject in ui.elements.items():
+        obj_type, text, content_desc, resource_id = ui.element_fields(uiobject)
+        fields.append({
+            'id': _id,
+            'tag': ui.class_mapping.get(obj_type, obj_type.lower()),
+            'label': text.strip() or content_desc or '',
+            'class': element_class(resource_id),
+        })
+    return fields
+
+
+class EncodersTest(unittest.TestCase):
+
+    def test_registry(self):
+        self.assertEqual(available_encoders(), ['compact', 'html', 'jsonl'])
+        self.assertIs(get_encoder('aria'), get_encoder('html'))
+        with self.assertRaises(ValueError):
+            get_encoder('yaml')
+        with self.assertRaises(ValueError):
+            UI(hierarchies.android_page([]), state_representation='yaml')
+
+    def test_aria_is_html(self):
+        for seed in range(3):
+            xml = hierarchies.android_xml(seed, 40)
+            self.assertEqual(UI(xml, state_representation='aria').encoding(),
+                             UI(xml).encoding())
+
+    def test_jsonl_round_trip(self):
+        for seed in range(5):
+            ui = UI(hierarchies.android_xml(seed, 40), state_representation='jsonl')
+            lines = ui.encoding().splitlines()
+            decoded = [json.loads(line) for line in lines]
+            expected = [{k: v for k, v in fields.items() if v != ''}
+                        for fields in expected_fields(ui)]
+            self.assertEqual(decoded, expected)
+
+    def test_compact_round_trip(self):
+        for seed in range(5):
+            ui = UI(hierarchies.android_xml(seed, 40), state_representation='compact')
+            decoded = []
+            for line in ui.encoding().splitlines():
+                match = COMPACT_LINE.match(line)
+                self.assertIsNotNone(match, line)
+                _id, tag, label, _class = match.groups()
+                decoded.append({
+                    'id': int(_id),
+                    'tag': tag,
+                    'label': unquote(label or ''),
+                    'class': _class or '',
+                })
+            self.assertEqual(decoded, expected_fields(ui))
+
+    def test_quoted_labels(self):
+        xml = hierarchies.android_page([
+            {'class': 'android.widget.TextView', 'text': 'Say "hi" \\ bye',
+             'bounds': (0, 0, 100, 100)}])
+        ui = UI(xml, state_representation='compact')
+        self.assertEqual(ui.encoding(), '0 p "Say \\"hi\\" \\\\ bye"\n')
+        ui = UI(xml, state_representation='jsonl')
+        self.assertEqual(json.loads(ui.encoding())['label'], 'Say "hi" \\ bye')
+
+    def test_line_breaks_in_labels(self):
+        xml = hierarchies.android_page([
+            {'class': 'android.widget.Button', 'content-desc': 'Line one\nLine two\r\n',
+             'bounds': (0, 0, 100, 100)},
+            {'class': 'android.widget.TextView', 'text': 'Next', 'bounds': (0, 200, 100, 300)}])
+        ui = UI(xml, state_representation='compact')
+        encoding = ui.encoding()
+        self.assertEqual(encoding, '0 button "Line one\\nLine two\\r\\n"\n1 p "Next"\n')
+        label = COMPACT_LINE.match(encoding.splitlines()[0]).group(3)
+        self.assertEqual(unquote(label), 'Line one\nLine two\r\n')
+
+    def test_same_ids_in_every_representation(self):
+        xml = hierarchies.android_xml(7, 40)
+        elements = {}
+        for name in available_encoders():
+            ui = UI(xml, state_representation=name)
+            ui.encoding()
+            elements[name] = list(ui.elements)
+        self.assertEqual(elements['compact'], elements['html'])
+        self.assertEqual(elements['jsonl'], elements['html'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from cognisim.device.android.android_device import UI
+from cognisim.device.identity import ElementIdentities, identity_keys
+
+import hierarchies
+
+
+def text_view(text, y):
+    return {'class': 'android.widget.TextView', 'text': text,
+            'resource-id': 'com.example:id/item', 'bounds': (0, y, 1440, y + 150)}
+
+
+def stable_ids(leaves, previous=None):
+    ui = UI(hierarchies.android_page(leaves), previous=previous)
+    ui.encoding()
+    return ui
+
+
+class StableIdsTest(unittest.TestCase):
+
+    def test_same_ids_for_the_same_screen(self):
+        xml = hierarchies.android_xml(7, 100)
+        first = UI(xml)
+        first.encoding()
+        second = UI(xml)
+        second.encoding()
+        self.assertEqual(first.stable_ids, second.stable_ids)
+        self.assertEqual(len(set(first.stable_ids)), len(first.stable_ids))
+
+    def test_same_ids_in_another_process(self):
+        script = ('import sys; sys.path.insert(0, {!r}); import hierarchies\n'
+                  'from cognisim.device.android.android_device import UI\n'
+                  'from loguru import logger; logger.remove()\n'
+                  'ui = UI(hierarchies.android_xml(3, 50)); ui.encoding()\n'
+                  'print(",".join(ui.stable_ids))').format(os.path.dirname(__file__))
+        outputs = set()
+        for seed in ('1', '2'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            outputs.add(subprocess.run(
+                [sys.executable, '-c', script], env=env, check=True,
+                capture_output=True, text=True).stdout)
+        self.assertEqual(len(outputs), 1)
+        ui = UI(hierarchies.android_xml(3, 50))
+        ui.encoding()
+        self.assertEqual(outputs.pop().strip().split(','), ui.stable_ids)
+
+    def test_insertion_above_keeps_ids(self):
+        previous = stable_ids([text_view('One', 1000), text_view('Two', 1200)])
+        current = stable_ids([text_view('New', 400), text_view('One', 1000),
+                              text_view('Two', 1200)], previous)
+        self.assertEqual(current.stable_ids[1:], previous.stable_ids)
+        self.assertNotIn(current.stable_ids[0], previous.stable_ids)
+
+    def test_moved_element_keeps_its_id(self):
+        button = {'class': 'android.widget.Button', 'text': 'OK',
+                  'resource-id': 'com.example:id/ok', 'bounds': (0, 1000, 1440, 1100)}
+        previous = stable_ids([text_view('One', 100), button])
+        current = stable_ids([text_view('One', 100), dict(button, bounds=(0, 2000, 1440, 2100))],
+                             previous)
+        self.assertEqual(current.stable_ids, previous.stable_ids)
+        # Without the previous snapshot the moved button has another id
+        fresh = stable_ids([text_view('One', 100), dict(button, bounds=(0, 2000, 1440, 2100))])
+        self.assertNotEqual(fresh.stable_ids[1], previous.stable_ids[1])
+
+
+class ElementIdentitiesTest(unittest.TestCase):
+
+    def test_ties_are_told_apart_by_order(self):
+        keys = identity_keys([b'path'] * 3, ['id'] * 3, ['cls'] * 3,
+                             [(0, 0, 10, 10), (0, 0, 10, 10), (500, 500, 600, 600)], 1440)
+        ids = ElementIdentities().assign(keys)
+        self.assertEqual(ids[1], ids[0] + '.1')
+        self.assertEqual(len(set(ids)), 3)
+
+    def test_keys_ignore_positions_within_a_cell(self):
+        (loose_a, exact_a), (loose_b, exact_b), (loose_c, exact_c) = identity_keys(
+            [b'path'] * 3, ['id'] * 3, ['cls'] * 3,
+            [(0, 0, 10, 10), (20, 20, 40, 40), (900, 0, 1000, 10)], 1440)
+        self.assertEqual(exact_a, exact_b)
+        self.assertEqual(loose_a, loose_c)
+        self.assertNotEqual(exact_a, exact_c)
+
+
+if __name__ == '__main__':
+    unittest.main()
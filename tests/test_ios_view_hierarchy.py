@@ -0,0 +1,73 @@
+import json
+import unittest
+
+from lxml import etree
+
+from cognisim.device.ios import ios_view_hierarchy
+
+import hierarchies
+
+FIELDS = ['obj_type', 'obj_name', 'word_sequence', 'text', 'accesible', 'ios_class',
+          'content_desc', 'visible', 'enabled', 'bounding_box', 'grid_location',
+          'dom_location', 'pointer', 'neighbors']
+
+
+def snapshot(uiobject):
+    return {field: getattr(uiobject, field) for field in FIELDS}
+
+
+def to_json(element):
+    """The JSON dump of an XCUITest xml element."""
+    node = {key: element.get(key) for key in ('type', 'name', 'label')}
+    node.update({key: int(element.get(key)) for key in ('x', 'y', 'width', 'height')})
+    node.update({key: element.get(key) == 'true' for key in ('visible', 'accessible', 'enabled')})
+    node['pointer'] = 'p%d' % id(element)
+    element.set('pointer', node['pointer'])
+    children = [to_json(child) for child in element]
+    if children:
+        node['children'] = children
+    return node
+
+
+def leaves(vh):
+    return [snapshot(leaf.uiobject) for leaf in vh.get_leaf_nodes()]
+
+
+class LoadJsonTest(unittest.TestCase):
+
+    def test_matches_xml(self):
+        for seed in range(5):
+            root = etree.fromstring(hierarchies.ios_xml(seed, 40).encode())
+            dump = json.dumps({'activity': {'root': to_json(root[0])}})
+            from_json = ios_view_hierarchy.ViewHierarchy()
+            from_json.load_json(dump)
+            from_xml = ios_view_hierarchy.ViewHierarchy()
+            from_xml.load_xml(etree.tostring(root))
+            self.assertTrue(from_xml.get_leaf_nodes())
+            self.assertEqual(leaves(from_json), leaves(from_xml))
+
+    def test_android_style_keys(self):
+        dump = json.dumps({'activity': {'root': {
+            'class': 'XCUIElementTypeApplication', 'bounds': [0, 0, 430, 932],
+            'children': [None, {
+                'class': 'XCUIElementTypeButton', 'resource-id': 'Done', 'text': 'Done',
+                'bounds': [10, 20, 110, 70], 'displayed': True, 'clickable': True,
+                'content-desc': [None], 'pointer': 'done',
+            }]}}})
+        vh = ios_view_hierarchy.ViewHierarchy()
+        vh.load_json(dump)
+        (leaf,) = vh.get_leaf_nodes()
+        uiobject = leaf.uiobject
+        self.assertEqual(uiobject.obj_type, ios_view_hierarchy.UIObjectType.BUTTON)
+        self.assertEqual((uiobject.bounding_box.x1, uiobject.bounding_box.y1,
+                          uiobject.bounding_box.x2, uiobject.bounding_box.y2), (10, 20, 110, 70))
+        self.assertEqual((uiobject.text, uiobject.obj_name, uiobject.pointer), ('Done', 'Done', 'done'))
+        self.assertEqual(uiobject.accesible, 'true')
+
+    def test_empty_content(self):
+        with self.assertRaises(ValueError):
+            ios_view_hierarchy.ViewHierarchy().load_json('null')
+
+
+if __name__ == '__main__':
+    unittest.main()
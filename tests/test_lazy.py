@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+
+from cognisim.device.lazy import Lazy, defer, lazy_attribute
+
+
+class Record(object):
+    __slots__ = ('_value',)
+    value = lazy_attribute('_value')
+
+    def __init__(self, value):
+        self._value = value
+
+
+class LazyTest(unittest.TestCase):
+
+    def test_computed_once_on_first_use(self):
+        calls = []
+        lazy = Lazy(lambda a, b: calls.append((a, b)) or a + b, 1, 2)
+        self.assertEqual(calls, [])
+        self.assertEqual(lazy.get(), 3)
+        self.assertEqual(lazy.get(), 3)
+        self.assertEqual(calls, [(1, 2)])
+
+    def test_items_share_one_computation(self):
+        calls = []
+        lazy = Lazy(lambda: calls.append(1) or ['a', 'b', 'c'])
+        self.assertEqual([lazy.item(i).get() for i in (2, 0, 1)], ['c', 'a', 'b'])
+        self.assertEqual(calls, [1])
+
+    def test_defer(self):
+        self.assertEqual(defer(False, max, 1, 2), 2)
+        self.assertEqual(defer(True, max, 1, 2).get(), 2)
+
+    def test_lazy_attribute_stores_the_value(self):
+        record = Record(Lazy(sorted, [2, 1]))
+        self.assertEqual(record.value, [1, 2])
+        self.assertEqual(record._value, [1, 2])
+        record.value = 'set'
+        self.assertEqual(record.value, 'set')
+
+    def test_concurrent_first_use(self):
+        for _ in range(20):
+            calls = []
+
+            def compute():
+                calls.append(1)
+                time.sleep(0.001)
+                return ['value']
+
+            lazy = Lazy(compute)
+            items = [lazy.item(0) for _ in range(8)]
+            start = threading.Barrier(8)
+            results = []
+            errors = []
+
+            def read(item):
+                start.wait()
+                try:
+                    results.append(item.get())
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=read, args=(item,)) for item in items]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual(results, ['value'] * 8)
+            self.assertEqual(calls, [1])
+
+    def test_computations_do_not_wait_for_each_other(self):
+        started = threading.Event()
+        fast_done = threading.Event()
+        slow = Lazy(lambda: started.set() or fast_done.wait(5))
+        fast = Lazy(lambda: 'fast')
+        results = []
+        thread = threading.Thread(target=lambda: results.append(slow.get()))
+        thread.start()
+        self.assertTrue(started.wait(5))
+        begin = time.monotonic()
+        self.assertEqual(fast.get(), 'fast')
+        self.assertLess(time.monotonic() - begin, 1)
+        fast_done.set()
+        thread.join()
+        # The slow computation saw the fast one finish while it was running
+        self.assertEqual(results, [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
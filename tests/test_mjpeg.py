@@ -0,0 +1,216 @@
+import http.server
+import io
+import socket
+import socketserver
+import threading
+import time
+import unittest
+
+import cv2
+import numpy as np
+
+from cognisim.device.mjpeg import FrameGrabber, iter_frames
+
+import fakes
+
+FRAMES = [cv2.imencode('.jpg', np.full((64, 32, 3), i * 20, np.uint8))[1].tobytes()
+          for i in range(10)]
+PNG = fakes.png(0)
+
+
+def part(frame, with_length=True):
+    head = b'--frame\r\nContent-Type: image/jpeg\r\n'
+    if with_length:
+        head += b'Content-Length: %d\r\n' % len(frame)
+    return head + b'\r\n' + frame + b'\r\n'
+
+
+class StreamHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.connections += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=--frame')
+        self.end_headers()
+        try:
+            sent = 0
+            while not server.stopped:
+                if server.frames_per_connection is not None and sent >= server.frames_per_connection:
+                    return
+                self.wfile.write(part(FRAMES[sent % len(FRAMES)], server.with_length))
+                self.wfile.flush()
+                sent += 1
+                time.sleep(0.01)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class StreamServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Streams FRAMES over and over, optionally closing every connection
+    after frames_per_connection frames."""
+    daemon_threads = True
+
+    def __init__(self, with_length=True, frames_per_connection=None):
+        super().__init__(('127.0.0.1', 0), StreamHandler)
+        self.with_length = with_length
+        self.frames_per_connection = frames_per_connection
+        self.connections = 0
+        self.stopped = False
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/stream.mjpeg' % self.server_address[1]
+
+    def close(self):
+        self.stopped = True
+        self.shutdown()
+        self.server_close()
+
+
+def unused_url():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return 'http://127.0.0.1:%d/stream.mjpeg' % s.getsockname()[1]
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class IterFramesTest(unittest.TestCase):
+
+    def stream(self, data):
+        return io.BufferedReader(io.BytesIO(data))
+
+    def test_with_content_length(self):
+        frames = iter_frames(self.stream(b''.join(part(frame) for frame in FRAMES)))
+        self.assertEqual([next(frames) for _ in FRAMES], FRAMES)
+        with self.assertRaises(EOFError):
+            next(frames)
+
+    def test_without_content_length(self):
+        frames = iter_frames(self.stream(b''.join(part(frame, False) for frame in FRAMES)))
+        self.assertEqual([next(frames) for _ in FRAMES], FRAMES)
+        with self.assertRaises(EOFError):
+            next(frames)
+
+    def test_parts_without_jpeg_are_skipped(self):
+        data = part(b'not an image') + part(FRAMES[0])
+        self.assertEqual(next(iter_frames(self.stream(data))), FRAMES[0])
+
+
+class FrameGrabberTest(unittest.TestCase):
+
+    def setUp(self):
+        self.grabber = None
+
+    def tearDown(self):
+        if self.grabber is not None:
+            self.grabber.stop(timeout=1)
+
+    def grab(self, url, **kwargs):
+        self.grabber = FrameGrabber(url, **kwargs)
+        self.grabber.start()
+        return self.grabber
+
+    def test_receives_frames(self):
+        for with_length in (True, False):
+            server = StreamServer(with_length)
+            try:
+                grabber = self.grab(server.url)
+                self.assertTrue(wait_until(lambda: grabber.connected))
+                frame = grabber.wait_for_frame(time.time(), 5)
+                self.assertIsNotNone(frame)
+                self.assertIn(frame.data, FRAMES)
+                self.assertEqual(frame.decode().shape, (64, 32, 3))
+                grabber.stop(timeout=1)
+                self.assertFalse(grabber.connected)
+                self.assertIsNone(grabber.latest())
+            finally:
+                server.close()
+
+    def test_ring_keeps_the_latest_frames(self):
+        server = StreamServer()
+        try:
+            grabber = self.grab(server.url, ring_size=3)
+            self.assertTrue(wait_until(lambda: grabber.frame_count >= 6))
+            grabber.stop(timeout=1)
+            last = grabber.frame_count
+            self.assertEqual([frame.data for frame in grabber.frames()],
+                             [FRAMES[i % len(FRAMES)] for i in range(last - 3, last)])
+        finally:
+            server.close()
+
+    def test_reconnects_when_the_server_drops(self):
+        server = StreamServer(frames_per_connection=3)
+        try:
+            grabber = self.grab(server.url)
+            self.assertTrue(wait_until(lambda: server.connections >= 3 and grabber.frame_count > 6))
+            self.assertTrue(wait_until(lambda: grabber.connected))
+        finally:
+            server.close()
+
+    def test_not_connected_when_the_server_is_down(self):
+        server = StreamServer()
+        grabber = self.grab(server.url)
+        self.assertTrue(wait_until(lambda: grabber.connected))
+        server.close()
+        self.assertTrue(wait_until(lambda: not grabber.connected))
+        self.assertIsNone(grabber.latest())
+        self.assertIsNone(grabber.wait_for_frame(time.time(), 1))
+
+
+class GrabScreenshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.device = fakes.FakeDevice(fakes.PlaybackDriver([PNG]))
+
+    def tearDown(self):
+        self.device.stop_device()
+
+    def test_stream_frame(self):
+        server = StreamServer()
+        try:
+            self.device.start_frame_grabber(server.url)
+            self.assertTrue(wait_until(lambda: self.device.frame_grabber.connected))
+            requested = time.time()
+            screenshot, started, finished = self.device._grab_screenshot()
+            self.assertIn(screenshot, FRAMES)
+            self.assertGreater(started, requested)
+            self.assertEqual(self.device.driver.screenshot_calls, 0)
+        finally:
+            server.close()
+
+    def test_falls_back_when_the_stream_goes_down(self):
+        server = StreamServer()
+        self.device.start_frame_grabber(server.url)
+        self.assertTrue(wait_until(lambda: self.device.frame_grabber.connected))
+        server.close()
+        self.assertTrue(wait_until(lambda: not self.device.frame_grabber.connected))
+        self.assertEqual(self.device._grab_screenshot()[0], PNG)
+        self.assertEqual(self.device.driver.screenshot_calls, 1)
+
+    def test_falls_back_when_the_stream_is_unreachable(self):
+        self.device.start_frame_grabber(unused_url())
+        self.assertEqual(self.device._grab_screenshot()[0], PNG)
+        self.assertEqual(self.device.driver.screenshot_calls, 1)
+
+    def test_without_stream(self):
+        self.device.stream_screenshots = False
+        self.device.start_frame_grabber(unused_url())
+        self.assertIsNone(self.device.frame_grabber)
+        self.assertEqual(self.device._grab_screenshot()[0], PNG)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import random
+import unittest
+
+import numpy as np
+
+import cognisim.utils.constants as config
+from cognisim.device import neighbors
+from cognisim.device.android import android_view_hierarchy
+from cognisim.device.ios import ios_view_hierarchy
+from cognisim.device.neighbors import build_neighbor_indices, neighbor_indices, pixel_distance
+
+import hierarchies
+
+
+def brute_force_neighbors(boxes, screen_width, screen_height):
+    """The neighbors of the original N x N distance matrices."""
+    n = len(boxes)
+    vertical = np.zeros((n, n))
+    horizontal = np.zeros((n, n))
+    for row in range(n):
+        for column in range(n):
+            if row == column:
+                continue
+            a, b = boxes[row], boxes[column]
+            horizontal[row][column] = float(pixel_distance(a[0], a[2], b[0], b[2])) / screen_width
+            vertical[row][column] = float(pixel_distance(a[1], a[3], b[1], b[3])) / screen_height
+    h_margin = config.NORM_HORIZONTAL_NEIGHBOR_MARGIN
+    v_margin = config.NORM_VERTICAL_NEIGHBOR_MARGIN
+    result = []
+    for i in range(n):
+        v, h = vertical[i], horizontal[i]
+        below = np.array([j for j in range(n) if v[j] > 0 and abs(h[j]) < h_margin], dtype=int)
+        above = np.array([j for j in range(n) if v[j] < 0 and abs(h[j]) < h_margin], dtype=int)
+        right = np.array([j for j in range(n) if h[j] > 0 and abs(v[j]) < v_margin], dtype=int)
+        left = np.array([j for j in range(n) if h[j] < 0 and abs(v[j]) < v_margin], dtype=int)
+        neighbor_dict = {}
+        if below.size:
+            neighbor_dict['top'] = int(below[np.argmin(v[below])])
+        if above.size:
+            neighbor_dict['bottom'] = int(above[np.argmax(v[above])])
+        if right.size:
+            neighbor_dict['left'] = int(right[np.argmin(h[right])])
+        if left.size:
+            neighbor_dict['right'] = int(left[np.argmax(h[left])])
+        result.append(neighbor_dict)
+    return result
+
+
+class NeighborsTest(unittest.TestCase):
+
+    def test_random_boxes_match_brute_force(self):
+        rnd = random.Random(0)
+        for _ in range(200):
+            width, height = rnd.choice([(1440, 2960), (430, 932), (200, 300)])
+            boxes = []
+            for _ in range(rnd.randint(0, 60)):
+                grid = rnd.choice([1, 2, 5, 40])
+                x1 = rnd.randint(0, width) // grid * grid
+                y1 = rnd.randint(0, height) // grid * grid
+                x2 = x1 + rnd.choice([1, 2, 3, 4, 10, rnd.randint(1, width)])
+                y2 = y1 + rnd.choice([1, 2, 3, 5, rnd.randint(1, height)])
+                boxes.append((x1, y1, x2, y2))
+                if rnd.random() < 0.1:
+                    boxes.append((x1, y1, x2, y2))
+            self.assertEqual(
+                build_neighbor_indices(np.array(boxes, dtype=np.int32).reshape(-1, 4), width, height),
+                brute_force_neighbors(boxes, width, height))
+
+    def test_single_box_matches_sweep(self):
+        rnd = random.Random(2)
+        for _ in range(50):
+            width, height = rnd.choice([(1440, 2960), (430, 932)])
+            boxes = []
+            for _ in range(rnd.randint(1, 40)):
+                x1 = rnd.randint(0, width) // 40 * 40
+                y1 = rnd.randint(0, height) // 40 * 40
+                boxes.append((x1, y1, x1 + rnd.choice([2, 40, rnd.randint(1, width)]),
+                              y1 + rnd.choice([3, 40, rnd.randint(1, height)])))
+                if rnd.random() < 0.2:
+                    boxes.append(boxes[-1])
+            options = rnd.choice([{}, dict(horizontal_margin=0.05, vertical_margin=0.02,
+                                           adjacent_threshold=10)])
+            expected = build_neighbor_indices(boxes, width, height, **options)
+            for index in range(len(boxes)):
+                self.assertEqual(neighbor_indices(index, boxes, width, height, **options),
+                                 expected[index])
+
+    def test_single_box_is_one_scan(self):
+        rnd = random.Random(3)
+        boxes = [(x, y, x + 20, y + 20) for x, y in (
+            (rnd.randint(0, 1400), rnd.randint(0, 2900)) for _ in range(500))]
+        calls = []
+
+        def counting_distance(*args):
+            calls.append(args)
+            return pixel_distance(*args)
+
+        neighbors.pixel_distance, original = counting_distance, neighbors.pixel_distance
+        try:
+            neighbor_indices(7, boxes, 1440, 2960)
+        finally:
+            neighbors.pixel_distance = original
+        self.assertLessEqual(len(calls), 4 * len(boxes))
+
+    def test_hierarchy_leaves_match_brute_force(self):
+        for seed in range(5):
+            vh = android_view_hierarchy.ViewHierarchy(
+                hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT)
+            vh.load_xml(hierarchies.android_xml(seed, 150).encode())
+            boxes = [leaf.uiobject.bounding_box for leaf in vh.get_leaf_nodes()]
+            boxes = [(b.x1, b.y1, b.x2, b.y2) for b in boxes]
+            self.assertEqual(
+                build_neighbor_indices(boxes, hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT),
+                brute_force_neighbors(boxes, hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT))
+
+    def test_scan_is_limited_to_the_cross_axis_margin(self):
+        # A long column next to a scattered field: each query of the
+        # column used to walk every box of the field below it
+        rnd = random.Random(1)
+        boxes = [(0, 10 * i, 10, 10 * i + 8) for i in range(200)]
+        boxes += [(x, y, x + 20, y + 20) for x, y in (
+            (rnd.randint(100, 1400), rnd.randint(0, 2900)) for _ in range(2000))]
+        calls = []
+
+        def counting_distance(*args):
+            calls.append(args)
+            return pixel_distance(*args)
+
+        neighbors.pixel_distance, original = counting_distance, neighbors.pixel_distance
+        try:
+            build_neighbor_indices(boxes, 1440, 2960)
+        finally:
+            neighbors.pixel_distance = original
+        self.assertLess(len(calls), 40 * len(boxes))
+
+
+class LeafNodeNeighborsTest(unittest.TestCase):
+
+    def check_leaves(self, module, xml, width, height):
+        vh = module.ViewHierarchy(width, height)
+        vh.load_xml(xml.encode())
+        leaves = vh.get_leaf_nodes()
+        elements = [leaf.element for leaf in leaves]
+        self.assertTrue(any(leaf.uiobject.neighbors for leaf in leaves))
+        for leaf in leaves:
+            # Neighbors and grid location are built by the leaf itself
+            alone = module.LeafNode(leaf.element, elements, leaf.uiobject.dom_location,
+                                    width, height)
+            self.assertEqual(alone.uiobject, leaf.uiobject)
+        first, last = leaves[0], leaves[-1]
+        box1, box2 = first.uiobject.bounding_box, last.uiobject.bounding_box
+        self.assertEqual(first.normalized_pixel_distance(last), (
+            pixel_distance(box1.x1, box1.x2, box2.x1, box2.x2) / width,
+            pixel_distance(box1.y1, box1.y2, box2.y1, box2.y2) / height))
+
+    def test_android(self):
+        for seed in range(3):
+            self.check_leaves(android_view_hierarchy, hierarchies.android_xml(seed, 60),
+                              hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT)
+
+    def test_ios(self):
+        for seed in range(3):
+            self.check_leaves(ios_view_hierarchy, hierarchies.ios_xml(seed, 60),
+                              hierarchies.IOS_WIDTH, hierarchies.IOS_HEIGHT)
+
+
+if __name__ == '__main__':
+    unittest.main()
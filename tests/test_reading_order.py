@@ -0,0 +1,59 @@
+import random
+import unittest
+
+from cognisim.device.android.android_device import UI
+from cognisim.device.geometry import GeometryTable
+
+import hierarchies
+
+
+class ReadingOrderTest(unittest.TestCase):
+
+    def test_top_to_bottom_then_left_to_right(self):
+        geometry = GeometryTable([(100, 50, 150, 80), (0, 50, 50, 80), (0, 0, 50, 40), (60, 0, 90, 40)])
+        self.assertEqual(geometry.reading_order().tolist(), [2, 3, 1, 0])
+
+    def test_stable_for_identical_bounds(self):
+        geometry = GeometryTable([(0, 0, 10, 10), (5, 5, 9, 9), (0, 0, 10, 10),
+                                  (20, 0, 30, 10), (0, 0, 10, 10)])
+        self.assertEqual(geometry.reading_order().tolist(), [0, 2, 4, 3, 1])
+
+    def test_matches_sorted(self):
+        rnd = random.Random(0)
+        for _ in range(50):
+            boxes = [(rnd.randint(0, 50), rnd.randint(0, 50), 60, 60)
+                     for _ in range(rnd.randint(0, 200))]
+            expected = sorted(range(len(boxes)), key=lambda i: (boxes[i][1], boxes[i][0]))
+            self.assertEqual(GeometryTable(boxes).reading_order().tolist(), expected)
+
+    def test_row_tolerance(self):
+        # Three slightly misaligned elements of one line, then a second line
+        geometry = GeometryTable([(100, 12, 150, 40), (0, 10, 50, 40), (200, 8, 250, 40), (0, 60, 50, 90)])
+        self.assertEqual(geometry.reading_order().tolist(), [2, 1, 0, 3])
+        self.assertEqual(geometry.reading_order(5).tolist(), [1, 0, 2, 3])
+        # A row is measured from its first box, so it does not creep down
+        geometry = GeometryTable([(40, 0, 50, 10), (20, 4, 30, 14), (0, 8, 10, 18)])
+        self.assertEqual(geometry.reading_order(5).tolist(), [1, 0, 2])
+
+    def test_encoding_ids_follow_reading_order(self):
+        ui = UI(hierarchies.android_xml(4, 80))
+        ui.encoding()
+        keys = [(uiobject.bounding_box.y1, uiobject.bounding_box.x1) for uiobject in ui.elements.values()]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_row_tolerance_of_the_ui(self):
+        xml = hierarchies.android_page([
+            {'class': 'android.widget.TextView', 'text': 'Right', 'bounds': (800, 98, 1400, 200)},
+            {'class': 'android.widget.TextView', 'text': 'Left', 'bounds': (0, 100, 700, 200)},
+        ])
+        ui = UI(xml)
+        ui.encoding()
+        self.assertEqual([uiobject.text for uiobject in ui.elements.values()], ['Right', 'Left'])
+        ui = UI(xml)
+        ui.reading_row_tolerance = 4
+        ui.encoding()
+        self.assertEqual([uiobject.text for uiobject in ui.elements.values()], ['Left', 'Right'])
+
+
+if __name__ == '__main__':
+    unittest.main()
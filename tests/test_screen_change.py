@@ -0,0 +1,86 @@
+import unittest
+
+import cv2
+import numpy as np
+
+import cognisim.utils.constants as config
+from cognisim.device.screen_change import ScreenChangeDetector
+
+# 20 x 20 pixel blocks with the default 32 x 64 grid
+WIDTH, HEIGHT = 640, 1280
+
+
+def screen():
+    rnd = np.random.RandomState(0)
+    img = np.full((HEIGHT, WIDTH, 3), 240, np.uint8)
+    for _ in range(30):
+        x, y = rnd.randint(0, WIDTH - 100), rnd.randint(0, HEIGHT - 60)
+        color = tuple(int(c) for c in rnd.randint(0, 200, 3))
+        cv2.rectangle(img, (x, y), (x + 100, y + 60), color, -1)
+    return img
+
+
+class ScreenChangeDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = ScreenChangeDetector(config.SCREEN_CHANGE_THRESHOLD,
+                                             [(0.0, 0.0, 1.0, 0.05)])
+        self.img = screen()
+
+    def compare(self, changed_img, detector=None):
+        detector = detector or self.detector
+        return detector.difference(detector.signature(self.img), detector.signature(changed_img))
+
+    def test_same_screen(self):
+        self.assertEqual(self.compare(self.img.copy()), 0.0)
+
+    def test_change_in_excluded_region_is_ignored(self):
+        img = self.img.copy()
+        # The status bar clock, straddling the edge of the region
+        cv2.rectangle(img, (500, 0), (620, 60), (0, 0, 0), -1)
+        self.assertEqual(self.compare(img), 0.0)
+        self.assertGreater(self.compare(img, ScreenChangeDetector()), config.SCREEN_CHANGE_THRESHOLD)
+
+    def test_small_change_is_below_threshold(self):
+        img = self.img.copy()
+        img[700:702, 300:302] = 0
+        self.assertFalse(self.detector.changed(self.detector.signature(self.img),
+                                               self.detector.signature(img)))
+
+    def test_checkbox_sized_change_is_above_threshold(self):
+        img = self.img.copy()
+        # One block of a large screen, not diluted by the rest of it
+        img[700:720, 300:320] = 0
+        self.assertTrue(self.detector.changed(self.detector.signature(self.img),
+                                              self.detector.signature(img)))
+
+    def test_thin_change_of_png_screenshot(self):
+        img = self.img.copy()
+        # A one pixel line, e.g. a text cursor, in a block
+        img[703, 300:320] = 255 - img[703, 300:320]
+        before = self.detector.signature(cv2.imencode('.png', self.img)[1].tobytes())
+        after = self.detector.signature(cv2.imencode('.png', img)[1].tobytes())
+        self.assertTrue(self.detector.changed(before, after))
+
+    def test_threshold(self):
+        img = self.img.copy()
+        img[700:720, 300:320] = np.clip(img[700:720, 300:320].astype(int) + 10, 0, 255)
+        self.assertGreater(self.compare(img), 4.0)
+        self.assertFalse(ScreenChangeDetector(threshold=20.0).changed(
+            self.detector.signature(self.img), self.detector.signature(img)))
+
+    def test_everything_excluded(self):
+        detector = ScreenChangeDetector(excluded_regions=[(0.0, 0.0, 1.0, 1.0)])
+        self.assertTrue(np.isnan(detector.signature(self.img)).all())
+        self.assertEqual(self.compare(255 - self.img, detector), 0.0)
+
+    def test_encoded_screenshots_match_arrays(self):
+        signature = self.detector.signature(self.img)
+        for extension in ('.png', '.jpg'):
+            encoded = cv2.imencode(extension, self.img)[1].tobytes()
+            self.assertFalse(self.detector.changed(signature, self.detector.signature(encoded)),
+                             extension)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+from cognisim.device import set_of_mark
+from cognisim.device.android.android_device import AndroidDevice
+from cognisim.device.ios.ios_device import IOSDevice
+from cognisim.device.screen_transform import ScreenTransform, downscale_screenshot
+
+
+def screenshot(extension, width=400, height=800, params=()):
+    img = np.zeros((height, width, 3), np.uint8)
+    cv2.rectangle(img, (40, 80), (200, 300), (0, 128, 255), -1)
+    return cv2.imencode(extension, img, list(params))[1].tobytes()
+
+
+class FakeDriver(object):
+
+    def __init__(self, width, height):
+        self.window_size = {'width': width, 'height': height}
+
+    def get_window_size(self):
+        return self.window_size
+
+
+class DownscaleScreenshotTest(unittest.TestCase):
+
+    def test_jpeg_stays_jpeg(self):
+        data, transform = downscale_screenshot(screenshot('.jpg'), (200, 400), image_scale=0.5)
+        self.assertEqual(set_of_mark.detect_format(data), 'jpeg')
+        self.assertEqual(set_of_mark.decode_image(data).shape, (400, 200, 3))
+        self.assertEqual(transform, ScreenTransform(200, 400, 200, 400))
+
+    def test_png_stays_png(self):
+        data, transform = downscale_screenshot(screenshot('.png'), (200, 400), image_size=(100, 100))
+        self.assertEqual(set_of_mark.detect_format(data), 'png')
+        self.assertEqual((transform.image_width, transform.image_height), (50, 100))
+
+    def test_explicit_format(self):
+        data, _ = downscale_screenshot(screenshot('.jpg'), (200, 400), image_scale=0.5,
+                                       image_format='png')
+        self.assertEqual(set_of_mark.detect_format(data), 'png')
+        data, _ = downscale_screenshot(screenshot('.png'), (200, 400), image_scale=0.5,
+                                       image_format='webp', quality=80)
+        self.assertEqual(set_of_mark.detect_format(data), 'webp')
+
+    def test_not_downscaled(self):
+        original = screenshot('.jpg')
+        data, transform = downscale_screenshot(original, (200, 400), image_scale=2.0)
+        self.assertIs(data, original)
+        self.assertEqual(transform, ScreenTransform(400, 800, 200, 400))
+
+    def test_not_decoded_when_not_downscaled(self):
+        with mock.patch.object(set_of_mark, 'decode_image', side_effect=AssertionError):
+            for extension in ('.png', '.jpg'):
+                original = screenshot(extension)
+                data, transform = downscale_screenshot(original, (200, 400))
+                self.assertIs(data, original)
+                self.assertEqual(transform, ScreenTransform(400, 800, 200, 400))
+                data, _ = downscale_screenshot(original, (200, 400), image_size=(1000, 1000))
+                self.assertIs(data, original)
+
+    def test_device_size_defaults_to_the_screenshot(self):
+        _, transform = downscale_screenshot(screenshot('.png'), image_scale=0.5)
+        self.assertEqual(transform, ScreenTransform(200, 400, 400, 800))
+
+    def test_image_dimensions(self):
+        for extension, params in (('.png', ()), ('.jpg', ()), ('.webp', ()),
+                                  ('.jpg', (cv2.IMWRITE_JPEG_PROGRESSIVE, 1))):
+            self.assertEqual(set_of_mark.image_dimensions(
+                screenshot(extension, 123, 457, params)), (123, 457), extension)
+        self.assertEqual(set_of_mark.image_dimensions(np.zeros((457, 123, 3), np.uint8)),
+                         (123, 457))
+
+    def test_detect_format(self):
+        self.assertEqual(set_of_mark.detect_format(screenshot('.png')), 'png')
+        self.assertEqual(set_of_mark.detect_format(screenshot('.jpg')), 'jpeg')
+        self.assertEqual(set_of_mark.detect_format(screenshot('.webp')), 'webp')
+        self.assertIsNone(set_of_mark.detect_format(b'GIF89a'))
+
+
+class DeviceTransformTest(unittest.TestCase):
+
+    def test_android_taps_in_screenshot_pixels(self):
+        # The window leaves out the 132 pixel navigation bar
+        device = AndroidDevice('com.example')
+        device.driver = FakeDriver(1080, 2208)
+        _, transform = device.scale_screenshot(screenshot('.png', 1080, 2340), image_scale=0.5)
+        self.assertEqual(transform, ScreenTransform(540, 1170, 1080, 2340))
+        self.assertEqual(transform.to_device(270, 1100), (540, 2200))
+
+    def test_ios_taps_in_points(self):
+        device = IOSDevice('com.example')
+        device.driver = FakeDriver(430, 932)
+        _, transform = device.scale_screenshot(screenshot('.png', 1290, 2796), image_scale=0.5)
+        self.assertEqual(transform, ScreenTransform(645, 1398, 430, 932))
+        self.assertEqual(transform.to_device(645 // 2, 1398 // 2), (215, 466))
+
+
+class ScreenTransformTest(unittest.TestCase):
+
+    def test_to_device_and_back(self):
+        transform = ScreenTransform(360, 780, 1080, 2340)
+        self.assertEqual(transform.to_device(100, 200), (300, 600))
+        self.assertEqual(transform.to_image(300, 600), (100, 200))
+        self.assertEqual(transform.to_device(-5, 1000), (0, 2339))
+
+    def test_boxes_to_image(self):
+        transform = ScreenTransform(360, 780, 1080, 2340)
+        boxes = transform.boxes_to_image([[0, 0, 1080, 2340], [30, 60, 90, 120]])
+        self.assertEqual(boxes.tolist(), [[0, 0, 360, 780], [10, 20, 30, 40]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from cognisim.device import set_of_mark
+from cognisim.device.android.android_device import UI
+from cognisim.device.screen_transform import ScreenTransform
+
+import hierarchies
+
+
+def previous_set_of_mark(ui, img, position='top-left'):
+    """The set-of-mark renderer `set_of_mark.render` replaced, without the
+    decoding and encoding of the image."""
+    img = img.copy()
+    dropped_ids = set(getattr(ui, 'dropped_ids', ()))
+    for element_id in ui.elements:
+        if element_id in dropped_ids:
+            continue
+        box = ui.elements[element_id].bounding_box
+        bounds = [box.x1, box.y1, box.x2, box.y2]
+        area = (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+        if area > 3000:
+            cv2.rectangle(img, (int(bounds[0]), int(bounds[1])),
+                          (int(bounds[2]), int(bounds[3])), (0, 0, 255), 5)
+            text = str(element_id)
+            font = cv2.FONT_HERSHEY_SIMPLEX
+            text_width, text_height = cv2.getTextSize(text, font, 2, 2)[0]
+            if position == 'top-left':
+                text_x = int(bounds[0])
+                text_y = int(bounds[1]) + text_height
+            else:
+                text_x = (int(bounds[0]) + int(bounds[2])) // 2 - text_width // 2
+                text_y = (int(bounds[1]) + int(bounds[3])) // 2 + text_height // 2
+            cv2.rectangle(img, (text_x, text_y - text_height),
+                          (text_x + text_width, text_y), (0, 0, 0), thickness=cv2.FILLED)
+            cv2.putText(img, text, (text_x, text_y), font, 2, (255, 255, 255), 4)
+    return img
+
+
+def decode(data):
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class SetOfMarkTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # A smooth but uneven background, for the blending of the labels
+        rng = np.random.default_rng(0)
+        noise = rng.integers(0, 255, (74, 36, 3), dtype=np.uint8)
+        cls.img = cv2.resize(noise, (hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT),
+                             interpolation=cv2.INTER_LINEAR)
+        cls.png = cv2.imencode('.png', cls.img)[1].tobytes()
+
+    def test_pixel_identical_to_previous_renderer(self):
+        for seed, budget, position in ((0, None, 'top-left'), (1, 3000, 'center')):
+            ui = UI(hierarchies.android_xml(seed, 200))
+            ui.encoding(budget=budget)
+            rendered = set_of_mark.render(ui, self.png, position)
+            self.assertEqual(rendered.format, 'png')
+            np.testing.assert_array_equal(decode(rendered.data),
+                                          previous_set_of_mark(ui, self.img, position))
+
+    def test_array_input_is_left_unchanged(self):
+        ui = UI(hierarchies.android_xml(2, 50))
+        ui.encoding()
+        img = self.img.copy()
+        rendered = set_of_mark.render(ui, img)
+        np.testing.assert_array_equal(img, self.img)
+        np.testing.assert_array_equal(decode(rendered.data), previous_set_of_mark(ui, self.img))
+
+    def test_formats(self):
+        ui = UI(hierarchies.android_xml(3, 50))
+        ui.encoding()
+        for image_format, mime_type, magic in (('png', 'image/png', b'\x89PNG'),
+                                               ('jpeg', 'image/jpeg', b'\xff\xd8'),
+                                               ('webp', 'image/webp', b'RIFF')):
+            rendered = set_of_mark.render(ui, self.png, image_format=image_format, scale=0.5)
+            self.assertEqual(rendered.mime_type, mime_type)
+            self.assertTrue(rendered.data.startswith(magic))
+            self.assertEqual(decode(rendered.data).shape[:2],
+                             (hierarchies.ANDROID_HEIGHT // 2, hierarchies.ANDROID_WIDTH // 2))
+            self.assertTrue(rendered.data_url().startswith('data:' + mime_type + ';base64,'))
+        with self.assertRaises(ValueError):
+            set_of_mark.encode_image(self.img, 'gif')
+
+    def test_transform_maps_boxes_onto_the_image(self):
+        ui = UI(hierarchies.android_xml(4, 50))
+        ui.encoding()
+        half = cv2.resize(self.img, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)
+        transform = ScreenTransform(half.shape[1], half.shape[0],
+                                    hierarchies.ANDROID_WIDTH, hierarchies.ANDROID_HEIGHT)
+        rendered = set_of_mark.render(ui, half, transform=transform)
+        ids, boxes = set_of_mark.labelled_elements(ui)
+        expected = half.copy()
+        set_of_mark.draw_set_of_mark(expected, ids, transform.boxes_to_image(boxes))
+        np.testing.assert_array_equal(decode(rendered.data), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import math
+import random
+import unittest
+
+from cognisim.device.geometry import GeometryTable
+from cognisim.device.spatial_index import SpatialIndex
+
+
+def random_boxes(rnd, n):
+    boxes = []
+    for _ in range(n):
+        x1, y1 = rnd.randint(-50, 1400), rnd.randint(-50, 2900)
+        boxes.append((x1, y1,
+                      x1 + rnd.randint(0, rnd.choice([30, 300, 1500])),
+                      y1 + rnd.randint(0, rnd.choice([30, 300, 3000]))))
+    return boxes
+
+
+def distance(x, y, box):
+    x1, y1, x2, y2 = box
+    return math.hypot(max(x1 - x, x - x2, 0), max(y1 - y, y - y2, 0))
+
+
+class SpatialIndexTest(unittest.TestCase):
+    """Compares every query with a scan of all boxes."""
+
+    def setUp(self):
+        self.rnd = random.Random(0)
+        self.cases = []
+        for _ in range(100):
+            boxes = random_boxes(self.rnd, self.rnd.randint(0, 120))
+            index = SpatialIndex(GeometryTable(boxes),
+                                 cell_size=self.rnd.choice([None, 7, 100, 5000]))
+            self.cases.append((boxes, index))
+
+    def points(self):
+        for _ in range(10):
+            yield self.rnd.randint(-200, 1600), self.rnd.randint(-200, 3100)
+
+    def test_elements_at(self):
+        for boxes, index in self.cases:
+            for x, y in self.points():
+                hits = [i for i, (x1, y1, x2, y2) in enumerate(boxes)
+                        if x1 <= x <= x2 and y1 <= y <= y2]
+                self.assertEqual(index.elements_at(x, y), hits)
+                smallest = min(hits, key=lambda i: (
+                    (boxes[i][2] - boxes[i][0]) * (boxes[i][3] - boxes[i][1]), i), default=None)
+                self.assertEqual(index.element_at(x, y), smallest)
+
+    def test_elements_in_rect(self):
+        for boxes, index in self.cases:
+            for x1, y1 in self.points():
+                x2, y2 = x1 + self.rnd.randint(0, 600), y1 + self.rnd.randint(0, 600)
+                self.assertEqual(
+                    index.elements_in_rect(x1, y1, x2, y2),
+                    [i for i, (a, b, c, d) in enumerate(boxes)
+                     if a <= x2 and x1 <= c and b <= y2 and y1 <= d])
+                self.assertEqual(
+                    index.elements_in_rect(x1, y1, x2, y2, contained=True),
+                    [i for i, (a, b, c, d) in enumerate(boxes)
+                     if x1 <= a and c <= x2 and y1 <= b and d <= y2])
+
+    def test_nearest(self):
+        for boxes, index in self.cases:
+            for x, y in self.points():
+                k = self.rnd.randint(1, 5)
+                closest = sorted((distance(x, y, box), i) for i, box in enumerate(boxes))[:k]
+                self.assertEqual(index.nearest(x, y, k), [i for _, i in closest])
+                for max_distance in (10, 200):
+                    self.assertEqual(
+                        index.nearest(x, y, k, max_distance=max_distance),
+                        [i for d, i in closest if d <= max_distance])
+
+    def test_empty(self):
+        index = SpatialIndex(GeometryTable())
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.elements_at(0, 0), [])
+        self.assertIsNone(index.element_at(0, 0))
+        self.assertEqual(index.nearest(0, 0, 3), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
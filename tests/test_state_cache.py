@@ -0,0 +1,72 @@
+import unittest
+
+from cognisim.device.state_cache import StateCache, hash_page_source
+
+
+def build(page_source):
+    return 'encoded ' + page_source, object()
+
+
+class StateCacheTest(unittest.TestCase):
+
+    def test_hit_returns_the_cached_state(self):
+        cache = StateCache()
+        first = cache.get_or_build('<a/>', build)
+        self.assertIs(cache.get_or_build('<a/>', build), first)
+        self.assertIs(cache.get_or_build(b'<a/>', build), first)
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 1, 'entries': 1,
+                                         'bytes': len('<a/>') + len('encoded <a/>')})
+
+    def test_miss_builds_the_state(self):
+        cache = StateCache()
+        built = []
+        cache.get_or_build('<a/>', lambda source: built.append(source) or build(source))
+        state = cache.get_or_build('<b/>', lambda source: built.append(source) or build(source))
+        self.assertEqual(built, ['<a/>', '<b/>'])
+        self.assertEqual(state[0], 'encoded <b/>')
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 2, 2))
+
+    def test_evicts_least_recently_used_entry(self):
+        cache = StateCache(max_entries=2)
+        a = cache.get_or_build('<a/>', build)
+        cache.get_or_build('<b/>', build)
+        # Touching a makes b the least recently used
+        cache.get_or_build('<a/>', build)
+        cache.get_or_build('<c/>', build)
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get_or_build('<a/>', build), a)
+        misses = cache.misses
+        cache.get_or_build('<b/>', build)
+        self.assertEqual(cache.misses, misses + 1)
+
+    def test_evicts_by_size(self):
+        cache = StateCache(max_bytes=100)
+        cache.get_or_build('a' * 30, build)
+        cache.get_or_build('b' * 30, build)
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.size_bytes, 100)
+        # States larger than the whole cache are not kept
+        cache.get_or_build('c' * 60, build)
+        self.assertEqual(len(cache), 1)
+
+    def test_zero_entries_disables_the_cache(self):
+        cache = StateCache(max_entries=0)
+        cache.get_or_build('<a/>', build)
+        cache.get_or_build('<a/>', build)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 2, 0))
+
+    def test_clear(self):
+        cache = StateCache()
+        cache.get_or_build('<a/>', build)
+        cache.get_or_build('<a/>', build)
+        cache.clear()
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0, 'entries': 0, 'bytes': 0})
+
+    def test_hash_page_source(self):
+        self.assertEqual(hash_page_source('<a/>'), hash_page_source(b'<a/>'))
+        self.assertNotEqual(hash_page_source('<a/>'), hash_page_source('<b/>'))
+        self.assertEqual(len(hash_page_source('')), 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import random
+import unittest
+
+import attr
+from lxml import etree
+
+from cognisim.device.android import android_device
+from cognisim.device.ios import ios_view_hierarchy
+
+import hierarchies
+
+IOS_BACK = ('<AppiumAUT><XCUIElementTypeApplication type="XCUIElementTypeApplication" '
+            'x="0" y="0" width="430" height="932"><XCUIElementTypeButton '
+            'type="XCUIElementTypeButton" name="Back" enabled="true" visible="true" '
+            'accessible="true" x="0" y="50" width="80" height="40"/>'
+            '</XCUIElementTypeApplication></AppiumAUT>')
+
+
+def snapshot(uiobject):
+    """Every field of a UI object, with the deferred ones computed."""
+    return {field.name.lstrip('_'): getattr(uiobject, field.name.lstrip('_'))
+            for field in attr.fields(type(uiobject))}
+
+
+def mutate_android(xml, seed):
+    """Returns the next snapshot of a screen: a few leaves change text,
+    swap text and description, move, or are removed."""
+    rnd = random.Random(seed)
+    root = etree.fromstring(xml.encode())
+    for element in list(root.iter('node'))[1:]:
+        if len(element) or rnd.random() > 0.3:
+            continue
+        change = rnd.randrange(4)
+        if change == 0:
+            element.set('text', element.get('text') + ' more')
+        elif change == 1:
+            text = element.get('text')
+            element.set('text', element.get('content-desc'))
+            element.set('content-desc', text)
+        elif change == 2:
+            element.set('bounds', '[0,0][40,40]')
+        else:
+            element.getparent().remove(element)
+    return etree.tostring(root, encoding='unicode')
+
+
+def without_empty_names(root):
+    """Leaves out empty names and labels, like XCUITest dumps do."""
+    for element in root.iter():
+        for key in ('name', 'label'):
+            if element.get(key) == '':
+                del element.attrib[key]
+    return root
+
+
+def rename_attribute(element, old, new):
+    """Renames an attribute in place, keeping the attribute order."""
+    items = [(new if key == old else key, value) for key, value in element.items()]
+    element.attrib.clear()
+    for key, value in items:
+        element.set(key, value)
+
+
+def mutate_ios(xml, seed):
+    """Like mutate_android, moving values between the name and label of
+    XCUITest dumps."""
+    rnd = random.Random(seed)
+    root = etree.fromstring(xml.encode())
+    for element in list(root.iter())[2:]:
+        if len(element) or rnd.random() > 0.3:
+            continue
+        change = rnd.randrange(3)
+        if change == 0 and element.get('name') and element.get('label') is None:
+            rename_attribute(element, 'name', 'label')
+        elif change == 1 and element.get('label') and element.get('name') is None:
+            rename_attribute(element, 'label', 'name')
+        elif change == 2:
+            element.set('label', (element.get('label') or '') + ' more')
+    return etree.tostring(root, encoding='unicode')
+
+
+class SubtreeReuseTest(unittest.TestCase):
+
+    def assert_reuse_matches_fresh(self, ui_class, xml, next_xml):
+        previous = ui_class(xml)
+        previous.encoding()
+        reused = ui_class(next_xml, previous=previous)
+        fresh = ui_class(next_xml)
+        self.assertEqual(reused.encoding(), fresh.encoding())
+        self.assertEqual([snapshot(uiobject) for uiobject in reused.elements.values()],
+                         [snapshot(uiobject) for uiobject in fresh.elements.values()])
+        # Unchanged leaves were reused
+        self.assertTrue(set(previous.leaf_records) & set(reused.leaf_records))
+
+    def test_android(self):
+        for seed in range(5):
+            xml = hierarchies.android_xml(seed, 60)
+            self.assert_reuse_matches_fresh(
+                android_device.UI, xml, mutate_android(xml, seed))
+
+    def test_ios(self):
+        for seed in range(5):
+            xml = etree.tostring(without_empty_names(etree.fromstring(
+                hierarchies.ios_xml(seed, 60).encode())), encoding='unicode')
+            self.assert_reuse_matches_fresh(
+                ios_view_hierarchy.UI, xml, mutate_ios(xml, seed))
+
+    def test_ios_name_becomes_label(self):
+        # The same values under other attribute names
+        previous = ios_view_hierarchy.UI(IOS_BACK)
+        previous.encoding()
+        next_xml = IOS_BACK.replace('name="Back"', 'label="Back"')
+        self.assertEqual(ios_view_hierarchy.UI(next_xml, previous=previous).encoding(),
+                         '<html>\n<button id="0">Back</button>\n</html>')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import json
+import unittest
+
+from lxml import etree
+
+from cognisim.device.traversal import walk_json, walk_tree
+
+import hierarchies
+
+
+def recursive_locations(root):
+    """[depth, preorder, postorder] and leaf status of every element, in
+    preorder, computed with the recursive walks `walk_tree` replaces."""
+    preorder = []
+    postorder = {}
+
+    def visit(element, depth):
+        preorder.append((element, depth))
+        for child in element:
+            visit(child, depth + 1)
+        postorder[element] = len(postorder)
+
+    visit(root, 0)
+    return [([depth, i, postorder[element]],
+             not any(isinstance(child.tag, str) for child in element))
+            for i, (element, depth) in enumerate(preorder)]
+
+
+def to_json(element):
+    node = dict(element.attrib)
+    children = [to_json(child) for child in element if isinstance(child.tag, str)]
+    if children:
+        node['children'] = children
+    return node
+
+
+class WalkTreeTest(unittest.TestCase):
+
+    def test_matches_recursive_walk(self):
+        for seed in range(5):
+            root = etree.fromstring(hierarchies.android_xml(seed, 80).encode())
+            nodes = walk_tree(root)
+            self.assertEqual([(node.dom_location, node.is_leaf) for node in nodes],
+                             recursive_locations(root))
+            for node in nodes[1:]:
+                self.assertIs(node.parent.element, node.element.getparent())
+
+    def test_comments_count_but_are_neither_children_nor_leaves(self):
+        root = etree.fromstring('<a><b><!-- note --></b><c/></a>')
+        nodes = walk_tree(root)
+        self.assertEqual([node.dom_location for node in nodes],
+                         [[0, 0, 3], [1, 1, 1], [2, 2, 0], [1, 3, 2]])
+        self.assertEqual([node.is_leaf for node in nodes], [False, True, False, True])
+
+    def test_deep_tree_does_not_recurse(self):
+        depth = 5000
+        root = element = etree.Element('n')
+        for _ in range(depth - 1):
+            element = etree.SubElement(element, 'n')
+        nodes = walk_tree(root)
+        self.assertEqual(len(nodes), depth)
+        self.assertEqual(nodes[-1].dom_location, [depth - 1, depth - 1, 0])
+        self.assertEqual([node.is_leaf for node in nodes].count(True), 1)
+
+    def test_inherit(self):
+        root = etree.fromstring('<a v="1"><b v="2"><c v="3"/></b><d v="4"/></a>')
+        nodes = walk_tree(root, lambda inherited, element: (inherited or '') + element.get('v'))
+        self.assertEqual([node.inherited for node in nodes], [None, '1', '12', '1'])
+
+
+class WalkJsonTest(unittest.TestCase):
+
+    def test_matches_walk_tree(self):
+        for seed in range(5):
+            root = etree.fromstring(hierarchies.android_xml(seed, 80).encode())
+            tree_nodes = walk_tree(root)
+            json_nodes = walk_json(json.loads(json.dumps(to_json(root))))
+            self.assertEqual([(node.dom_location, node.is_leaf) for node in json_nodes],
+                             [(node.dom_location, node.is_leaf) for node in tree_nodes])
+
+    def test_null_children_are_skipped(self):
+        nodes = walk_json({'children': [None, {'children': [None]}, {'text': ''}]})
+        self.assertEqual([(node.dom_location, node.is_leaf) for node in nodes],
+                         [([0, 0, 2], False), ([1, 1, 0], True), ([1, 2, 1], True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
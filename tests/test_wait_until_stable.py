@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+import cognisim.utils.constants as config
+
+import fakes
+
+SAME = fakes.png(0)
+OTHER = fakes.png(100)
+
+_sleep = asyncio.sleep
+
+
+class FakeClock(object):
+    """Time of the event loop, advanced by the sleeps of wait_until_stable
+    and by every driver call."""
+
+    def __init__(self, call_duration=0.01):
+        self.now = 0.0
+        self.call_duration = call_duration
+        self.sleeps = []
+        self.calls = []
+
+    def time(self):
+        return self.now
+
+    def on_call(self, name):
+        self.now += self.call_duration
+        self.calls.append((name, self.now))
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+        await _sleep(0)
+
+
+class WaitUntilStableTest(unittest.TestCase):
+
+    def run_wait(self, screenshots, page_sources=(), **kwargs):
+        """Returns the result of wait_until_stable and the FakeClock."""
+        clock = FakeClock()
+        driver = fakes.PlaybackDriver(screenshots, page_sources, on_call=clock.on_call)
+        device = fakes.FakeDevice(driver)
+
+        async def wait():
+            loop = asyncio.get_running_loop()
+            with mock.patch.object(loop, 'time', clock.time), \
+                    mock.patch('asyncio.sleep', clock.sleep):
+                return await device.wait_until_stable(**kwargs)
+
+        try:
+            return asyncio.run(wait()), clock
+        finally:
+            device.stop_device()
+
+    def test_stable_screen(self):
+        stable, clock = self.run_wait([SAME], min_stable_ms=300)
+        self.assertTrue(stable)
+        self.assertGreaterEqual(clock.now, 0.3)
+        # Woken up at the end of the stable period, which starts with the
+        # first screenshot, not an interval later
+        self.assertAlmostEqual(clock.now, 0.3 + 2 * clock.call_duration)
+
+    def test_polling_slows_down_while_stable(self):
+        _, clock = self.run_wait([SAME], min_stable_ms=2000)
+        self.assertEqual(clock.sleeps[0], config.STABLE_POLL_MIN_INTERVAL)
+        self.assertEqual(clock.sleeps[:4], sorted(clock.sleeps[:4]))
+        self.assertGreater(clock.sleeps[3], clock.sleeps[0])
+        self.assertLessEqual(max(clock.sleeps), config.STABLE_POLL_MAX_INTERVAL)
+
+    def test_change_restarts_the_stable_period(self):
+        screenshots = [SAME] * 4 + [OTHER, SAME, OTHER, SAME]
+        stable, clock = self.run_wait(screenshots, min_stable_ms=300)
+        self.assertTrue(stable)
+        last_change = clock.calls[len(screenshots) - 1][1]
+        self.assertGreaterEqual(clock.now - last_change, 0.3)
+        # Polling is back to the shortest interval after every change
+        changes = [index for index in range(1, len(screenshots))
+                   if screenshots[index] != screenshots[index - 1]]
+        for index in changes:
+            self.assertEqual(clock.sleeps[index], config.STABLE_POLL_MIN_INTERVAL)
+
+    def test_timeout(self):
+        stable, clock = self.run_wait([SAME, OTHER] * 500, timeout=2, min_stable_ms=300)
+        self.assertFalse(stable)
+        self.assertGreaterEqual(clock.now, 2)
+        self.assertLess(clock.now, 2 + 2 * clock.call_duration)
+
+    def test_hierarchy_must_match_over_two_periods(self):
+        stable, clock = self.run_wait(
+            [SAME], ['<a/>', '<b/>', '<b/>'], min_stable_ms=300, check_hierarchy=True)
+        self.assertTrue(stable)
+        self.assertEqual([name for name, _ in clock.calls].count('page_source'), 3)
+        self.assertGreaterEqual(clock.now, 0.9)
+
+    def test_hierarchy_never_stable(self):
+        stable, clock = self.run_wait(
+            [SAME], ['<a%d/>' % i for i in range(100)], timeout=2, min_stable_ms=300,
+            check_hierarchy=True)
+        self.assertFalse(stable)
+        self.assertLess(clock.now, 2 + 2 * clock.call_duration)
+
+    def test_page_source_is_bounded_by_the_deadline(self):
+        # Real time: the page source blocks until the test is over
+        block = threading.Event()
+        device = fakes.FakeDevice(fakes.PlaybackDriver([SAME], block=block))
+        try:
+            started = time.monotonic()
+            stable = asyncio.run(device.wait_until_stable(
+                timeout=0.5, min_stable_ms=100, check_hierarchy=True))
+            self.assertFalse(stable)
+            self.assertLess(time.monotonic() - started, 2)
+        finally:
+            block.set()
+            device.stop_device()
+
+
+if __name__ == '__main__':
+    unittest.main()